@@ -1,33 +1,358 @@
 import os
+import gzip
 import json
+import math
 import time
+# Cold-start clock: everything below, imports included, counts
+APP_LOAD_STARTED = time.perf_counter()
 import asyncio
-from flask import Flask, jsonify, request, send_from_directory
+from datetime import datetime, timezone
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
 import subprocess
 import threading
 from python_server.storage import storage
 from python_server.gemini_service import (
-    generate_study_recommendations,
     generate_flashcards_from_notes,
     enhance_notes,
-    generate_concept_map
+    generate_flashcards_for_concepts,
+    stream_flashcards_from_notes,
+    stream_concept_map
+)
+from python_server.metrics import metrics
+from python_server.llm_governor import llm_user
+from python_server.deadline import set_deadline, remaining
+from python_server.jobs import jobs, QueueFull, PRIORITY_INTERACTIVE
+from python_server.recommendations import recommendation_store
+from python_server.learner_profile import learner_profiles
+from python_server.planner import study_planner
+from python_server.dedup import dedup_index, FLASHCARD_DEDUP
+from python_server.concept_graph import concept_graphs, concept_map_for, expand_node, CONCEPT_EXPAND_COUNT
+from python_server.retrieval import note_index, select_relevant
+from python_server.static_assets import static_assets
+from python_server.responses import FastJSONProvider, StreamCompressor, choose_encoding, compress_response
+from python_server.batch import batch_dispatcher, parse_batch, BatchError
+from python_server.transfer import export_lines, import_lines
+from python_server.decks import is_shared_id, ProgressOverlay
+from python_server.bulkhead import bulkheads, BULKHEADS_ENABLED
+from python_server.rate_limit import rate_limiter, RATE_LIMITS_ENABLED
+from python_server.tracing import finish_trace, instrument, start_trace
+from python_server.idempotency import (
+    idempotency_store, fingerprint, IDEMPOTENCY_KEY_MAX_LENGTH, IDEMPOTENCY_WAIT_SECONDS
 )
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__, static_folder='client/dist', static_url_path='/')
+# Time budget for AI work in a request; clients may ask for less with an
+# X-Request-Timeout header (seconds)
+AI_REQUEST_TIMEOUT_SECONDS = float(os.getenv("AI_REQUEST_TIMEOUT_SECONDS", "30"))
+
+# The client build is served from memory by serve() below
+app = Flask(__name__, static_folder=None)
+app.json = FastJSONProvider(app)
 CORS(app)
 
+# Cold-start numbers, in ms since app.py started loading
+startup = {"imported_ms": None, "first_tasks_response_ms": None}
+metrics.register_gauge("startup.import_ms", lambda: startup["imported_ms"])
+metrics.register_gauge("startup.first_tasks_response_ms", lambda: startup["first_tasks_response_ms"])
+
+def request_timeout():
+    try:
+        requested = float(request.headers.get("X-Request-Timeout", AI_REQUEST_TIMEOUT_SECONDS))
+    except ValueError:
+        requested = AI_REQUEST_TIMEOUT_SECONDS
+    return max(0.1, min(requested, AI_REQUEST_TIMEOUT_SECONDS))
+
 # Logging middleware
 @app.before_request
 def start_timer():
     request.start_time = time.time()
+    # Outbound LLM calls are limited per user; this demo serves a single account
+    llm_user.set("alexjohnson")
+    set_deadline(request_timeout())
+
+# Storage calls made while serving a traced request are recorded as spans
+instrument(storage, "storage", skip=("subscribe",))
+
+# Root span of the request's trace. The end hook is registered before every
+# other after_request hook so it runs last; a streamed response's span
+# ends once the body has been sent
+@app.before_request
+def open_trace():
+    if not request.path.startswith('/api'):
+        return None
+    g.trace_root = start_trace(
+        f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+        request.headers.get("traceparent"),
+        **{"http.request.method": request.method, "url.path": request.path}
+    )
+
+@app.after_request
+def close_trace(response):
+    root = g.pop("trace_root", None)
+    if root is not None:
+        root.set("http.response.status_code", response.status_code)
+        request_kind = g.get("request_class")
+        if request_kind:
+            root.set("intellectra.request_class", request_kind)
+        if response.status_code >= 500:
+            root.fail(f"HTTP {response.status_code}")
+        response.headers["X-Trace-Id"] = root.trace.trace_id
+        if response.is_streamed:
+            response.call_on_close(lambda: finish_trace(root))
+        else:
+            finish_trace(root)
+    return response
+
+@app.teardown_request
+def abandon_trace(exc):
+    root = g.pop("trace_root", None)
+    if root is not None:
+        root.fail(str(exc) if exc else "request ended without a response")
+        finish_trace(root)
+
+# Request classes, each admitted through its own bulkhead. Routes that
+# call Gemini, or wait for a job that does, are "ai"; long transfers are
+# "bulk"; every other API route is "crud". Recommendations are crud: reads
+# are served from the materialized store and only queue a background job,
+# so they never hold a thread on Gemini. The client build is served from
+# memory and is not admission-controlled
+AI_ENDPOINTS = {
+    "enhance_notes_route",
+    "generate_flashcards",
+    "generate_flashcards_stream",
+    "get_concept_map",
+    "create_concept_map",
+    "expand_concept_map_node",
+    "generate_concept_flashcards",
+    "generate_concept_flashcards_batch",
+    "generate_concept_flashcards_stream",
+    "stream_concept_map_route"
+}
+BULK_ENDPOINTS = {"export_data", "import_data"}
+
+def request_class():
+    if "request_class" not in g:
+        g.request_class = classify_request()
+    return g.request_class
+
+def classify_request():
+    endpoint = request.endpoint
+    if endpoint is None or endpoint == "serve":
+        return None
+    if endpoint in AI_ENDPOINTS:
+        return "ai"
+    if endpoint in BULK_ENDPOINTS:
+        return "bulk"
+    if endpoint == "run_batch" and batch_costs().get("ai"):
+        return "ai"
+    return "crud"
+
+def endpoint_class(endpoint):
+    if endpoint in AI_ENDPOINTS:
+        return "ai"
+    if endpoint in BULK_ENDPOINTS:
+        return "bulk"
+    return "crud"
+
+# Sub-requests of a batch counted by request class; a batch that includes
+# an AI route is admitted as AI work
+def batch_costs():
+    if "batch_costs" in g:
+        return g.batch_costs
+    costs = {}
+    data = request.get_json(silent=True)
+    items = data.get("requests") if isinstance(data, dict) else None
+    if isinstance(items, list):
+        for item in items:
+            kind = "crud"
+            if isinstance(item, dict) and isinstance(item.get("path"), str):
+                kind = path_class(str(item.get("method", "GET")).upper(), item["path"])
+            costs[kind] = costs.get(kind, 0) + 1
+    g.batch_costs = costs
+    return costs
+
+# Request class of the route a method and path resolve to
+def path_class(method, path):
+    try:
+        endpoint, _ = app.url_map.bind("").match(path.split("?")[0], method=method)
+    except Exception:
+        endpoint = None
+    return endpoint_class(endpoint)
+
+# Per-user rate limits, checked before admission so a client over its
+# limit never takes a bulkhead slot. A batch takes one token per
+# sub-request from the bucket of that sub-request's class; one that could
+# never fit in a bucket is refused outright. AI work is also refused once
+# the user's daily LLM token quota is spent
+@app.before_request
+def limit_request():
+    request_kind = request_class()
+    if not RATE_LIMITS_ENABLED or request_kind is None:
+        return None
+    user = llm_user.get()
+    costs = {request_kind: 1}
+    if request.endpoint == "run_batch":
+        costs = batch_costs() or costs
+
+    for kind, cost in costs.items():
+        if rate_limiter.exceeds_burst(kind, cost):
+            message = f"Batch has {cost} {kind} requests; at most {rate_limiter.limits[kind].burst} fit in one batch"
+            return jsonify({"message": message}), 413
+
+    # AI tokens are the scarcest, so they are taken first: a batch refused
+    # for them has not spent any crud tokens
+    for kind in sorted(costs, key=lambda kind: ("ai", "bulk", "crud").index(kind)):
+        decision = rate_limiter.check(user, kind, costs[kind])
+        if decision is None:
+            continue
+        if kind == request_kind:
+            g.rate_limit = decision
+        if not decision.allowed:
+            g.rate_limit = decision
+            response = jsonify({"message": f"Rate limit exceeded for {kind} requests; try again shortly"})
+            return response, 429, {"Retry-After": str(max(1, math.ceil(decision.retry_after)))}
+
+    if request_kind == "ai":
+        quota = rate_limiter.quota(user)
+        if quota is not None:
+            g.llm_quota = quota
+            remaining_tokens, reset = quota
+            if remaining_tokens <= 0:
+                metrics.incr("ratelimit.quota_exceeded")
+                response = jsonify({"message": "Daily AI usage quota reached; it resets at midnight UTC"})
+                return response, 429, {"Retry-After": str(reset)}
+
+@app.after_request
+def rate_limit_headers(response):
+    decision = g.get("rate_limit")
+    if decision is not None:
+        response.headers["RateLimit-Limit"] = str(decision.limit)
+        response.headers["RateLimit-Remaining"] = str(decision.remaining)
+        response.headers["RateLimit-Reset"] = str(math.ceil(decision.reset))
+    quota = g.get("llm_quota")
+    if quota is not None:
+        response.headers["X-LLM-Quota-Limit"] = str(rate_limiter.daily_tokens)
+        response.headers["X-LLM-Quota-Remaining"] = str(quota[0])
+    return response
+
+# POST routes that read their body as a stream and so cannot be fingerprinted
+IDEMPOTENCY_EXEMPT_ENDPOINTS = {"import_data"}
+
+def replay_response(stored):
+    status, headers, body = stored
+    response = Response(body, status=status, headers=headers)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+# A POST carrying an Idempotency-Key runs once; retries with the same key
+# get the first response, waiting for it if it is still being produced.
+# Checked before admission so a retry never holds a bulkhead slot
+@app.before_request
+def check_idempotency_key():
+    key = request.headers.get("Idempotency-Key")
+    if key is None or request.method != "POST" or request_class() is None:
+        return None
+    if request.endpoint in IDEMPOTENCY_EXEMPT_ENDPOINTS:
+        return None
+    if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return jsonify({"message": f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+    
+    scoped_key = f"{llm_user.get()}:{request.method}:{request.path}:{key}"
+    request_fingerprint = fingerprint(request.method, request.path, request.get_data())
+    wait_until = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        call, owner = idempotency_store.begin(scoped_key, request_fingerprint)
+        if owner:
+            # Large JSON lists are buffered rather than streamed so the
+            # response can be stored
+            g.idempotency = (scoped_key, call)
+            g.buffer_response = True
+            return None
+        if call.fingerprint != request_fingerprint:
+            return jsonify({"message": "Idempotency-Key was already used for a different request"}), 422
+        
+        stored = call.wait(max(0.0, wait_until - time.monotonic()))
+        if stored is not None:
+            return replay_response(stored)
+        if not call.done.is_set():
+            response = jsonify({"message": "A request with this Idempotency-Key is still in progress"})
+            return response, 409, {"Retry-After": "1"}
+        # The first request finished without a response worth sharing (it
+        # was streamed) and released the key: run this one instead
+
+@app.before_request
+def admit_request():
+    pool = bulkheads.get(request_class()) if BULKHEADS_ENABLED else None
+    if pool is None:
+        return None
+    if not pool.acquire():
+        response = jsonify({"message": f"Server is busy ({pool.name} requests); try again shortly"})
+        return response, 503, {"Retry-After": str(pool.retry_after)}
+    g.bulkhead = pool
+
+# A buffered response is complete here; a streamed one keeps its slot
+# until the server has sent the whole body
+@app.after_request
+def schedule_bulkhead_release(response):
+    pool = g.pop("bulkhead", None)
+    if pool is not None:
+        if response.is_streamed:
+            response.call_on_close(pool.release)
+        else:
+            pool.release()
+    return response
+
+# Requests that end without a response (an exception escaping the error
+# handler) still give their slot back
+@app.teardown_request
+def release_bulkhead(exc):
+    pool = g.pop("bulkhead", None)
+    if pool is not None:
+        pool.release()
+
+# Registered before the logger so it runs after it: Flask calls
+# after_request hooks in reverse order, and the log reads the plain body
+@app.after_request
+def compress_api_response(response):
+    if request.path.startswith('/api'):
+        return compress_response(response)
+    return response
+
+# Registered after the compressor so it runs before it: the stored body
+# is plain and each replay is compressed for the client that asked. JSON
+# is always buffered for key owners; a route that streams anyway (SSE) is
+# not kept, its key is released and the response says so
+@app.after_request
+def store_idempotent_response(response):
+    pending = g.pop("idempotency", None)
+    if pending is not None:
+        scoped_key, call = pending
+        stored = None
+        if response.is_streamed:
+            metrics.incr("idempotency.streamed_not_stored")
+            response.headers["Idempotent-Stored"] = "false"
+        else:
+            headers = [(name, value) for name, value in response.headers if name != "Content-Length"]
+            stored = (response.status_code, headers, response.get_data())
+        idempotency_store.finish(scoped_key, call, stored)
+    return response
+
+# A request that ends without a response releases its key
+@app.teardown_request
+def release_idempotency_key(exc):
+    pending = g.pop("idempotency", None)
+    if pending is not None:
+        idempotency_store.finish(pending[0], pending[1], None)
 
 @app.after_request
 def log_request(response):
+    if startup["first_tasks_response_ms"] is None and request.path == '/api/tasks':
+        startup["first_tasks_response_ms"] = round((time.perf_counter() - APP_LOAD_STARTED) * 1000, 1)
+    
     if request.path.startswith('/api'):
         duration = int((time.time() - request.start_time) * 1000)
         status_code = response.status_code
@@ -36,7 +361,7 @@ def log_request(response):
         
         # Try to get response data for logging
         response_data = None
-        if response.content_type == 'application/json':
+        if response.content_type == 'application/json' and not response.is_streamed:
             try:
                 response_data = json.loads(response.get_data(as_text=True))
                 log_line = f"{method} {path} {status_code} in {duration}ms :: {json.dumps(response_data)}"
@@ -58,6 +383,143 @@ def handle_error(e):
         status_code = e.code
     return jsonify({"message": str(e)}), status_code
 
+# Server-sent events: drive an async generator of (event, data) pairs from
+# the sync WSGI worker and emit each pair as soon as it is produced
+def sse_response(events):
+    def generate():
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                try:
+                    event, data = loop.run_until_complete(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            loop.run_until_complete(events.aclose())
+            loop.close()
+
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+# Run AI generation on the job queue. Callers that send "Prefer:
+# respond-async" (or ?async=true) get 202 and a job id to poll; everyone
+# else waits for the job to finish, as these routes always did.
+def run_ai_job(kind, fn, error_message):
+    if wants_async():
+        try:
+            job = jobs.submit(kind, fn)
+        except QueueFull as e:
+            return jsonify({"message": str(e)}), 503, {"Retry-After": "5"}
+        return jsonify(job.to_dict()), 202, {"Location": f"/api/jobs/{job.id}"}
+    
+    try:
+        job = jobs.submit(kind, fn, priority=PRIORITY_INTERACTIVE, timeout=remaining())
+    except QueueFull as e:
+        return jsonify({"message": str(e)}), 503, {"Retry-After": "5"}
+    
+    # The job enforces the deadline itself; the grace period covers the
+    # fallback it builds once the deadline expires
+    budget = remaining()
+    if not job.wait(budget + 2 if budget is not None else None):
+        jobs.cancel(job)
+        return jsonify({"message": error_message, "error": "Request timed out"}), 504
+    
+    if job.status != job.SUCCEEDED:
+        return jsonify({"message": error_message, "error": job.error}), 500
+    return jsonify(job.result)
+
+def wants_async():
+    if "respond-async" in request.headers.get("Prefer", ""):
+        return True
+    return request.args.get("async", "").lower() in ("1", "true")
+
+# Combine a concept's description and bullet points into flashcard source text
+def concept_content(concept, description, bullet_points):
+    content_for_flashcards = concept
+    
+    if description:
+        content_for_flashcards += f"\n\nDescription: {description}"
+    
+    if bullet_points and isinstance(bullet_points, list) and len(bullet_points) > 0:
+        content_for_flashcards += f"\n\nKey Points:\n{chr(10).join([f'- {point}' for point in bullet_points])}"
+    
+    return content_for_flashcards
+
+# METRICS
+@app.route("/api/metrics", methods=["GET"])
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+# JOBS
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"message": "Job not found"}), 404
+    
+    return jsonify(job.to_dict())
+
+# BATCH: several API requests in one round trip, independent ones run
+# concurrently; each result carries its own status
+@app.route("/api/batch", methods=["POST"])
+def run_batch():
+    try:
+        items = parse_batch(request.get_json(silent=True))
+    except BatchError as e:
+        return jsonify({"message": str(e)}), 400
+    
+    for item in items:
+        item["class"] = path_class(item["method"], item["path"])
+    return jsonify({"responses": batch_dispatcher.run(app, items)})
+
+# EXPORT: the user's whole dataset as streamed NDJSON
+@app.route("/api/export", methods=["GET"])
+def export_data():
+    user = storage.get_user_by_username("alexjohnson")
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    
+    def generate():
+        compressor = StreamCompressor(encoding)
+        for chunk in export_lines(storage, user["id"]):
+            compressed = compressor.process(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.finish()
+    
+    headers = {
+        "Content-Disposition": 'attachment; filename="intellectra-export.ndjson"',
+        "Vary": "Accept-Encoding"
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(generate(), mimetype="application/x-ndjson", headers=headers)
+
+# IMPORT: NDJSON in the export format, read incrementally from the body
+# (which may be gzip-encoded)
+@app.route("/api/import", methods=["POST"])
+def import_data():
+    user = storage.get_user_by_username("alexjohnson")
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    stream = request.stream
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    
+    try:
+        summary = import_lines(storage, user["id"], stream)
+    except (ValueError, OSError, EOFError) as e:
+        return jsonify({"message": f"Import failed: {e}"}), 400
+    
+    return jsonify(summary)
+
 # USER ENDPOINTS
 @app.route("/api/user", methods=["GET"])
 def get_current_user():
@@ -152,6 +614,70 @@ def delete_study_session(session_id):
     
     return "", 204
 
+# The client's offset from UTC in minutes (e.g. 120 for UTC+2), which
+# places the planner's daily study window; None when absent, ValueError
+# when malformed
+def parse_utc_offset(value):
+    if value is None:
+        return None
+    try:
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            raise TypeError
+        offset = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("utcOffset must be a whole number of minutes")
+    if not -14 * 60 <= offset <= 14 * 60:
+        raise ValueError("utcOffset must be between -840 and 840 minutes")
+    return offset
+
+# STUDY PLAN: open tasks packed into the free time around study sessions
+@app.route("/api/study-plan", methods=["GET"])
+def get_study_plan():
+    user = storage.get_user_by_username("alexjohnson")
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    try:
+        utc_offset = parse_utc_offset(request.args.get("utcOffset"))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    
+    return jsonify(study_planner.read(user["id"], utc_offset=utc_offset))
+
+# Book the planned blocks (optionally only those of the given tasks) as
+# study sessions linked to their tasks
+@app.route("/api/study-plan/apply", methods=["POST"])
+def apply_study_plan():
+    user = storage.get_user_by_username("alexjohnson")
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get("taskIds")
+    if task_ids is not None and not isinstance(task_ids, list):
+        return jsonify({"message": "taskIds must be a list"}), 400
+    try:
+        utc_offset = parse_utc_offset(data.get("utcOffset"))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    
+    plan = study_planner.read(user["id"], utc_offset=utc_offset)
+    sessions = [
+        storage.create_study_session({
+            "userId": user["id"],
+            "title": block["title"],
+            "startTime": block["startTime"],
+            "endTime": block["endTime"],
+            "subject": block["subject"],
+            "description": block["description"],
+            "location": None,
+            "taskId": block["taskId"]
+        })
+        for block in plan["blocks"]
+        if task_ids is None or block["taskId"] in task_ids
+    ]
+    return jsonify(sessions), 201
+
 # NOTES ENDPOINTS
 @app.route("/api/notes", methods=["GET"])
 def get_notes():
@@ -203,19 +729,7 @@ def enhance_notes_route():
     if not notes or not subject:
         return jsonify({"message": "Notes and subject are required"}), 400
     
-    try:
-        # Create an event loop to run the async function
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        enhanced = loop.run_until_complete(enhance_notes(notes, subject))
-        loop.close()
-        
-        return jsonify(enhanced)
-    except Exception as e:
-        print("Error enhancing notes:", str(e))
-        return jsonify({"message": "Failed to enhance notes", "error": str(e)}), 500
+    return run_ai_job("notes.enhance", lambda: enhance_notes(notes, subject), "Failed to enhance notes")
 
 # FLASHCARD SETS ENDPOINTS
 @app.route("/api/flashcard-sets", methods=["GET"])
@@ -224,7 +738,7 @@ def get_flashcard_sets():
     if not user:
         return jsonify({"message": "User not found"}), 404
     
-    sets = storage.get_flashcard_sets(user["id"])
+    sets = storage.get_flashcard_sets(user["id"]) + storage.get_shared_flashcard_sets()
     return jsonify(sets)
 
 @app.route("/api/flashcard-sets", methods=["POST"])
@@ -246,12 +760,16 @@ def get_flashcard_set(set_id):
     if not flashcard_set:
         return jsonify({"message": "Flashcard set not found"}), 404
     
-    flashcards = storage.get_flashcards(set_id)
+    user = storage.get_user_by_username("alexjohnson")
+    flashcards = storage.get_flashcards(set_id, user["id"] if user else None)
     result = {**flashcard_set, "flashcards": flashcards}
     return jsonify(result)
 
 @app.route("/api/flashcard-sets/<int:set_id>", methods=["PUT"])
 def update_flashcard_set(set_id):
+    if is_shared_id(set_id):
+        return jsonify({"message": "Shared flashcard sets are read-only"}), 403
+    
     set_data = request.json
     updated_set = storage.update_flashcard_set(set_id, set_data)
     
@@ -262,6 +780,9 @@ def update_flashcard_set(set_id):
 
 @app.route("/api/flashcard-sets/<int:set_id>", methods=["DELETE"])
 def delete_flashcard_set(set_id):
+    if is_shared_id(set_id):
+        return jsonify({"message": "Shared flashcard sets are read-only"}), 403
+    
     success = storage.delete_flashcard_set(set_id)
     
     if not success:
@@ -272,11 +793,15 @@ def delete_flashcard_set(set_id):
 # FLASHCARDS ENDPOINTS
 @app.route("/api/flashcard-sets/<int:set_id>/flashcards", methods=["GET"])
 def get_flashcards(set_id):
-    flashcards = storage.get_flashcards(set_id)
+    user = storage.get_user_by_username("alexjohnson")
+    flashcards = storage.get_flashcards(set_id, user["id"] if user else None)
     return jsonify(flashcards)
 
 @app.route("/api/flashcard-sets/<int:set_id>/flashcards", methods=["POST"])
 def create_flashcard(set_id):
+    if is_shared_id(set_id):
+        return jsonify({"message": "Shared flashcard sets are read-only"}), 403
+    
     # Check if set exists
     flashcard_set = storage.get_flashcard_set_by_id(set_id)
     if not flashcard_set:
@@ -285,34 +810,104 @@ def create_flashcard(set_id):
     flashcard_data = request.json
     flashcard_data["setId"] = set_id
     
+    # Near-duplicates of the user's existing cards are flagged, or dropped
+    # in favour of the existing card
+    duplicate_id = None
+    if FLASHCARD_DEDUP != "off":
+        duplicate_id = dedup_index.find_duplicate(
+            flashcard_set["userId"],
+            flashcard_data.get("question", ""),
+            flashcard_data.get("answer", "")
+        )
+    
+    if duplicate_id is not None and FLASHCARD_DEDUP == "drop":
+        response = jsonify(storage.get_flashcard_by_id(duplicate_id))
+        response.headers["X-Duplicate-Of"] = str(duplicate_id)
+        return response, 200
+    
     flashcard = storage.create_flashcard(flashcard_data)
-    return jsonify(flashcard), 201
+    response = jsonify(flashcard)
+    if duplicate_id is not None:
+        response.headers["X-Duplicate-Of"] = str(duplicate_id)
+    return response, 201
+
+# Card updates; on shared cards only the caller's review fields change
+@app.route("/api/flashcards/<int:card_id>", methods=["PUT"])
+def update_flashcard(card_id):
+    user = storage.get_user_by_username("alexjohnson")
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    card_data = request.json
+    if is_shared_id(card_id) and set(card_data) - set(ProgressOverlay.FIELDS):
+        return jsonify({"message": "Only proficiency and lastReviewed can be changed on shared cards"}), 403
+    
+    flashcard = storage.update_flashcard(card_id, card_data, user["id"])
+    if not flashcard:
+        return jsonify({"message": "Flashcard not found"}), 404
+    
+    return jsonify(flashcard)
+
+# Find near-duplicate flashcards across all of the user's sets and remove
+# all but the oldest card of each group ({"dryRun": true} only reports them)
+@app.route("/api/flashcards/dedup", methods=["POST"])
+def dedup_flashcards():
+    user = storage.get_user_by_username("alexjohnson")
+    if not user:
+        return jsonify({"message": "User not found"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    groups = dedup_index.duplicate_groups(user["id"])
+    
+    removed = 0
+    if not data.get("dryRun"):
+        for group in groups:
+            for card_id in group["duplicates"]:
+                if storage.delete_flashcard(card_id):
+                    removed += 1
+    
+    return jsonify({"groups": groups, "removed": removed})
+
+# Note text to generate from. With useNotes set, the excerpts of the
+# user's stored notes most relevant to the query are used; pasted notes are
+# trimmed to their relevant parts when trim is set and they are long
+def relevant_notes(user, data, query, trim=True):
+    notes = data.get("notes")
+    if str(data.get("useNotes", "")).lower() in ("1", "true"):
+        return note_index.context(user["id"], query) or notes
+    return select_relevant(notes, query) if notes and trim else notes
 
 # AI Generated Flashcards
 @app.route("/api/flashcards/generate", methods=["POST"])
 def generate_flashcards():
     data = request.json
-    notes = data.get("notes")
     subject = data.get("subject")
     count = data.get("count", 5)
+    user = storage.get_user_by_username("alexjohnson")
+    notes = relevant_notes(user, data, subject, trim=False) if subject else None
     
     if not notes or not subject:
         return jsonify({"message": "Notes and subject are required"}), 400
     
-    try:
-        # Create an event loop to run the async function
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Run the async function and get the result
-        flashcards = loop.run_until_complete(generate_flashcards_from_notes(notes, subject, count))
-        loop.close()
-        
-        return jsonify(flashcards)
-    except Exception as e:
-        print("Error generating flashcards:", str(e))
-        return jsonify({"message": "Failed to generate flashcards", "error": str(e)}), 500
+    return run_ai_job(
+        "flashcards.generate",
+        lambda: generate_flashcards_from_notes(notes, subject, count),
+        "Failed to generate flashcards"
+    )
+
+# AI Generated Flashcards, streamed as server-sent events
+@app.route("/api/flashcards/generate/stream", methods=["POST"])
+def generate_flashcards_stream():
+    data = request.json
+    subject = data.get("subject")
+    count = data.get("count", 5)
+    user = storage.get_user_by_username("alexjohnson")
+    notes = relevant_notes(user, data, subject, trim=False) if subject else None
+    
+    if not notes or not subject:
+        return jsonify({"message": "Notes and subject are required"}), 400
+    
+    return sse_response(stream_flashcards_from_notes(notes, subject, count))
 
 # STUDY PROGRESS ENDPOINTS
 @app.route("/api/study-progress", methods=["GET"])
@@ -343,75 +938,100 @@ def get_recommendations():
     if not user:
         return jsonify({"message": "User not found"}), 404
     
-    try:
-        # For demo purposes, use fixed values
-        recent_topics = ["Algorithms", "Data Structures", "Database Design"]
-        upcoming_exams = ["Database Midterm", "Algorithm Final"]
-        struggling_areas = ["Graph Algorithms", "SQL Optimization"]
-        
-        # Create an event loop to run the async function
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        recommendations = loop.run_until_complete(generate_study_recommendations(
-            recent_topics,
-            upcoming_exams,
-            struggling_areas
-        ))
-        loop.close()
-        
-        return jsonify(recommendations)
-    except Exception as e:
-        print("Error generating recommendations:", str(e))
-        return jsonify({"message": "Failed to generate recommendations", "error": str(e)}), 500
+    # Regenerating spends the user's LLM tokens, so it waits for the quota
+    # to reset; stored (or fallback) recommendations are served meanwhile
+    quota = rate_limiter.quota(llm_user.get())
+    if quota is not None:
+        g.llm_quota = quota
+    regenerate = quota is None or quota[0] > 0
+    recommendations, generated_at, status = recommendation_store.read(user["id"], recommendation_inputs(user), regenerate)
+    
+    # The body stays a plain array; freshness travels in headers
+    response = jsonify(recommendations)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Recommendations-Status"] = status
+    if generated_at is not None:
+        response.last_modified = generated_at
+        response.headers["X-Generated-At"] = datetime.fromtimestamp(generated_at, timezone.utc).isoformat()
+    return response
+
+# Inputs the recommendation prompt is generated from
+def recommendation_inputs(user):
+    profile = learner_profiles.read(user["id"])
+    return (
+        profile["recent_topics"] or ["None yet"],
+        profile["upcoming_exams"] or ["None scheduled"],
+        profile["struggling_areas"] or ["None identified"]
+    )
 
 # CONCEPT MAP
 @app.route("/api/concept-map", methods=["GET"])
 def get_concept_map():
     topic = request.args.get("topic")
-    notes = request.args.get("notes")
     
     if not topic:
         return jsonify({"message": "Topic is required as a query parameter"}), 400
     
-    try:
-        # Create an event loop to run the async function
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        concept_map = loop.run_until_complete(generate_concept_map(topic, notes))
-        loop.close()
-        
-        return jsonify(concept_map)
-    except Exception as e:
-        print("Error generating concept map:", str(e))
-        return jsonify({"message": "Failed to generate concept map", "error": str(e)}), 500
+    user = storage.get_user_by_username("alexjohnson")
+    notes = relevant_notes(user, request.args, topic)
+    refresh = request.args.get("refresh", "").lower() in ("1", "true")
+    return run_ai_job(
+        "concept_map",
+        lambda: concept_map_for(user["id"], topic, notes, refresh),
+        "Failed to generate concept map"
+    )
 
 # CONCEPT MAP with POST (for larger text input)
 @app.route("/api/concept-map", methods=["POST"])
 def create_concept_map():
     data = request.json
     topic = data.get("topic")
-    notes = data.get("notes")
     
     if not topic:
         return jsonify({"message": "Topic is required in the request body"}), 400
     
-    try:
-        # Create an event loop to run the async function
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        concept_map = loop.run_until_complete(generate_concept_map(topic, notes))
-        loop.close()
-        
-        return jsonify(concept_map)
-    except Exception as e:
-        print("Error generating concept map:", str(e))
-        return jsonify({"message": "Failed to generate concept map", "error": str(e)}), 500
+    user = storage.get_user_by_username("alexjohnson")
+    notes = relevant_notes(user, data, topic)
+    refresh = bool(data.get("refresh"))
+    return run_ai_job(
+        "concept_map",
+        lambda: concept_map_for(user["id"], topic, notes, refresh),
+        "Failed to generate concept map"
+    )
+
+# Stored concept map, including every level expanded so far
+@app.route("/api/concept-map/<map_id>", methods=["GET"])
+def get_stored_concept_map(map_id):
+    user = storage.get_user_by_username("alexjohnson")
+    graph = concept_graphs.get(map_id)
+    if not graph or graph.user_id != user["id"]:
+        return jsonify({"message": "Concept map not found"}), 404
+    
+    return jsonify(graph.to_dict())
+
+# Generate the children of one concept map node on demand
+@app.route("/api/concept-map/<map_id>/nodes/<node_id>/expand", methods=["POST"])
+def expand_concept_map_node(map_id, node_id):
+    user = storage.get_user_by_username("alexjohnson")
+    graph = concept_graphs.get(map_id)
+    if not graph or graph.user_id != user["id"]:
+        return jsonify({"message": "Concept map not found"}), 404
+    
+    if node_id not in graph.nodes:
+        return jsonify({"message": "Node not found"}), 404
+    
+    data = request.get_json(silent=True) or {}
+    count = data.get("count", CONCEPT_EXPAND_COUNT)
+    if isinstance(count, str) and count.strip().isdigit():
+        count = int(count)
+    if isinstance(count, bool) or not isinstance(count, int):
+        return jsonify({"message": "count must be a whole number"}), 400
+    count = min(max(count, 1), 8)
+    return run_ai_job(
+        "concept_map.expand",
+        lambda: expand_node(graph, node_id, count),
+        "Failed to expand concept"
+    )
 
 # CONCEPT FLASHCARDS - generate flashcards for a specific concept
 @app.route("/api/concept-flashcards", methods=["POST"])
@@ -424,38 +1044,90 @@ def generate_concept_flashcards():
     if not concept:
         return jsonify({"message": "Concept name is required in the request body"}), 400
     
-    try:
-        # Prepare prompt content by combining description and bullet points
-        content_for_flashcards = concept
-        
-        if description:
-            content_for_flashcards += f"\n\nDescription: {description}"
-        
-        if bullet_points and isinstance(bullet_points, list) and len(bullet_points) > 0:
-            content_for_flashcards += f"\n\nKey Points:\n{chr(10).join([f'- {point}' for point in bullet_points])}"
-        
-        # Create an event loop to run the async function
-        import asyncio
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # Generate flashcards using the existing function - increase count for more comprehensive learning
-        flashcards = loop.run_until_complete(generate_flashcards_from_notes(content_for_flashcards, concept, 7))
-        loop.close()
-        
-        return jsonify(flashcards)
-    except Exception as e:
-        print("Error generating concept flashcards:", str(e))
-        return jsonify({"message": "Failed to generate flashcards", "error": str(e)}), 500
+    # Prepare prompt content by combining description and bullet points
+    content_for_flashcards = concept_content(concept, description, bullet_points)
+    
+    # Seven cards rather than the default five for more comprehensive learning
+    return run_ai_job(
+        "concept_flashcards.generate",
+        lambda: generate_flashcards_from_notes(content_for_flashcards, concept, 7),
+        "Failed to generate flashcards"
+    )
+
+# CONCEPT FLASHCARDS for many concept map nodes at once, packed into as few
+# LLM calls as the token budget allows
+@app.route("/api/concept-flashcards/batch", methods=["POST"])
+def generate_concept_flashcards_batch():
+    data = request.json
+    concepts = data.get("concepts")
+    count = data.get("count", 7)
+    
+    if not concepts or not isinstance(concepts, list):
+        return jsonify({"message": "A non-empty concepts array is required in the request body"}), 400
+    
+    normalized = []
+    for concept in concepts:
+        label = concept.get("label") or concept.get("concept") if isinstance(concept, dict) else None
+        if not label:
+            return jsonify({"message": "Every concept needs a label"}), 400
+        normalized.append({
+            "label": label,
+            "description": concept.get("description"),
+            "bulletPoints": concept.get("bulletPoints")
+        })
+    
+    async def generate():
+        return {"results": await generate_flashcards_for_concepts(normalized, count)}
+    
+    return run_ai_job("concept_flashcards.batch", generate, "Failed to generate flashcards")
+
+# CONCEPT FLASHCARDS, streamed as server-sent events
+@app.route("/api/concept-flashcards/stream", methods=["POST"])
+def generate_concept_flashcards_stream():
+    data = request.json
+    concept = data.get("concept")
+    
+    if not concept:
+        return jsonify({"message": "Concept name is required in the request body"}), 400
+    
+    content_for_flashcards = concept_content(concept, data.get("description"), data.get("bulletPoints"))
+    return sse_response(stream_flashcards_from_notes(content_for_flashcards, concept, 7))
+
+# CONCEPT MAP, streamed as server-sent events (GET for short topics, POST for notes)
+@app.route("/api/concept-map/stream", methods=["GET", "POST"])
+def stream_concept_map_route():
+    data = request.json if request.method == "POST" else request.args
+    topic = data.get("topic")
+    
+    if not topic:
+        return jsonify({"message": "Topic is required"}), 400
+    
+    user = storage.get_user_by_username("alexjohnson")
+    notes = relevant_notes(user, data, topic)
+    return sse_response(stream_concept_map(topic, notes))
 
 # Serve React app
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(app.static_folder + '/' + path):
-        return app.send_static_file(path)
-    else:
-        return app.send_static_file('index.html')
+    asset = None if path.startswith("api/") else static_assets.lookup(path)
+    if asset is None:
+        return jsonify({"message": "Not found"}), 404
+    
+    body, encoding = asset.negotiate(request.headers.get("Accept-Encoding", ""))
+    headers = {
+        "ETag": asset.etag_for(encoding),
+        "Cache-Control": asset.cache_control
+    }
+    if len(asset.variants) > 1:
+        headers["Vary"] = "Accept-Encoding"
+    if asset.matches(request.headers.get("If-None-Match", "")):
+        return Response(status=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, content_type=asset.content_type, headers=headers)
+
+startup["imported_ms"] = round((time.perf_counter() - APP_LOAD_STARTED) * 1000, 1)
 
 if __name__ == "__main__":
     print("[express] serving on port 5001")
@@ -0,0 +1,67 @@
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from python_server.dedup import DedupIndex
+
+# Insert-time cost of the flashcard near-duplicate check.
+#
+#   python benchmarks/bench_dedup.py                   # 100k cards
+#   python benchmarks/bench_dedup.py --cards 1000000
+#
+# Fills an index with synthetic cards for one user, then times lookups for
+# near-duplicates of indexed cards (a word changed) and for unseen cards.
+
+VOCABULARY = [f"w{i}" for i in range(5000)]
+
+def random_card(rng):
+    question = " ".join(rng.choices(VOCABULARY, k=12))
+    answer = " ".join(rng.choices(VOCABULARY, k=60))
+    return question, answer
+
+def near_duplicate(rng, question, answer):
+    words = question.split()
+    words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return " ".join(words), answer
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def main():
+    cards = int(sys.argv[sys.argv.index("--cards") + 1]) if "--cards" in sys.argv else 100000
+    rng = random.Random(42)
+    index = DedupIndex()
+
+    started = time.perf_counter()
+    kept = []
+    for card_id in range(cards):
+        question, answer = random_card(rng)
+        index.add(card_id, 1, question, answer)
+        if card_id % max(1, cards // 1000) == 0:
+            kept.append((question, answer))
+    build = time.perf_counter() - started
+    print(f"indexed {cards} cards in {build:.1f}s ({cards / build:,.0f}/s)")
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB")
+
+    for label, queries in (
+        ("near-duplicate", [near_duplicate(rng, q, a) for q, a in kept]),
+        ("unseen", [random_card(rng) for _ in kept])
+    ):
+        timings = []
+        hits = 0
+        for question, answer in queries:
+            started = time.perf_counter()
+            hits += index.find_duplicate(1, question, answer) is not None
+            timings.append((time.perf_counter() - started) * 1e6)
+        print(
+            f"{label:15} p50 {percentile(timings, 0.5):6.0f}us  p99 {percentile(timings, 0.99):6.0f}us"
+            f"  flagged {hits}/{len(queries)}"
+        )
+
+if __name__ == "__main__":
+    main()
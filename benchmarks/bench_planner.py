@@ -0,0 +1,91 @@
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from python_server.planner import StudyPlanner
+from python_server.storage import MemStorage
+
+# Study planner: full plans and incremental re-plans for one busy user.
+#
+#   python benchmarks/bench_planner.py                  # 5000 tasks
+#   python benchmarks/bench_planner.py --tasks 20000 --sessions 300
+#
+# Fills a private storage instance with open tasks (due over the next two
+# weeks, a fifth without a due date) and study sessions, then times a full
+# plan and re-plans after changing one task (early and late in deadline
+# order), adding one session, and completing a task. After the changes the
+# incremental plan is compared with one built from scratch.
+
+DAY = 24 * 60 * 60
+
+def arg(name, default):
+    return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+def fill(storage, user_id, tasks, sessions, rng, now):
+    for index in range(tasks):
+        storage.create_task({
+            "userId": user_id, "title": f"Task {index}", "description": "",
+            "dueDate": None if rng.random() < 0.2 else (now + rng.uniform(0.2, 14) * DAY) * 1000,
+            "priority": rng.randint(1, 3), "completed": False, "category": "Exams",
+            "estimatedMinutes": rng.choice([15, 30, 45, 60, 90, 120])
+        })
+    for _ in range(sessions):
+        start = now + rng.uniform(0, 14) * DAY
+        storage.create_study_session({
+            "userId": user_id, "title": "Lecture",
+            "startTime": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+            "endTime": datetime.fromtimestamp(start + rng.choice([45, 60, 90]) * 60, timezone.utc).isoformat(),
+            "subject": "CS", "description": "", "location": None
+        })
+
+def timed_read(planner, user_id, now):
+    started = time.perf_counter()
+    plan = planner.read(user_id, now)
+    return plan, (time.perf_counter() - started) * 1000
+
+def main():
+    tasks = arg("--tasks", 5000)
+    sessions = arg("--sessions", 100)
+    rng = random.Random(7)
+    now = time.time()
+    source = MemStorage()
+    fill(source, 1, tasks, sessions, rng, now)
+    planner = StudyPlanner()
+    planner.attach(source)
+
+    plan, ms = timed_read(planner, 1, now)
+    print(f"{tasks:,} tasks, {sessions:,} sessions: {len(plan['blocks']):,} blocks, "
+          f"{len(plan['unscheduled']):,} tasks not fully scheduled")
+    print(f"  full plan                    {ms:8.2f}ms")
+
+    order = planner.plans[1].order
+    early, late = order[len(order) // 20][2], order[-len(order) // 20][2]
+    for label, task_id in (("early task changed", early), ("late task changed", late)):
+        source.update_task(task_id, {"estimatedMinutes": 75})
+        _, ms = timed_read(planner, 1, now)
+        print(f"  {label:28} {ms:8.2f}ms")
+
+    start = now + 10 * DAY
+    source.create_study_session({
+        "userId": 1, "title": "Exam review", "startTime": datetime.fromtimestamp(start, timezone.utc).isoformat(),
+        "endTime": datetime.fromtimestamp(start + 3600, timezone.utc).isoformat(), "subject": "CS", "description": "", "location": None
+    })
+    _, ms = timed_read(planner, 1, now)
+    print(f"  session added in 10 days     {ms:8.2f}ms")
+
+    source.update_task(late, {"completed": True})
+    incremental, ms = timed_read(planner, 1, now)
+    print(f"  late task completed          {ms:8.2f}ms")
+
+    rebuilt = StudyPlanner()
+    rebuilt.attach(source)
+    full = rebuilt.read(1, now)
+    same = full["blocks"] == incremental["blocks"] and full["unscheduled"] == incremental["unscheduled"]
+    print(f"incremental plan matches a full re-plan: {same}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from python_server import gemini_service, prompts
+from python_server.metrics import metrics
+
+# Compare the compact and verbose prompt variants.
+#
+#   python benchmarks/bench_prompts.py            # static token estimates
+#   python benchmarks/bench_prompts.py --live 3   # plus 3 real calls per mode
+#
+# The static pass renders every registered template with representative
+# inputs. The live pass needs GEMINI_API_KEY and reports the latency and the
+# input/output token counts Gemini returns in usage_metadata.
+
+SAMPLE_NOTES = (
+    "Photosynthesis converts light energy into chemical energy. The light-dependent "
+    "reactions in the thylakoid membranes produce ATP and NADPH and release oxygen. "
+    "The Calvin cycle in the stroma fixes CO2 into sugars using that ATP and NADPH. "
+) * 8
+
+SAMPLE_VALUES = {
+    "flashcards": {"notes": SAMPLE_NOTES, "subject": "Biology", "count": 5},
+    "concept_map": {"topic": "Photosynthesis", "note_context": ""},
+    "concept_map_notes": {"notes": SAMPLE_NOTES},
+    "concept_expand": {
+        "topic": "Photosynthesis",
+        "label": "Calvin Cycle",
+        "path": "Photosynthesis > Calvin Cycle",
+        "description": "Light-independent reactions that fix CO2 into sugars.",
+        "existing": "none",
+        "count": 3
+    },
+    "recommendations": {
+        "recent_topics": "Algorithms, Data Structures",
+        "upcoming_exams": "Algorithm Final",
+        "struggling_areas": "Graph Algorithms"
+    },
+    "enhance_notes": {"notes": SAMPLE_NOTES, "subject": "Biology"},
+    "concept_flashcards": {"count": 7, "sections": "=== Concept 0 ===\nCalvin Cycle"}
+}
+
+LIVE_CALLS = {
+    "flashcards": lambda: gemini_service.generate_flashcards_from_notes(SAMPLE_NOTES, "Biology", 5),
+    "concept_map": lambda: gemini_service.generate_concept_map("Photosynthesis"),
+    "recommendations": lambda: gemini_service.generate_study_recommendations(
+        ["Algorithms", "Data Structures"], ["Algorithm Final"], ["Graph Algorithms"]
+    )
+}
+
+def static_report():
+    print(f"{'template':22} {'verbose':>9} {'compact':>9} {'saved':>7}")
+    for name, values in SAMPLE_VALUES.items():
+        verbose = prompts.get_prompt(name, "verbose").estimate(**values)
+        compact = prompts.get_prompt(name, "compact").estimate(**values)
+        saved = 1 - compact / verbose if verbose else 0
+        print(f"{name:22} {verbose:9} {compact:9} {saved:7.0%}")
+
+def live_report(calls_per_mode):
+    print(f"\n{'call':18} {'mode':8} {'latency p50':>12} {'input tok':>10} {'output tok':>11}")
+    for name, call in LIVE_CALLS.items():
+        for mode in ("verbose", "compact"):
+            prompts.PROMPT_MODE = mode
+            key = prompts.get_prompt(name, mode).key
+            for _ in range(calls_per_mode):
+                asyncio.run(call())
+            summary = metrics.snapshot()["histograms"]
+            latency = summary.get(f"llm.{key}.latency_ms", {}).get("p50", 0)
+            input_tokens = summary.get(f"llm.{key}.input_tokens", {}).get("mean", 0)
+            output_tokens = summary.get(f"llm.{key}.output_tokens", {}).get("mean", 0)
+            print(f"{name:18} {mode:8} {latency:10.0f}ms {input_tokens:10.0f} {output_tokens:11.0f}")
+
+def main():
+    static_report()
+    if "--live" in sys.argv:
+        if not os.getenv("GEMINI_API_KEY"):
+            print("\n--live needs GEMINI_API_KEY")
+            return
+        calls = int(sys.argv[sys.argv.index("--live") + 1]) if len(sys.argv) > sys.argv.index("--live") + 1 else 3
+        started = time.perf_counter()
+        live_report(calls)
+        print(f"\nlive run took {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask
+
+from python_server.responses import API_COMPRESS_LEVEL, BROTLI_QUALITY, FastJSONProvider, brotli, orjson
+
+# Serialization CPU and bytes on the wire for representative API payloads.
+#
+#   python benchmarks/bench_responses.py
+#   python benchmarks/bench_responses.py --repeat 50
+#
+# Compares the stdlib encoder Flask uses by default with the response
+# pipeline's encoder, and the size and CPU cost of each content encoding.
+
+WORDS = (
+    "the cell membrane regulates transport of ions and molecules through channels pumps and "
+    "vesicles while enzymes catalyse reactions that convert substrates into products under "
+    "specific conditions of temperature and pH which determine rate and equilibrium"
+).split()
+
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def flashcards(rng, count=200):
+    return [
+        {
+            "id": i,
+            "setId": 1 + i // 50,
+            "question": text(rng, 14) + "?",
+            "answer": text(rng, rng.randint(150, 200)),
+            "proficiency": rng.randint(0, 5),
+            "lastReviewed": None
+        }
+        for i in range(count)
+    ]
+
+def enhanced_notes(rng):
+    return {
+        "enhancedNotes": "\n\n".join(text(rng, 120) for _ in range(12)),
+        "keyConcepts": [{"concept": text(rng, 3), "explanation": text(rng, 60)} for _ in range(8)],
+        "summary": text(rng, 90)
+    }
+
+def concept_map(rng, count=60):
+    return {
+        "nodes": [
+            {
+                "id": str(i),
+                "label": text(rng, 3),
+                "description": text(rng, 80),
+                "bulletPoints": [text(rng, 12) for _ in range(4)],
+                "x": rng.uniform(0, 1000),
+                "y": rng.uniform(0, 1000)
+            }
+            for i in range(count)
+        ],
+        "edges": [{"source": str(rng.randrange(i)), "target": str(i)} for i in range(1, count)]
+    }
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+def main():
+    repeat = int(sys.argv[sys.argv.index("--repeat") + 1]) if "--repeat" in sys.argv else 20
+    rng = random.Random(42)
+    provider = FastJSONProvider(Flask(__name__))
+    print(f"orjson {'installed' if orjson else 'missing'}, brotli {'installed' if brotli else 'missing'}")
+
+    payloads = {
+        "200 flashcards": flashcards(rng),
+        "enhanced notes": enhanced_notes(rng),
+        "60-node concept map": concept_map(rng)
+    }
+    for name, payload in payloads.items():
+        stdlib_ms, body = timed(lambda: json.dumps(payload, sort_keys=True, separators=(",", ":")).encode(), repeat)
+        fast_ms, _ = timed(lambda: provider.dumps_bytes(payload), repeat)
+        print(f"\n{name}: {len(body):,} bytes")
+        print(f"  encode   stdlib {stdlib_ms:6.2f}ms   pipeline {fast_ms:6.2f}ms")
+
+        gzip_ms, compressed = timed(lambda: gzip.compress(body, compresslevel=API_COMPRESS_LEVEL, mtime=0), repeat)
+        print(f"  gzip -{API_COMPRESS_LEVEL}  {gzip_ms:6.2f}ms   {len(compressed):,} bytes ({len(compressed) / len(body):.0%})")
+        if brotli is not None:
+            br_ms, compressed = timed(lambda: brotli.compress(body, quality=BROTLI_QUALITY), repeat)
+            print(f"  br q{BROTLI_QUALITY}    {br_ms:6.2f}ms   {len(compressed):,} bytes ({len(compressed) / len(body):.0%})")
+
+if __name__ == "__main__":
+    main()
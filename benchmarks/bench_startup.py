@@ -0,0 +1,83 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+# Cold-start cost of the Python server.
+#
+#   python benchmarks/bench_startup.py              # 5 cold starts
+#   python benchmarks/bench_startup.py --runs 10 --seed --top 30
+#
+# Each run is a fresh interpreter that imports app.py under -X importtime
+# and serves one GET /api/tasks through the test client. Reports the
+# median import time of each module (cumulative, top-level imports of
+# app.py and every python_server module), app.py's own load time, the time
+# to the first /api/tasks response measured inside the process, and the
+# wall time from spawning the process to that response. --seed enables the
+# demo dataset (SEED_DEMO_DATA=1) as start_python_server.sh does.
+
+CHILD = """
+import json, sys, time
+spawned = float(sys.argv[1])
+import app
+response = app.app.test_client().get("/api/tasks")
+print(json.dumps({
+    "status": response.status_code,
+    "startup": app.startup,
+    "wall_ms": (time.time() - spawned) * 1000
+}))
+"""
+
+def run_once(seed):
+    env = {**os.environ, "SEED_DEMO_DATA": "1" if seed else "0"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, str(time.time())],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        if depth <= 1 or name.startswith("python_server"):
+            try:
+                modules[name] = int(cumulative) / 1000
+            except ValueError:
+                pass
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return modules, report
+
+def main():
+    runs = int(sys.argv[sys.argv.index("--runs") + 1]) if "--runs" in sys.argv else 5
+    top = int(sys.argv[sys.argv.index("--top") + 1]) if "--top" in sys.argv else 20
+    seed = "--seed" in sys.argv
+
+    samples = {}
+    reports = []
+    for _ in range(runs):
+        modules, report = run_once(seed)
+        reports.append(report)
+        for name, ms in modules.items():
+            samples.setdefault(name, []).append(ms)
+
+    medians = sorted(((statistics.median(values), name) for name, values in samples.items()), reverse=True)
+    print(f"median cumulative import time over {runs} runs (seed demo data: {seed})")
+    for ms, name in medians[:top]:
+        print(f"  {ms:8.1f}ms  {name}")
+
+    def median_of(key):
+        values = [report["startup"][key] for report in reports if report["startup"][key] is not None]
+        return statistics.median(values) if values else float("nan")
+
+    print(f"\napp.py loaded            {median_of('imported_ms'):8.1f}ms")
+    print(f"first /api/tasks         {median_of('first_tasks_response_ms'):8.1f}ms  (in process)")
+    print(f"spawn to first response  {statistics.median(r['wall_ms'] for r in reports):8.1f}ms")
+
+if __name__ == "__main__":
+    main()
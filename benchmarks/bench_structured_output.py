@@ -0,0 +1,124 @@
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from python_server.gemini_service import (
+    CONCEPT_MAP_SCHEMA,
+    ENHANCED_NOTES_SCHEMA,
+    FLASHCARDS_SCHEMA,
+    RECOMMENDATIONS_SCHEMA
+)
+from python_server.structured_output import extract_json
+
+# Benchmark and fuzz harness for structured-output extraction.
+#
+#   python benchmarks/bench_structured_output.py [fuzz_iterations]
+#
+# Runs every response in structured_output_corpus.jsonl through the previous
+# greedy-regex extractor and the new scanner, then fuzzes the corpus with
+# random truncations and stray characters and reports recovery rates and
+# timings.
+
+CORPUS = os.path.join(os.path.dirname(__file__), "structured_output_corpus.jsonl")
+
+SCHEMAS = {
+    "flashcards": FLASHCARDS_SCHEMA,
+    "flashcards_array": FLASHCARDS_SCHEMA["properties"]["flashcards"],
+    "concept_map": CONCEPT_MAP_SCHEMA,
+    "recommendations": RECOMMENDATIONS_SCHEMA,
+    "enhanced_notes": ENHANCED_NOTES_SCHEMA
+}
+
+ITEM_KEYS = {
+    "flashcards": "flashcards",
+    "concept_map": "nodes",
+    "recommendations": "recommendations"
+}
+
+# The extractor this module replaced, kept here for comparison
+def legacy_extract(text):
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group(0))
+    array_match = re.search(r'\[.*\]', text, re.DOTALL)
+    if array_match:
+        return json.loads(array_match.group(0))
+    raise ValueError("No valid JSON found in response")
+
+def count_items(kind, value):
+    if isinstance(value, list):
+        return len(value)
+    key = ITEM_KEYS.get(kind)
+    return len(value.get(key, [])) if key else None
+
+def run(extractor, case):
+    schema = SCHEMAS[case["kind"]]
+    start = time.perf_counter()
+    try:
+        value = extractor(case["text"], schema)
+        ok = True
+    except Exception:
+        value, ok = None, False
+    elapsed = (time.perf_counter() - start) * 1000
+    return ok, (count_items(case["kind"], value) if ok else None), elapsed
+
+def mutate(text, rng):
+    choice = rng.random()
+    if choice < 0.4:
+        return text[:rng.randint(len(text) // 2, len(text))]
+    if choice < 0.7:
+        pos = rng.randint(0, len(text))
+        return text[:pos] + rng.choice(["{", "}", "]", ",", "\"", "```"]) + text[pos:]
+    return rng.choice(["Sure! ", "Output {draft}: ", "```json\n"]) + text + rng.choice(["", "\n```", " Hope {this} helps."])
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(CORPUS) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    print(f"{'case':32} {'legacy':>14} {'scanner':>14}")
+    for case in corpus:
+        legacy = run(lambda text, schema: legacy_extract(text), case)
+        scanner = run(extract_json, case)
+        expected = case["expectItems"]
+        print(f"{case['name']:32} {_fmt(legacy, expected):>14} {_fmt(scanner, expected):>14}")
+
+    rng = random.Random(42)
+    totals = {"legacy": [0, 0.0], "scanner": [0, 0.0]}
+    for _ in range(iterations):
+        case = dict(rng.choice(corpus))
+        case["text"] = mutate(case["text"], rng)
+        for name, extractor in (("legacy", lambda text, schema: legacy_extract(text)), ("scanner", extract_json)):
+            ok, _, elapsed = run(extractor, case)
+            totals[name][0] += ok
+            totals[name][1] += elapsed
+    print(f"\nfuzz ({iterations} mutated responses)")
+    for name, (recovered, elapsed) in totals.items():
+        print(f"  {name:8} recovered {recovered / iterations:6.1%}  total {elapsed:8.1f}ms")
+
+    # Long response with many stray braces in the prose before the JSON
+    prose = "Consider {x} and [y] in the notes. " * 20000
+    text = prose + json.dumps({"flashcards": [{"question": "q", "answer": "a"}]})
+    for name, extractor in (("legacy", lambda t, s: legacy_extract(t)), ("scanner", extract_json)):
+        start = time.perf_counter()
+        try:
+            extractor(text, FLASHCARDS_SCHEMA)
+            status = "ok"
+        except Exception:
+            status = "failed"
+        print(f"long prose ({len(text) // 1024} KB) {name:8} {status:7} {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+def _fmt(result, expected):
+    ok, items, elapsed = result
+    if not ok:
+        return "fail"
+    mark = "" if expected is None or items == expected else "!"
+    return f"{items}{mark} {elapsed:.2f}ms"
+
+if __name__ == "__main__":
+    main()
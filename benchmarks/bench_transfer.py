@@ -0,0 +1,84 @@
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from python_server.storage import MemStorage
+from python_server.transfer import export_lines, import_lines
+
+# Export and import throughput for one heavy user.
+#
+#   python benchmarks/bench_transfer.py                    # 100k records
+#   python benchmarks/bench_transfer.py --records 1000000
+#
+# Fills a private storage instance (no listeners attached, so only the
+# transfer path is measured) with a mix dominated by flashcards, exports it
+# to a temporary file, then imports that file into a second instance.
+# Peak RSS is reported after each phase; the growth during export is the
+# exporter's own footprint, the growth during import is mostly the
+# imported records themselves.
+
+WORDS = "cell membrane enzyme substrate protein ribosome nucleus osmosis gradient catalyst".split()
+
+def text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def fill(storage, user_id, records, rng):
+    sets = max(1, records // 200)
+    others = records // 20
+    for _ in range(others):
+        storage.create_task({"userId": user_id, "title": text(rng, 4), "description": text(rng, 12),
+                             "dueDate": None, "priority": rng.randint(1, 3), "completed": False, "category": "Exams"})
+    for _ in range(others):
+        storage.create_note({"userId": user_id, "title": text(rng, 3), "content": text(rng, 80),
+                             "subject": "Biology", "tags": ["bio"]})
+    set_ids = [
+        storage.create_flashcard_set({"userId": user_id, "title": text(rng, 3), "description": "",
+                                      "subject": "Biology", "tags": []})["id"]
+        for _ in range(sets)
+    ]
+    for _ in range(records - 2 * others - sets):
+        storage.create_flashcard({"setId": rng.choice(set_ids), "question": text(rng, 10) + "?",
+                                  "answer": text(rng, 30), "lastReviewed": None, "proficiency": 0})
+
+def main():
+    records = int(sys.argv[sys.argv.index("--records") + 1]) if "--records" in sys.argv else 100000
+    rng = random.Random(42)
+    source = MemStorage()
+    fill(source, 1, records, rng)
+    baseline = peak_rss_mb()
+    print(f"filled {records:,} records, peak RSS {baseline:,.0f} MB")
+
+    with tempfile.TemporaryFile() as file:
+        started = time.perf_counter()
+        written = 0
+        for chunk in export_lines(source, 1):
+            file.write(chunk)
+            written += len(chunk)
+        elapsed = time.perf_counter() - started
+        after_export = peak_rss_mb()
+        print(
+            f"export  {elapsed:6.1f}s  {records / elapsed:10,.0f} records/s  {written / 1e6:8,.0f} MB written"
+            f"  peak RSS +{after_export - baseline:,.0f} MB"
+        )
+
+        file.seek(0)
+        target = MemStorage()
+        started = time.perf_counter()
+        summary = import_lines(target, 1, file)
+        elapsed = time.perf_counter() - started
+        imported = sum(summary["imported"].values())
+        print(
+            f"import  {elapsed:6.1f}s  {imported / elapsed:10,.0f} records/s  {imported:,} records"
+            f"  peak RSS +{peak_rss_mb() - after_export:,.0f} MB  skipped {summary['skipped']}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import asyncio
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# CRUD latency under an AI-heavy load, with and without bulkheads.
+#
+#   python benchmarks/load_bulkheads.py
+#   python benchmarks/load_bulkheads.py --seconds 20 --ai-clients 48
+#
+# Serves the app from a server with a fixed pool of SERVER_THREADS worker
+# threads (like gunicorn's gthread worker) and replaces the Gemini call
+# behind /api/notes/enhance with a 2 second sleep. AI clients loop on that
+# route while CRUD clients loop on GET /api/tasks; the CRUD latency
+# percentiles are reported for an idle server and under the AI load, once
+# with BULKHEADS_ENABLED=false and once with the default pools.
+#
+# Without bulkheads the AI requests take every server thread and /api/tasks
+# queues behind them. With them, AI work is capped at the AI pool and the
+# excess is shed with 503, so CRUD p99 stays where it was when idle.
+
+SERVER_THREADS = 16
+AI_CALL_SECONDS = 2.0
+PORT = 5091
+
+def arg(name, default):
+    return type(default)(sys.argv[sys.argv.index(name) + 1]) if name in sys.argv else default
+
+def request(method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", PORT, timeout=60)
+    try:
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        started = time.perf_counter()
+        connection.request(method, path, payload, headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status, (time.perf_counter() - started) * 1000
+    finally:
+        connection.close()
+
+def serve():
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    import app as server_app
+
+    async def slow_enhance(notes, subject):
+        await asyncio.sleep(AI_CALL_SECONDS)
+        return {"enhancedNotes": notes, "keyConcepts": [], "additionalResources": []}
+
+    server_app.enhance_notes = slow_enhance
+    # Keep the request log out of the measurements
+    server_app.app.after_request_funcs[None].remove(server_app.log_request)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    class PooledServer(BaseWSGIServer):
+        pool = ThreadPoolExecutor(max_workers=SERVER_THREADS)
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    server = PooledServer("127.0.0.1", PORT, server_app.app, handler=QuietHandler)
+    server.socket.listen(256)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def crud_latencies(seconds, clients):
+    samples = []
+    stop = time.monotonic() + seconds
+
+    def loop():
+        while time.monotonic() < stop:
+            status, ms = request("GET", "/api/tasks")
+            if status == 200:
+                samples.append(ms)
+
+    threads = [threading.Thread(target=loop) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return f"p50 {pick(0.5):7.1f}ms  p99 {pick(0.99):7.1f}ms  ({len(ordered)} requests)"
+
+# One mode, in its own process so the app's pools start fresh
+def run_mode(seconds, ai_clients, crud_clients):
+    serve()
+    print(f"  idle      CRUD {percentiles(crud_latencies(2, crud_clients))}")
+
+    statuses = {}
+    stop = threading.Event()
+
+    def ai_loop():
+        while not stop.is_set():
+            status, _ = request("POST", "/api/notes/enhance", {"notes": "n", "subject": "s"})
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 503:
+                time.sleep(0.05)
+
+    ai_threads = [threading.Thread(target=ai_loop, daemon=True) for _ in range(ai_clients)]
+    for thread in ai_threads:
+        thread.start()
+    time.sleep(AI_CALL_SECONDS)
+    print(f"  AI load   CRUD {percentiles(crud_latencies(seconds, crud_clients))}")
+    stop.set()
+    print(f"  AI responses by status: {dict(sorted(statuses.items()))}")
+
+def main():
+    seconds = arg("--seconds", 10)
+    ai_clients = arg("--ai-clients", 32)
+    crud_clients = arg("--crud-clients", 4)
+
+    if "--mode" in sys.argv:
+        run_mode(seconds, ai_clients, crud_clients)
+        return
+
+    print(f"{SERVER_THREADS} server threads, {ai_clients} AI clients ({AI_CALL_SECONDS}s calls), {crud_clients} CRUD clients")
+    for enabled in ("false", "true"):
+        print(f"\nbulkheads {'on' if enabled == 'true' else 'off'}")
+        sys.stdout.flush()
+        subprocess.run(
+            [sys.executable, __file__, "--mode", enabled, "--seconds", str(seconds),
+             "--ai-clients", str(ai_clients), "--crud-clients", str(crud_clients)],
+            env={**os.environ, "BULKHEADS_ENABLED": enabled, "SEED_DEMO_DATA": "1"},
+            check=True
+        )
+
+if __name__ == "__main__":
+    main()
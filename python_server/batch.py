@@ -0,0 +1,136 @@
+import contextvars
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from flask import Flask
+from werkzeug.exceptions import HTTPException
+
+from python_server.metrics import metrics
+
+# In-process dispatch of batched API requests.
+#
+# POST /api/batch carries a list of sub-requests:
+#   {"requests": [{"id": "tasks", "method": "GET", "path": "/api/tasks"},
+#                 {"id": "new", "method": "POST", "path": "/api/tasks", "body": {...}},
+#                 {"id": "after", "path": "/api/tasks", "dependsOn": ["new"]}]}
+# Each runs through the app's own view function in a request context of its
+# own, skipping the per-request hooks (logging, compression) that the batch
+# request itself already pays. Sub-requests without dependsOn run
+# concurrently on a shared pool, so one slow call does not hold back the
+# others; dependsOn may only name earlier items, and an item whose
+# dependency failed is answered with 424 without running.
+#
+# Sub-requests to AI routes (the caller tags each item with its request
+# class) run on a smaller pool of their own: a few batches full of
+# generation calls can then only wait on each other, never take every
+# worker from the CRUD items of other batches.
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "20"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+BATCH_AI_WORKERS = int(os.getenv("BATCH_AI_WORKERS", "2"))
+
+# Sub-request headers worth passing back to the client, besides X-*
+FORWARDED_HEADERS = ("Location", "Retry-After", "Last-Modified", "Cache-Control", "ETag")
+
+class BatchError(ValueError):
+    pass
+
+# Validate a batch body into a list of normalized sub-requests
+def parse_batch(data: Any) -> List[Dict[str, Any]]:
+    items = data.get("requests") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError("A non-empty requests array is required")
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise BatchError(f"At most {BATCH_MAX_REQUESTS} requests can be batched")
+
+    parsed: List[Dict[str, Any]] = []
+    seen = set()
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str):
+            raise BatchError(f"Request {position} needs a path")
+        item_id = str(item.get("id", position))
+        if item_id in seen:
+            raise BatchError(f"Duplicate request id {item_id}")
+        path = item["path"]
+        if not path.startswith("/api/") or path.split("?")[0].rstrip("/") == "/api/batch":
+            raise BatchError(f"Request {item_id} must target an /api route other than /api/batch")
+        depends_on = [str(dep) for dep in item.get("dependsOn") or []]
+        for dep in depends_on:
+            if dep not in seen:
+                raise BatchError(f"Request {item_id} depends on {dep}, which is not an earlier request")
+        seen.add(item_id)
+        parsed.append({
+            "id": item_id,
+            "method": str(item.get("method", "GET")).upper(),
+            "path": path,
+            "body": item.get("body"),
+            "headers": item.get("headers") or {},
+            "dependsOn": depends_on
+        })
+    return parsed
+
+class BatchDispatcher:
+    def __init__(self, workers: int = BATCH_WORKERS, ai_workers: int = BATCH_AI_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch")
+        self.ai_executor = ThreadPoolExecutor(max_workers=max(1, ai_workers), thread_name_prefix="batch-ai")
+
+    # Run the sub-requests and return their results in request order. Must
+    # be called inside the batch request, whose context (user, deadline)
+    # every sub-request inherits
+    def run(self, app: Flask, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        futures: Dict[str, Future] = {}
+        for item in items:
+            # Both pools are FIFO and items only wait on earlier ones, so a
+            # waiting item never blocks the work it waits for
+            context = contextvars.copy_context()
+            dependencies = [futures[dep] for dep in item["dependsOn"]]
+            executor = self.ai_executor if item.get("class") == "ai" else self.executor
+            futures[item["id"]] = executor.submit(context.run, self._run_item, app, item, dependencies)
+        metrics.observe("batch.size", len(items))
+        return [futures[item["id"]].result() for item in items]
+
+    def _run_item(self, app: Flask, item: Dict[str, Any], dependencies: List[Future]) -> Dict[str, Any]:
+        for dependency in dependencies:
+            if dependency.result()["status"] >= 400:
+                return self._result(item, 424, {"message": "A request this one depends on failed"})
+
+        started = time.perf_counter()
+        with app.test_request_context(
+            item["path"],
+            method=item["method"],
+            json=item["body"] if item["body"] is not None else None,
+            headers=item["headers"]
+        ):
+            try:
+                response = app.make_response(app.dispatch_request())
+            except HTTPException as e:
+                return self._result(item, e.code or 500, {"message": e.description})
+            except Exception as e:
+                print(f"Error in batched request {item['method']} {item['path']}:", str(e))
+                return self._result(item, 500, {"message": str(e)})
+
+        metrics.observe("batch.item_ms", (time.perf_counter() - started) * 1000)
+        if response.mimetype == "text/event-stream":
+            response.close()
+            return self._result(item, 400, {"message": "Streaming endpoints cannot be batched"})
+
+        body = response.get_json(silent=True)
+        if body is None:
+            body = response.get_data(as_text=True)
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name in FORWARDED_HEADERS or name.startswith("X-")
+        }
+        return self._result(item, response.status_code, body, headers)
+
+    @staticmethod
+    def _result(item: Dict[str, Any], status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        result = {"id": item["id"], "status": status, "body": body}
+        if headers:
+            result["headers"] = headers
+        return result
+
+# Shared dispatcher used by the app
+batch_dispatcher = BatchDispatcher()
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from typing import Dict
+
+from python_server.metrics import metrics
+
+# Bulkheads between classes of requests.
+#
+# A request holds a server thread for as long as it runs, and AI routes run
+# for seconds. Each request class gets its own bounded pool of slots: at
+# most `concurrency` requests of the class run at once, at most `queue`
+# more wait (up to `queue_timeout` seconds) for a slot, and anything beyond
+# that is shed at once with 503 and Retry-After. With the AI pool sized
+# below the server's thread count, a burst of generation requests can only
+# ever occupy part of the server and CRUD requests keep their threads.
+#
+# Per-pool gauges (active, waiting, saturation) and counters (admitted,
+# shed, timed out) appear in /api/metrics under bulkhead.<pool>.*.
+
+BULKHEADS_ENABLED = os.getenv("BULKHEADS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+class Bulkhead:
+    def __init__(self, name: str, concurrency: int, queue: int, queue_timeout: float, retry_after: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+        metrics.register_gauge(f"bulkhead.{name}.active", lambda: self.active)
+        metrics.register_gauge(f"bulkhead.{name}.waiting", lambda: self.waiting)
+        metrics.register_gauge(f"bulkhead.{name}.saturation", self.saturation)
+
+    # Share of the pool in use, counting the queue: above 1.0 means
+    # requests are waiting
+    def saturation(self) -> float:
+        return round((self.active + self.waiting) / self.concurrency, 2)
+
+    # Take a slot, waiting in the bounded queue if need be. False means the
+    # request is shed
+    def acquire(self) -> bool:
+        with self.condition:
+            if self.active < self.concurrency and not self.waiting:
+                self.active += 1
+                metrics.incr(f"bulkhead.{self.name}.admitted")
+                return True
+            if self.waiting >= self.queue:
+                metrics.incr(f"bulkhead.{self.name}.shed")
+                return False
+
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+            self.waiting += 1
+            try:
+                while self.active >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.incr(f"bulkhead.{self.name}.timed_out")
+                        return False
+                    self.condition.wait(remaining)
+                self.active += 1
+            finally:
+                self.waiting -= 1
+            metrics.incr(f"bulkhead.{self.name}.admitted")
+            metrics.observe(f"bulkhead.{self.name}.wait_ms", (time.monotonic() - started) * 1000)
+            return True
+
+    def release(self) -> None:
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+def _pool(name: str, concurrency: int, queue: int, queue_timeout: float, retry_after: int) -> Bulkhead:
+    prefix = f"BULKHEAD_{name.upper()}"
+    return Bulkhead(
+        name,
+        int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+        int(os.getenv(f"{prefix}_QUEUE", str(queue))),
+        float(os.getenv(f"{prefix}_QUEUE_TIMEOUT_SECONDS", str(queue_timeout))),
+        retry_after
+    )
+
+# Shared pools used by the app:
+#   crud - cheap reads and writes against storage
+#   ai   - routes that call Gemini (or wait on a job that does)
+#   bulk - long streaming transfers such as export and import
+bulkheads: Dict[str, Bulkhead] = {
+    "crud": _pool("crud", concurrency=32, queue=64, queue_timeout=2.0, retry_after=1),
+    "ai": _pool("ai", concurrency=4, queue=4, queue_timeout=5.0, retry_after=5),
+    "bulk": _pool("bulk", concurrency=2, queue=2, queue_timeout=5.0, retry_after=10)
+}
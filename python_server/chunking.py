@@ -0,0 +1,127 @@
+import asyncio
+import math
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, TypeVar
+
+from python_server.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+# Map-reduce helpers for notes too large for a single prompt.
+#
+# Notes are split on markdown headings first, then on blank-line paragraphs,
+# then on sentences, and packed greedily into chunks under a token budget so
+# each chunk keeps its surrounding section. Chunks are processed with
+# bounded concurrency and the results merged back in document order.
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+HEADING = re.compile(r"^(?=#{1,6}\s)", re.MULTILINE)
+PARAGRAPH = re.compile(r"\n\s*\n")
+SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+
+    for pattern, joiner in ((PARAGRAPH, "\n\n"), (SENTENCE, " ")):
+        parts = [part for part in pattern.split(text) if part.strip()]
+        if len(parts) > 1:
+            pieces: List[str] = []
+            for part in parts:
+                pieces.extend(_split_oversized(part, max_tokens))
+            return _pack(pieces, max_tokens, joiner)
+
+    # A single run-on sentence: cut it at the character budget
+    size = max_tokens * CHARS_PER_TOKEN
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+# Greedily join consecutive pieces while they fit in the budget
+def _pack(pieces: Sequence[str], max_tokens: int, joiner: str) -> List[str]:
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(joiner.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append(joiner.join(current))
+    return chunks
+
+def split_notes(notes: str, max_tokens: int) -> List[str]:
+    if estimate_tokens(notes) <= max_tokens:
+        return [notes]
+
+    sections = [section.strip("\n") for section in HEADING.split(notes) if section.strip()]
+    pieces: List[str] = []
+    for section in sections:
+        pieces.extend(_split_oversized(section, max_tokens))
+    return _pack(pieces, max_tokens, "\n\n")
+
+# Run fn over every item with at most `concurrency` calls in flight. Results
+# keep the input order; a failed item yields its exception instead.
+async def map_chunks(
+    fn: Callable[[T], Awaitable[R]],
+    items: Sequence[T],
+    concurrency: int
+) -> List[Any]:
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await fn(item)
+
+    return await asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+
+# Split `count` flashcards across chunks in proportion to their size
+def allocate_counts(count: int, chunks: Sequence[str]) -> List[int]:
+    total = sum(estimate_tokens(chunk) for chunk in chunks) or 1
+    return [max(1, math.ceil(count * estimate_tokens(chunk) / total)) for chunk in chunks]
+
+def _normalize(text: str) -> str:
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+# Merge per-chunk flashcards, dropping repeated questions and trimming to count
+def merge_flashcards(results: Sequence[List[Dict[str, str]]], count: int) -> List[Dict[str, str]]:
+    seen = set()
+    merged: List[Dict[str, str]] = []
+    for flashcards in results:
+        for card in flashcards:
+            key = _normalize(card.get("question", ""))
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            merged.append(card)
+    return merged[:count]
+
+# Stitch per-chunk enhanced notes back together in order and merge the
+# concept and resource lists without repeats
+def merge_enhanced_notes(results: Sequence[Dict[str, Any]], max_concepts: int = 8) -> Dict[str, Any]:
+    sections: List[str] = []
+    concepts: List[str] = []
+    resources: List[Dict[str, Any]] = []
+    seen_concepts = set()
+    seen_resources = set()
+
+    for result in results:
+        if result.get("enhancedNotes"):
+            sections.append(result["enhancedNotes"].strip())
+        for concept in result.get("keyConcepts", []):
+            key = _normalize(concept)
+            if key and key not in seen_concepts:
+                seen_concepts.add(key)
+                concepts.append(concept)
+        for resource in result.get("additionalResources", []):
+            key = _normalize(resource.get("title", ""))
+            if key and key not in seen_resources:
+                seen_resources.add(key)
+                resources.append(resource)
+
+    return {
+        "enhancedNotes": "\n\n".join(sections),
+        "keyConcepts": concepts[:max_concepts],
+        "additionalResources": resources
+    }
@@ -0,0 +1,225 @@
+import asyncio
+import os
+import re
+import threading
+import uuid
+from concurrent.futures import Future
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from python_server.gemini_service import expand_concept, generate_concept_map
+from python_server.layout import layout_concept_map
+from python_server.metrics import metrics
+
+# Concept maps kept per user and topic, grown on demand.
+#
+# The first request for a topic generates a shallow map (main concept and
+# its key sub-concepts). Expanding a node asks Gemini for that node's
+# children only and merges them into the stored graph: the model's ids are
+# remapped onto the graph's own, and a child whose label already exists in
+# the map is linked to the existing node instead of being duplicated.
+# Expanded nodes are remembered, so drilling into the same concept again
+# costs nothing, and concurrent expansions of one node share a single call.
+
+CONCEPT_GRAPH_MAX_MAPS = int(os.getenv("CONCEPT_GRAPH_MAX_MAPS", "500"))
+CONCEPT_EXPAND_COUNT = 3
+
+def _normalize(label: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", label.lower()).strip()
+
+class ConceptGraph:
+    def __init__(self, graph_id: str, user_id: int, topic: str):
+        self.id = graph_id
+        self.user_id = user_id
+        self.topic = topic
+        # Nodes in insertion order, so the main concept stays first
+        self.nodes: Dict[str, Dict[str, Any]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.parent: Dict[str, str] = {}
+        self.labels: Dict[str, str] = {}
+        self.edges: List[Tuple[str, str]] = []
+        self.edge_set: Set[Tuple[str, str]] = set()
+        self.expanded: Set[str] = set()
+        # Expansions under way, by node: later callers wait for their
+        # result instead of calling Gemini again
+        self.expanding: Dict[str, "Future[List[Dict[str, Any]]]"] = {}
+        self.next_id = 1
+        self.lock = threading.RLock()
+
+    # Merge generated nodes and edges (in the model's own ids) into the
+    # graph, hanging any node without a parent under parent_id. Returns the
+    # ids of the nodes that were actually added
+    def merge(self, parent_id: Optional[str], nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> List[str]:
+        with self.lock:
+            remap: Dict[str, str] = {}
+            added: List[str] = []
+            for node in nodes:
+                label = node.get("label")
+                if not label:
+                    continue
+                key = _normalize(label)
+                existing = self.labels.get(key)
+                if existing is not None:
+                    remap[str(node.get("id"))] = existing
+                    continue
+                node_id = str(self.next_id)
+                self.next_id += 1
+                self.nodes[node_id] = {
+                    "id": node_id,
+                    "label": label,
+                    "description": node.get("description", ""),
+                    "bulletPoints": node.get("bulletPoints", [])
+                }
+                self.children[node_id] = []
+                self.labels[key] = node_id
+                remap[str(node.get("id"))] = node_id
+                added.append(node_id)
+
+            for edge in edges:
+                self._link(remap.get(str(edge.get("source"))), remap.get(str(edge.get("target"))))
+
+            if parent_id is not None:
+                # Never link back up to one of the parent's own ancestors
+                ancestors = self._ancestors(parent_id)
+                for node in nodes:
+                    node_id = remap.get(str(node.get("id")))
+                    if node_id is not None and node_id not in ancestors:
+                        self._link(parent_id, node_id)
+            return added
+
+    def _ancestors(self, node_id: str) -> Set[str]:
+        seen: Set[str] = set()
+        current: Optional[str] = node_id
+        while current is not None and current not in seen:
+            seen.add(current)
+            current = self.parent.get(current)
+        return seen
+
+    def _link(self, source: Optional[str], target: Optional[str]) -> None:
+        if source is None or target is None or source == target:
+            return
+        if (source, target) in self.edge_set or (target, source) in self.edge_set:
+            return
+        self.edges.append((source, target))
+        self.edge_set.add((source, target))
+        self.children[source].append(target)
+        self.parent.setdefault(target, source)
+
+    # Labels from the main concept down to a node
+    def path(self, node_id: str) -> List[str]:
+        with self.lock:
+            labels: List[str] = []
+            current: Optional[str] = node_id
+            for _ in range(len(self.nodes)):
+                if current is None:
+                    break
+                labels.append(self.nodes[current]["label"])
+                current = self.parent.get(current)
+            return labels[::-1]
+
+    def child_labels(self, node_id: str) -> List[str]:
+        with self.lock:
+            return [self.nodes[child]["label"] for child in self.children.get(node_id, [])]
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            nodes = [{**node, "expanded": node_id in self.expanded} for node_id, node in self.nodes.items()]
+            edges = [{"source": source, "target": target} for source, target in self.edges]
+        layout_concept_map(nodes, edges)
+        return {"mapId": self.id, "topic": self.topic, "nodes": nodes, "edges": edges}
+
+class ConceptGraphStore:
+    def __init__(self, max_maps: int = CONCEPT_GRAPH_MAX_MAPS):
+        self.max_maps = max(1, max_maps)
+        self.graphs: "OrderedDict[str, ConceptGraph]" = OrderedDict()
+        self.by_topic: Dict[Tuple[int, str], str] = {}
+        self.lock = threading.Lock()
+
+    def get(self, graph_id: str) -> Optional[ConceptGraph]:
+        with self.lock:
+            graph = self.graphs.get(graph_id)
+            if graph is not None:
+                self.graphs.move_to_end(graph_id)
+            return graph
+
+    def find(self, user_id: int, topic: str) -> Optional[ConceptGraph]:
+        with self.lock:
+            graph_id = self.by_topic.get((user_id, _normalize(topic)))
+        return self.get(graph_id) if graph_id else None
+
+    # Store a freshly generated map, replacing any earlier one for the topic
+    def create(self, user_id: int, topic: str, concept_map: Dict[str, Any]) -> ConceptGraph:
+        graph = ConceptGraph(uuid.uuid4().hex, user_id, topic)
+        nodes = concept_map.get("nodes", [])
+        graph.merge(None, nodes, concept_map.get("edges", []))
+        if graph.nodes:
+            # The main concept arrives with its children
+            graph.expanded.add(next(iter(graph.nodes)))
+
+        with self.lock:
+            previous = self.by_topic.get((user_id, _normalize(topic)))
+            if previous is not None:
+                self.graphs.pop(previous, None)
+            while len(self.graphs) >= self.max_maps:
+                evicted_id, evicted = self.graphs.popitem(last=False)
+                self.by_topic.pop((evicted.user_id, _normalize(evicted.topic)), None)
+            self.graphs[graph.id] = graph
+            self.by_topic[(user_id, _normalize(topic))] = graph.id
+        return graph
+
+# Stored map for a topic, generating (and storing) a shallow one when there
+# is none yet. Maps built from the caller's notes are always regenerated
+async def concept_map_for(user_id: int, topic: str, notes: Optional[str] = None, refresh: bool = False) -> Dict[str, Any]:
+    if not notes and not refresh:
+        graph = concept_graphs.find(user_id, topic)
+        if graph is not None:
+            metrics.incr("concept_graph.hits")
+            return graph.to_dict()
+
+    metrics.incr("concept_graph.misses")
+    concept_map = await generate_concept_map(topic, notes)
+    if concept_map.get("fallback"):
+        # Not worth keeping; the next request tries Gemini again
+        return concept_map
+    return concept_graphs.create(user_id, topic, concept_map).to_dict()
+
+# Generate children for one node and merge them into its map
+async def expand_node(graph: ConceptGraph, node_id: str, count: int = CONCEPT_EXPAND_COUNT) -> Dict[str, Any]:
+    with graph.lock:
+        expanded = node_id in graph.expanded
+        pending = graph.expanding.get(node_id)
+        if not expanded and pending is None:
+            # Jobs run on their own event loops, so a thread-safe future
+            graph.expanding[node_id] = result = Future()
+    if expanded:
+        metrics.incr("concept_graph.expand_hits")
+        return {**graph.to_dict(), "added": []}
+    if pending is not None:
+        metrics.incr("concept_graph.expand_joined")
+        added = await asyncio.wrap_future(pending)
+        return {**graph.to_dict(), "added": added}
+
+    metrics.incr("concept_graph.expansions")
+    try:
+        children = await expand_concept(
+            graph.topic,
+            graph.path(node_id),
+            graph.nodes[node_id],
+            graph.child_labels(node_id),
+            count
+        )
+        added = graph.merge(node_id, children, [])
+    except BaseException as e:
+        with graph.lock:
+            graph.expanding.pop(node_id, None)
+        result.set_exception(e)
+        raise
+    with graph.lock:
+        if children:
+            graph.expanded.add(node_id)
+        graph.expanding.pop(node_id, None)
+    result.set_result(added)
+    return {**graph.to_dict(), "added": added}
+
+# Shared instance used by the app
+concept_graphs = ConceptGraphStore()
@@ -0,0 +1,46 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Optional, TypeVar
+
+from python_server.metrics import metrics
+
+# Per-request deadlines.
+#
+# The app sets an absolute deadline when a request starts; anything that
+# waits on upstream work (Gemini calls, queue slots, retries) runs under the
+# time that is left, so a slow model cannot hold a worker past the point
+# where the caller has given up.
+
+T = TypeVar("T")
+
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+def set_deadline(seconds: Optional[float]) -> None:
+    request_deadline.set(time.monotonic() + seconds if seconds is not None else None)
+
+# Seconds left before the current deadline, or None when there is none
+def remaining() -> Optional[float]:
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+# Await under the current deadline, cancelling the work when it expires
+async def with_deadline(awaitable: Awaitable[T]) -> T:
+    budget = remaining()
+    if budget is None:
+        return await awaitable
+    if budget <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        metrics.incr("deadline.exceeded")
+        raise DeadlineExceeded("Request deadline already passed")
+    try:
+        return await asyncio.wait_for(awaitable, budget)
+    except asyncio.TimeoutError:
+        metrics.incr("deadline.exceeded")
+        raise DeadlineExceeded(f"Request deadline exceeded after {budget:.1f}s")
@@ -0,0 +1,235 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Read-only shared flashcard decks in a memory-mapped binary format.
+#
+# A deck file is:
+#   header   magic, version, deck id, set count, card count
+#   sets     one record per set: metadata blob (offset, length), first card
+#            index, card count; a set's cards are contiguous
+#   cards    one fixed-size record per card: set index, question and answer
+#            blobs (offset, length)
+#   blob     UTF-8 strings; set metadata is a small JSON object
+# Files are opened with mmap, so every worker process maps the same page
+# cache pages and nothing is copied until a card is actually read. Lookups
+# go straight to a record by index; listing a set decodes only its cards.
+#
+# Shared ids live far above anything MemStorage hands out: deck d's set s
+# is SHARED_ID_BASE + d * DECK_ID_SPAN + s, and its cards are numbered the
+# same way (sets and cards are separate id spaces, as in storage). Users'
+# proficiency on shared cards is kept in a ProgressOverlay, never in the
+# deck.
+
+SHARED_DECKS_DIR = os.getenv("SHARED_DECKS_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "decks"))
+
+SHARED_ID_BASE = 10 ** 12
+DECK_ID_SPAN = 10 ** 7
+
+MAGIC = b"IDECK\x00\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sIIII")
+SET_RECORD = struct.Struct("<QIII")
+CARD_RECORD = struct.Struct("<IQIQI")
+
+class DeckFormatError(ValueError):
+    pass
+
+def is_shared_id(id: Any) -> bool:
+    return isinstance(id, int) and id >= SHARED_ID_BASE
+
+# Write a deck file from sets of the form
+#   {"title", "description", "subject", "tags", "cards": [{"question", "answer"}]}
+def build_deck(path: str, deck_id: int, sets: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+    if not 0 <= deck_id < (2 ** 53 - SHARED_ID_BASE) // DECK_ID_SPAN:
+        raise DeckFormatError(f"Deck id {deck_id} out of range")
+    blob = bytearray()
+    set_records: List[bytes] = []
+    card_records: List[bytes] = []
+
+    def put(text: str) -> Tuple[int, int]:
+        data = (text or "").encode("utf-8")
+        offset = len(blob)
+        blob.extend(data)
+        return offset, len(data)
+
+    for set_index, deck_set in enumerate(sets):
+        meta = {key: deck_set.get(key) for key in ("title", "description", "subject", "tags")}
+        meta_offset, meta_length = put(json.dumps(meta, separators=(",", ":")))
+        first_card = len(card_records)
+        for card in deck_set.get("cards", []):
+            question = put(card.get("question", ""))
+            answer = put(card.get("answer", ""))
+            card_records.append(CARD_RECORD.pack(set_index, *question, *answer))
+        set_records.append(SET_RECORD.pack(meta_offset, meta_length, first_card, len(card_records) - first_card))
+    if len(set_records) > DECK_ID_SPAN or len(card_records) > DECK_ID_SPAN:
+        raise DeckFormatError(f"A deck holds at most {DECK_ID_SPAN} sets and cards")
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, deck_id, len(set_records), len(card_records)))
+        file.write(b"".join(set_records))
+        file.write(b"".join(card_records))
+        file.write(blob)
+    os.replace(temporary, path)
+    return len(set_records), len(card_records)
+
+class Deck:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise DeckFormatError(f"{path} is too short to be a deck")
+        magic, version, self.deck_id, self.set_count, self.card_count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise DeckFormatError(f"{path} is not a version {VERSION} deck")
+        self.sets_at = HEADER.size
+        self.cards_at = self.sets_at + self.set_count * SET_RECORD.size
+        self.blob_at = self.cards_at + self.card_count * CARD_RECORD.size
+        if self.blob_at > len(self.map):
+            raise DeckFormatError(f"{path} is truncated")
+        self.id_base = SHARED_ID_BASE + self.deck_id * DECK_ID_SPAN
+
+    def _text(self, offset: int, length: int) -> str:
+        start = self.blob_at + offset
+        return self.map[start:start + length].decode("utf-8")
+
+    def _set_record(self, index: int) -> Tuple[int, int, int, int]:
+        return SET_RECORD.unpack_from(self.map, self.sets_at + index * SET_RECORD.size)
+
+    def get_set(self, index: int) -> Dict[str, Any]:
+        meta_offset, meta_length, _, card_count = self._set_record(index)
+        meta = json.loads(self._text(meta_offset, meta_length))
+        return {
+            **meta,
+            "id": self.id_base + index,
+            "userId": None,
+            "createdAt": None,
+            "readOnly": True,
+            "cardCount": card_count
+        }
+
+    def get_card(self, index: int) -> Dict[str, Any]:
+        set_index, question_offset, question_length, answer_offset, answer_length = CARD_RECORD.unpack_from(
+            self.map, self.cards_at + index * CARD_RECORD.size
+        )
+        return {
+            "id": self.id_base + index,
+            "setId": self.id_base + set_index,
+            "question": self._text(question_offset, question_length),
+            "answer": self._text(answer_offset, answer_length),
+            "lastReviewed": None,
+            "proficiency": None
+        }
+
+    def set_cards(self, index: int) -> List[Dict[str, Any]]:
+        _, _, first_card, card_count = self._set_record(index)
+        return [self.get_card(card) for card in range(first_card, first_card + card_count)]
+
+    def close(self) -> None:
+        self.map.close()
+
+class DeckLibrary:
+    def __init__(self, directory: str = SHARED_DECKS_DIR):
+        self.directory = directory
+        self.decks: Dict[int, Deck] = {}
+        self.load()
+
+    # Map every *.deck file in the directory; a missing directory is an
+    # empty library
+    def load(self) -> None:
+        decks: Dict[int, Deck] = {}
+        if os.path.isdir(self.directory):
+            for name in sorted(os.listdir(self.directory)):
+                if not name.endswith(".deck"):
+                    continue
+                try:
+                    deck = Deck(os.path.join(self.directory, name))
+                except (OSError, DeckFormatError) as e:
+                    print(f"Error loading shared deck {name}: {e}")
+                    continue
+                if deck.deck_id in decks:
+                    print(f"Skipping shared deck {name}: deck id {deck.deck_id} is already loaded")
+                    deck.close()
+                    continue
+                decks[deck.deck_id] = deck
+        self.decks = decks
+        if decks:
+            cards = sum(deck.card_count for deck in decks.values())
+            print(f"Mapped {len(decks)} shared decks ({cards} cards) from {self.directory}")
+
+    def _locate(self, id: int, count_attr: str) -> Optional[Tuple[Deck, int]]:
+        if not is_shared_id(id):
+            return None
+        deck_id, index = divmod(id - SHARED_ID_BASE, DECK_ID_SPAN)
+        deck = self.decks.get(deck_id)
+        if deck is None or index >= getattr(deck, count_attr):
+            return None
+        return deck, index
+
+    def get_sets(self) -> List[Dict[str, Any]]:
+        return [deck.get_set(index) for deck in self.decks.values() for index in range(deck.set_count)]
+
+    def get_set(self, set_id: int) -> Optional[Dict[str, Any]]:
+        located = self._locate(set_id, "set_count")
+        return located[0].get_set(located[1]) if located else None
+
+    def get_cards(self, set_id: int) -> List[Dict[str, Any]]:
+        located = self._locate(set_id, "set_count")
+        return located[0].set_cards(located[1]) if located else []
+
+    def get_card(self, card_id: int) -> Optional[Dict[str, Any]]:
+        located = self._locate(card_id, "card_count")
+        return located[0].get_card(located[1]) if located else None
+
+# Per-user review state for shared cards, applied over the deck's copy
+class ProgressOverlay:
+    FIELDS = ("proficiency", "lastReviewed")
+
+    def __init__(self):
+        self.entries: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def apply(self, user_id: Optional[int], card: Dict[str, Any]) -> Dict[str, Any]:
+        if user_id is not None:
+            entry = self.entries.get((user_id, card["id"]))
+            if entry:
+                card.update(entry)
+        return card
+
+    # Record review fields; returns the previous and new entry
+    def update(self, user_id: int, card_id: int, fields: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        with self.lock:
+            previous = self.entries.get((user_id, card_id))
+            entry = {**(previous or {}), **{key: fields[key] for key in self.FIELDS if key in fields}}
+            self.entries[(user_id, card_id)] = entry
+            return previous, entry
+
+# Build a deck from an NDJSON export (see transfer.py):
+#   python -m python_server.decks export.ndjson decks/biology.deck 1
+def main(argv: List[str]) -> None:
+    if len(argv) != 3:
+        print("usage: python -m python_server.decks <export.ndjson> <output.deck> <deck id>")
+        sys.exit(2)
+    source, output, deck_id = argv[0], argv[1], int(argv[2])
+    sets: Dict[Any, Dict[str, Any]] = {}
+    with open(source, "rb") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            data = item.get("data") or {}
+            if item.get("type") == "flashcard_set":
+                sets[data.get("id")] = {**data, "cards": []}
+            elif item.get("type") == "flashcard" and data.get("setId") in sets:
+                sets[data["setId"]]["cards"].append(data)
+    set_count, card_count = build_deck(output, deck_id, sets.values())
+    print(f"Wrote {set_count} sets and {card_count} cards to {output}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,224 @@
+import os
+import re
+import threading
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from python_server.metrics import timed
+from python_server.storage import MemStorage, storage
+
+# Near-duplicate detection for flashcards.
+#
+# Each card is reduced to a set of shingles (word bigrams of the question,
+# word trigrams of the start of the answer) and a MinHash signature over
+# them. Signatures are split into LSH bands; cards sharing a band land in
+# the same bucket, so a lookup only compares against the handful of cards
+# it collides with instead of every card the user owns. Candidates are
+# confirmed by the Jaccard similarity their signatures estimate.
+#
+# The index is per user (duplicates are looked for across all of a user's
+# sets) and follows storage's mutation hooks. A user's cards are indexed on
+# the first lookup for that user rather than at import, so startup does not
+# pay for every card in storage.
+
+FLASHCARD_DEDUP = os.getenv("FLASHCARD_DEDUP", "flag")  # flag | drop | off
+DEDUP_THRESHOLD = float(os.getenv("FLASHCARD_DEDUP_THRESHOLD", "0.6"))
+
+# 8 bands of 4 rows put the LSH threshold near a Jaccard similarity of 0.6
+NUM_PERMUTATIONS = 32
+BANDS = 8
+ROWS = NUM_PERMUTATIONS // BANDS
+ANSWER_SHINGLE_WORDS = 50
+# Bound on candidates verified per lookup, should a bucket grow large
+MAX_CANDIDATES = 64
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; products
+# stay below 2^64 so uint64 arithmetic is exact
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, 4294967291, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+_B = _rng.integers(0, 4294967291, NUM_PERMUTATIONS, dtype=np.uint64)[:, None]
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def shingles(question: str, answer: str) -> Set[str]:
+    question_words = _WORD.findall((question or "").lower())
+    answer_words = _WORD.findall((answer or "").lower())[:ANSWER_SHINGLE_WORDS]
+    result = {f"q {a} {b}" for a, b in zip(question_words, question_words[1:])}
+    result.update(f"a {a} {b} {c}" for a, b, c in zip(answer_words, answer_words[1:], answer_words[2:]))
+    # Very short questions still need something to compare
+    if len(question_words) < 2:
+        result.update(f"q {word}" for word in question_words)
+    return result
+
+def signature(question: str, answer: str) -> Optional[np.ndarray]:
+    items = shingles(question, answer)
+    if not items:
+        return None
+    hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) for item in items), dtype=np.uint64, count=len(items))
+    return ((_A * hashes + _B) % _PRIME).min(axis=1).astype(np.uint32)
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / NUM_PERMUTATIONS
+
+class DedupIndex:
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        # Card id -> (user id, signature bytes)
+        self.cards: Dict[int, Tuple[int, bytes]] = {}
+        # Bucket key -> card id, or a set of ids once a bucket is shared;
+        # plain ints keep the million-card case at a few hundred bytes a card
+        self.buckets: Dict[int, Union[int, Set[int]]] = {}
+        self.source: Optional[MemStorage] = None
+        # Users whose cards are in the index
+        self.indexed: Set[int] = set()
+        self.lock = threading.Lock()
+
+    # Follow storage's mutations; existing cards are indexed per user as
+    # they are first looked up
+    def attach(self, source: MemStorage) -> None:
+        self.source = source
+        source.subscribe(self.on_mutation)
+
+    # Index the user's stored cards unless that already happened. Done under
+    # the lock with the user marked first, so a card changed meanwhile is
+    # either in the snapshot or applied by its hook right after
+    def _ensure_user(self, user_id: int) -> None:
+        if self.source is None or user_id in self.indexed:
+            return
+        with self.lock:
+            if user_id in self.indexed:
+                return
+            with timed("flashcards.dedup_index_user_ms"):
+                self.indexed.add(user_id)
+                set_ids = {flashcard_set["id"] for flashcard_set in self.source.get_flashcard_sets(user_id)}
+                for card in list(self.source.flashcards.values()):
+                    if card.get("setId") not in set_ids:
+                        continue
+                    sig = signature(card.get("question", ""), card.get("answer", ""))
+                    if sig is not None:
+                        self._insert(card["id"], user_id, sig)
+
+    def _owner(self, card: Dict[str, Any]) -> Optional[int]:
+        flashcard_set = self.source.get_flashcard_set_by_id(card.get("setId"))
+        return flashcard_set["userId"] if flashcard_set else None
+
+    # One key per band; hash collisions only add candidates, which are
+    # verified anyway
+    @staticmethod
+    def _bucket_keys(user_id: int, sig: np.ndarray) -> List[int]:
+        return [hash((user_id, band, sig[band * ROWS:(band + 1) * ROWS].tobytes())) for band in range(BANDS)]
+
+    def on_mutation(self, entity: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        if entity != "flashcard":
+            return
+        if before is not None:
+            self.remove(before["id"])
+        if after is not None:
+            user_id = self._owner(after)
+            if user_id is not None and user_id in self.indexed:
+                self.add(after["id"], user_id, after.get("question", ""), after.get("answer", ""))
+
+    def add(self, card_id: int, user_id: int, question: str, answer: str) -> None:
+        sig = signature(question, answer)
+        if sig is None:
+            return
+        with self.lock:
+            self._insert(card_id, user_id, sig)
+
+    def _insert(self, card_id: int, user_id: int, sig: np.ndarray) -> None:
+        self._remove(card_id)
+        self.cards[card_id] = (user_id, sig.tobytes())
+        for key in self._bucket_keys(user_id, sig):
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                self.buckets[key] = card_id
+            elif isinstance(bucket, set):
+                bucket.add(card_id)
+            elif bucket != card_id:
+                self.buckets[key] = {bucket, card_id}
+
+    def remove(self, card_id: int) -> None:
+        with self.lock:
+            self._remove(card_id)
+
+    def _remove(self, card_id: int) -> None:
+        entry = self.cards.pop(card_id, None)
+        if entry is None:
+            return
+        user_id, sig = entry
+        for key in self._bucket_keys(user_id, np.frombuffer(sig, dtype=np.uint32)):
+            bucket = self.buckets.get(key)
+            if bucket == card_id:
+                del self.buckets[key]
+            elif isinstance(bucket, set):
+                bucket.discard(card_id)
+                if len(bucket) == 1:
+                    self.buckets[key] = bucket.pop()
+
+    def _matches(self, user_id: int, sig: np.ndarray, exclude: Optional[int] = None) -> List[Tuple[float, int]]:
+        candidates: Set[int] = set()
+        for key in self._bucket_keys(user_id, sig):
+            bucket = self.buckets.get(key)
+            if isinstance(bucket, set):
+                candidates.update(bucket)
+            elif bucket is not None:
+                candidates.add(bucket)
+            if len(candidates) >= MAX_CANDIDATES:
+                break
+        candidates.discard(exclude)
+        matches = []
+        for candidate in candidates:
+            owner, candidate_sig = self.cards[candidate]
+            if owner != user_id:
+                continue
+            score = similarity(sig, np.frombuffer(candidate_sig, dtype=np.uint32))
+            if score >= self.threshold:
+                matches.append((score, candidate))
+        return sorted(matches, key=lambda match: (-match[0], match[1]))
+
+    # Most similar existing card of the user's, if any is a near-duplicate
+    def find_duplicate(self, user_id: int, question: str, answer: str, exclude: Optional[int] = None) -> Optional[int]:
+        with timed("flashcards.dedup_check_ms"):
+            sig = signature(question, answer)
+            if sig is None:
+                return None
+            self._ensure_user(user_id)
+            with self.lock:
+                matches = self._matches(user_id, sig, exclude)
+        return matches[0][1] if matches else None
+
+    # Group a user's near-duplicate cards; the oldest card of each group is
+    # the one to keep
+    def duplicate_groups(self, user_id: int) -> List[Dict[str, Any]]:
+        self._ensure_user(user_id)
+        with self.lock:
+            owned = sorted(card_id for card_id, (owner, _) in self.cards.items() if owner == user_id)
+            parent = {card_id: card_id for card_id in owned}
+
+            def find(card_id: int) -> int:
+                while parent[card_id] != card_id:
+                    parent[card_id] = parent[parent[card_id]]
+                    card_id = parent[card_id]
+                return card_id
+
+            for card_id in owned:
+                sig = np.frombuffer(self.cards[card_id][1], dtype=np.uint32)
+                for _, match in self._matches(user_id, sig, card_id):
+                    a, b = find(card_id), find(match)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+
+        groups: Dict[int, List[int]] = {}
+        for card_id in owned:
+            groups.setdefault(find(card_id), []).append(card_id)
+        return [
+            {"keep": members[0], "duplicates": members[1:]}
+            for members in groups.values() if len(members) > 1
+        ]
+
+# Shared instance following the shared storage
+dedup_index = DedupIndex()
+dedup_index.attach(storage)
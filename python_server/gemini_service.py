@@ -1,40 +1,413 @@
 import os
-import json
-import re
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+import asyncio
+import threading
+import time
+from copy import deepcopy
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, AsyncIterator, Tuple
 from dotenv import load_dotenv
+from python_server.json_stream import JSONArrayStream
+from python_server.metrics import metrics, timed
+from python_server.structured_output import extract_json
+from python_server.tokens import estimate_tokens, record_usage, TOKENS_PER_FLASHCARD
+from python_server.prompts import PromptTemplate, get_prompt
+from python_server.llm_governor import governor
+from python_server.rate_limit import rate_limiter
+from python_server import tracing
+from python_server.deadline import with_deadline
+from python_server.layout import layout_concept_map
+from python_server.chunking import (
+    allocate_counts,
+    map_chunks,
+    merge_enhanced_notes,
+    merge_flashcards,
+    split_notes
+)
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the Google Generative AI client
-api_key = os.getenv("GEMINI_API_KEY", "dummy-key-for-development")
-genai.configure(api_key=api_key)
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+# The Google Generative AI SDK takes most of a second to import, the bulk
+# of a cold start, so it is imported and configured on the first AI call
+_genai = None
+_genai_lock = threading.Lock()
+
+def _sdk():
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                started = time.perf_counter()
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY", "dummy-key-for-development"))
+                metrics.observe("startup.genai_load_ms", (time.perf_counter() - started) * 1000)
+                _genai = genai
+    return _genai
 
 # Default Gemini model - as specified by user
 # Using gemini-2.0-flash as requested for optimal speed and quality
 MODEL_NAME = "gemini-2.0-flash"
 
+# "native" asks Gemini for application/json output constrained by a schema;
+# "text" leaves the model free-form and recovers JSON from the prose
+JSON_MODE = os.getenv("GEMINI_JSON_MODE", "native")
+
+# Response schemas (OpenAPI subset accepted by Gemini's response_schema)
+FLASHCARDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "flashcards": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "answer": {"type": "string"}
+                },
+                "required": ["question", "answer"]
+            }
+        }
+    },
+    "required": ["flashcards"]
+}
+
+RECOMMENDATIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recommendations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "description": {"type": "string"},
+                    "type": {"type": "string"},
+                    "icon": {"type": "string"}
+                },
+                "required": ["title", "description", "type", "icon"]
+            }
+        }
+    },
+    "required": ["recommendations"]
+}
+
+ENHANCED_NOTES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "enhancedNotes": {"type": "string"},
+        "keyConcepts": {"type": "array", "items": {"type": "string"}},
+        "additionalResources": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "type": {"type": "string"},
+                    "description": {"type": "string"}
+                },
+                "required": ["title"]
+            }
+        }
+    },
+    "required": ["enhancedNotes"]
+}
+
+CONCEPT_MAP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "nodes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "label": {"type": "string"},
+                    "description": {"type": "string"},
+                    "bulletPoints": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["id", "label"]
+            }
+        },
+        "edges": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "source": {"type": "string"},
+                    "target": {"type": "string"}
+                },
+                "required": ["source", "target"]
+            }
+        }
+    },
+    "required": ["nodes"]
+}
+
+CONCEPT_EXPAND_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "nodes": CONCEPT_MAP_SCHEMA["properties"]["nodes"]
+    },
+    "required": ["nodes"]
+}
+
+CONCEPT_FLASHCARDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "concepts": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "flashcards": FLASHCARDS_SCHEMA["properties"]["flashcards"]
+                },
+                "required": ["index", "flashcards"]
+            }
+        }
+    },
+    "required": ["concepts"]
+}
+
+# Token budgets for a single batched concept-flashcard call; output is the
+# binding limit since every card carries a 150-200 word answer
+BATCH_MAX_INPUT_TOKENS = int(os.getenv("BATCH_MAX_INPUT_TOKENS", "8000"))
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("BATCH_MAX_OUTPUT_TOKENS", "8000"))
+
+# Notes longer than this are split into chunks that are processed
+# concurrently (at most NOTES_CHUNK_CONCURRENCY at once) and merged
+NOTES_CHUNK_TOKENS = int(os.getenv("NOTES_CHUNK_TOKENS", "6000"))
+NOTES_CHUNK_CONCURRENCY = int(os.getenv("NOTES_CHUNK_CONCURRENCY", "4"))
+
+# Generation config requesting native JSON output for the given schema
+def _json_config(schema: Dict[str, Any]) -> Optional["genai.GenerationConfig"]:
+    if JSON_MODE != "native":
+        return None
+    return _sdk().GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=deepcopy(schema)
+    )
+
 # Helper function to extract JSON from text responses
-def extract_json_from_text(text: str) -> Any:
+def extract_json_from_text(text: str, schema: Optional[Dict[str, Any]] = None) -> Any:
     try:
-        # Try to find JSON-like content between curly braces
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group(0))
-        
-        # If no JSON with curly braces, try to find arrays
-        array_match = re.search(r'\[.*\]', text, re.DOTALL)
-        if array_match:
-            return json.loads(array_match.group(0))
-        
-        # If no parseable JSON found, throw error
-        raise ValueError("No valid JSON found in response")
+        with timed("llm.parse_ms"), tracing.span("gemini.parse", **{"gen_ai.response.chars": len(text or "")}):
+            return extract_json(text, schema)
     except Exception as e:
+        metrics.incr("llm.parse_errors")
         print("Error extracting JSON from text:", str(e))
         raise e
 
+def _record_response_usage(template: PromptTemplate, prompt: str, text: str, response: Any, started: float, span: Any) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt)
+    output_tokens = getattr(usage, "candidates_token_count", 0) or estimate_tokens(text)
+    record_usage(template.key, input_tokens, output_tokens, (time.perf_counter() - started) * 1000)
+    # Counted against the calling user's daily quota
+    rate_limiter.charge(input_tokens + output_tokens)
+    span.set("gen_ai.usage.input_tokens", input_tokens)
+    span.set("gen_ai.usage.output_tokens", output_tokens)
+
+# Attributes of the span recorded around each Gemini call
+def _span_attributes(template: PromptTemplate, stream: bool) -> Dict[str, Any]:
+    return {"gen_ai.system": "gemini", "gen_ai.request.model": MODEL_NAME, "gen_ai.prompt.name": template.key, "gen_ai.stream": stream}
+
+# Render a registered prompt, call Gemini for JSON output and record the
+# call's latency and token usage under the template's key
+async def _generate(name: str, schema: Dict[str, Any], **values: Any) -> str:
+    template = get_prompt(name)
+    prompt = template.render(**values)
+    model = _sdk().GenerativeModel(MODEL_NAME)
+    
+    started = time.perf_counter()
+    with tracing.span("gemini.generate", tracing.KIND_CLIENT, **_span_attributes(template, False)) as span:
+        # Runs under the request deadline; slow calls may be hedged
+        response = await with_deadline(governor.hedged_call(
+            lambda: model.generate_content_async(prompt, generation_config=_json_config(schema)),
+            governor.hedge_delay(name, f"llm.{template.key}.latency_ms")
+        ))
+        text = response.text
+        
+        _record_response_usage(template, prompt, text, response, started, span)
+    return text
+
+# Streaming variant of _generate yielding text chunks as they arrive
+async def _generate_stream(name: str, schema: Dict[str, Any], **values: Any) -> AsyncIterator[str]:
+    template = get_prompt(name)
+    prompt = template.render(**values)
+    model = _sdk().GenerativeModel(MODEL_NAME)
+    
+    started = time.perf_counter()
+    received: List[str] = []
+    # Not made current: each step of the generator may run in its own context
+    span = tracing.start_span("gemini.generate", tracing.KIND_CLIENT, **_span_attributes(template, True))
+    try:
+        async with governor.stream():
+            # The deadline bounds the wait for the stream to start
+            response = await with_deadline(model.generate_content_async(
+                prompt,
+                generation_config=_json_config(schema),
+                stream=True
+            ))
+            async for chunk in response:
+                received.append(chunk.text)
+                yield chunk.text
+        
+        _record_response_usage(template, prompt, "".join(received), response, started, span)
+    except Exception as e:
+        span.fail(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        span.end()
+
+# Fallback flashcards served when the Gemini call fails
+def _fallback_flashcards(subject: str) -> List[Dict[str, str]]:
+    return [
+        {
+            "question": f"What are the foundational principles and key dimensions of {subject}?",
+            "answer": f"{subject} represents a multifaceted domain encompassing several interconnected theoretical frameworks and practical applications. At its fundamental level, it integrates core principles that have evolved through significant scholarly discourse and empirical investigation. The conceptual foundation typically includes hierarchical structures of knowledge that range from basic definitional elements to sophisticated analytical frameworks. Understanding these principles requires examining both historical development and contemporary interpretations across multiple disciplinary perspectives. The integration of these varied approaches provides a more nuanced comprehension than any single theoretical model could offer in isolation."
+        },
+        {
+            "question": f"How has the understanding of {subject} evolved historically, and what are its contemporary applications?",
+            "answer": f"The historical trajectory of {subject} reflects a progressive refinement of ideas through several key intellectual periods. Early formulations often emerged from foundational work by pioneering scholars who established initial theoretical frameworks. Throughout subsequent decades, these conceptualizations underwent significant transformations as new methodological approaches and analytical techniques emerged. Contemporary applications span diverse domains including educational contexts, research methodologies, professional practices, and technological innovations. In each sphere, theoretical principles are translated into practical implementations that address specific challenges while maintaining conceptual integrity. This evolution demonstrates both continuity in core principles and adaptation to changing contextual requirements."
+        },
+        {
+            "question": f"What methodological approaches are employed in the study of {subject}, and what are their relative strengths?",
+            "answer": f"The methodological landscape for studying {subject} encompasses diverse approaches, each offering distinct advantages for understanding different facets of the domain. Quantitative methodologies provide statistical rigor and empirical validation through measurement and analysis of observable phenomena. Qualitative approaches offer depth through interpretive frameworks that explore contextual nuances and subjective dimensions. Mixed methods integrate these complementary perspectives to develop more comprehensive understanding. Theoretical analysis examines conceptual foundations and logical structures underpinning the subject, while applied research focuses on practical implementation and real-world outcomes. The selection of methodological approach depends on specific research questions, available resources, and the nature of the phenomena being investigated."
+        }
+    ]
+
+# Values for the concept map template, including the optional notes context
+def _concept_map_values(topic: str, notes: Optional[str]) -> Dict[str, str]:
+    note_context = get_prompt("concept_map_notes").render(notes=notes) + "\n\n" if notes else ""
+    return {"topic": topic, "note_context": note_context}
+
+# Fallback concept map served when the Gemini call fails
+def _fallback_concept_map(topic: str) -> Dict[str, Any]:
+    main_id = "1"
+    nodes = [
+        {
+            "id": main_id,
+            "label": topic,
+            "description": f"{topic} encompasses multiple interconnected concepts and principles that form a cohesive framework for understanding this domain.",
+            "bulletPoints": [
+                f"Core principles of {topic} serve as the foundation for all specialized applications",
+                f"Understanding {topic} requires examining both theoretical models and practical implementations",
+                f"The field of {topic} continues to evolve through ongoing research and new discoveries"
+            ]
+        }
+    ]
+    
+    edges = []
+    
+    # Generate some sub-concepts
+    sub_concepts = [
+        f"Fundamentals of {topic}",
+        f"Applications of {topic}",
+        f"Historical Development",
+        f"Current Research"
+    ]
+    
+    for i, concept in enumerate(sub_concepts):
+        node_id = str(i + 2)
+        
+        nodes.append({
+            "id": node_id,
+            "label": concept,
+            "description": f"This aspect of {topic} focuses on specific elements that contribute to the broader understanding of the subject.",
+            "bulletPoints": [
+                f"Key component of understanding {topic}",
+                f"Builds upon fundamental principles while extending into specialized areas",
+                f"Provides context for practical applications and theoretical development"
+            ]
+        })
+        
+        edges.append({
+            "source": main_id,
+            "target": node_id
+        })
+    
+    layout_concept_map(nodes, edges)
+    return {
+        "nodes": nodes,
+        "edges": edges,
+        "fallback": True
+    }
+
+# Flashcard source text for a concept map node
+def _concept_source(concept: Dict[str, Any]) -> str:
+    content = concept["label"]
+    
+    if concept.get("description"):
+        content += f"\n\nDescription: {concept['description']}"
+    
+    bullet_points = concept.get("bulletPoints")
+    if bullet_points and isinstance(bullet_points, list):
+        content += f"\n\nKey Points:\n{chr(10).join([f'- {point}' for point in bullet_points])}"
+    
+    return content
+
+# Concept sections for the batched prompt; the shared instructions are
+# paid for once per batch instead of once per concept
+def _concept_sections(concepts: List[Tuple[int, Dict[str, Any]]]) -> str:
+    return "\n\n".join(
+        f"=== Concept {index} ===\n{_concept_source(concept)}"
+        for index, concept in concepts
+    )
+
+# Split concepts into as few batches as the token budgets allow
+def _pack_concepts(concepts: List[Dict[str, Any]], count: int) -> List[List[Tuple[int, Dict[str, Any]]]]:
+    preamble_tokens = get_prompt("concept_flashcards").estimate(count=count, sections="")
+    output_per_concept = count * TOKENS_PER_FLASHCARD
+    
+    batches: List[List[Tuple[int, Dict[str, Any]]]] = []
+    current: List[Tuple[int, Dict[str, Any]]] = []
+    input_tokens = preamble_tokens
+    output_tokens = 0
+    
+    for index, concept in enumerate(concepts):
+        cost = estimate_tokens(_concept_source(concept))
+        if current and (
+            input_tokens + cost > BATCH_MAX_INPUT_TOKENS
+            or output_tokens + output_per_concept > BATCH_MAX_OUTPUT_TOKENS
+        ):
+            batches.append(current)
+            current = []
+            input_tokens = preamble_tokens
+            output_tokens = 0
+        
+        current.append((index, concept))
+        input_tokens += cost
+        output_tokens += output_per_concept
+    
+    if current:
+        batches.append(current)
+    return batches
+
+# Recommendations served when Gemini is unavailable
+FALLBACK_RECOMMENDATIONS = [
+    {
+        "title": "Review Key Concepts",
+        "description": "Focus on reviewing fundamentals you've recently studied",
+        "type": "AI Suggested",
+        "icon": "psychology"
+    },
+    {
+        "title": "Try Timed Study Sessions",
+        "description": "25/5 minute Pomodoro technique for better focus",
+        "type": "Pomodoro",
+        "icon": "schedule"
+    },
+    {
+        "title": "Find Additional Resources",
+        "description": "Supplement your learning with online materials",
+        "type": "Resource",
+        "icon": "auto_stories"
+    }
+]
+
 # Generate AI study recommendations
 async def generate_study_recommendations(
     recent_topics: List[str],
@@ -42,64 +415,27 @@ async def generate_study_recommendations(
     struggling_areas: List[str]
 ) -> List[Dict[str, str]]:
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        prompt = f"""
-        Based on the following information, provide 3 personalized study recommendations:
-        
-        Recent topics studied: {", ".join(recent_topics)}
-        Upcoming exams: {", ".join(upcoming_exams)}
-        Areas the student is struggling with: {", ".join(struggling_areas)}
-        
-        For each recommendation, provide:
-        1. A short title (max 5 words)
-        2. A brief description explaining the recommendation (max 15 words)
-        3. A type ("AI Suggested", "Pomodoro", "Resource", "Quiz", or "Review")
-        4. An icon name from Material Icons (use one of: psychology, schedule, auto_stories, quiz, summarize)
-        
-        Format your response as a valid JSON object with a "recommendations" array containing objects with fields: title, description, type, and icon.
-        
-        Example:
-        {
-          "recommendations": [
-            {
-              "title": "Practice Calculus Problems",
-              "description": "Focus on derivatives and integrals",
-              "type": "AI Suggested",
-              "icon": "psychology"
-            }
-          ]
-        }
-        """
-
-        response = model.generate_content(prompt)
-        text = response.text
-        
-        parsed = extract_json_from_text(text)
+        text = await _generate(
+            "recommendations",
+            RECOMMENDATIONS_SCHEMA,
+            recent_topics=", ".join(recent_topics),
+            upcoming_exams=", ".join(upcoming_exams),
+            struggling_areas=", ".join(struggling_areas)
+        )
+        
+        parsed = extract_json_from_text(text, RECOMMENDATIONS_SCHEMA)
         return parsed.get("recommendations", [])
     except Exception as e:
         print("Error generating study recommendations:", str(e))
         # Return fallback recommendations if Gemini call fails
-        return [
-            {
-                "title": "Review Key Concepts",
-                "description": "Focus on reviewing fundamentals you've recently studied",
-                "type": "AI Suggested",
-                "icon": "psychology"
-            },
-            {
-                "title": "Try Timed Study Sessions",
-                "description": "25/5 minute Pomodoro technique for better focus",
-                "type": "Pomodoro",
-                "icon": "schedule"
-            },
-            {
-                "title": "Find Additional Resources",
-                "description": "Supplement your learning with online materials",
-                "type": "Resource",
-                "icon": "auto_stories"
-            }
-        ]
+        return deepcopy(FALLBACK_RECOMMENDATIONS)
+
+# Single Gemini call producing flashcards for (a chunk of) notes
+async def _flashcards_for_chunk(notes: str, subject: str, count: int) -> List[Dict[str, str]]:
+    text = await _generate("flashcards", FLASHCARDS_SCHEMA, notes=notes, subject=subject, count=count)
+    
+    parsed = extract_json_from_text(text, FLASHCARDS_SCHEMA)
+    return parsed.get("flashcards", [])
 
 # Generate AI flashcards from notes
 async def generate_flashcards_from_notes(
@@ -108,66 +444,91 @@ async def generate_flashcards_from_notes(
     count: int = 5
 ) -> List[Dict[str, str]]:
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        prompt = f"""
-        Create {count} comprehensive, academic-level flashcards based on the following notes about {subject}:
-        
-        {notes}
-        
-        For each flashcard:
-        1. Create a specific, thought-provoking question that tests deep understanding of a particular aspect of the subject
-        2. Provide a detailed, comprehensive answer (150-200 words) that:
-           - Thoroughly explains the concept with academic precision
-           - Includes relevant examples, applications, or case studies when appropriate
-           - Mentions connections to related concepts
-           - Addresses common misconceptions or nuances
-           - Uses proper terminology and scholarly language
-        
-        Each flashcard should focus on a different aspect of the topic, covering where appropriate:
-        - Foundational principles and definitions
-        - Historical context or development
-        - Key components, mechanisms, or methodologies
-        - Practical applications or real-world relevance
-        - Theoretical frameworks
-        - Contemporary research or emerging directions
-        - Critical analysis or limitations
-        
-        Format your response as a valid JSON object with a "flashcards" array containing objects with question and answer fields.
-        
-        Example:
-        {{
-          "flashcards": [
-            {{
-              "question": "What is the fundamental principle underlying photosynthesis and how does it serve as a critical biological energy conversion process?",
-              "answer": "Photosynthesis represents one of nature's most elegant energy conversion mechanisms, wherein light energy is transformed into chemical energy through a sophisticated series of biochemical reactions. At its core, this process harnesses photons from sunlight to split water molecules, releasing oxygen as a byproduct, while simultaneously reducing carbon dioxide to form energy-rich carbohydrates. This fundamental principle establishes photosynthesis as the primary entry point for energy into most ecosystems, creating the foundation for nearly all food webs on Earth. The process occurs predominantly in chloroplasts containing specialized pigments like chlorophyll that absorb specific wavelengths of light, initiating electron transport chains that ultimately generate ATP and NADPH. These energy carriers subsequently power the Calvin cycle, where carbon dioxide is incorporated into organic molecules. Beyond its role in energy conversion, photosynthesis has profoundly influenced Earth's atmosphere through oxygen production, making it not only essential for plant metabolism but also indirectly responsible for supporting aerobic life forms across the planet."
-            }}
-          ]
-        }}
-        """
-
-        response = model.generate_content(prompt)
-        text = response.text
+        chunks = split_notes(notes, NOTES_CHUNK_TOKENS)
+        if len(chunks) == 1:
+            return await _flashcards_for_chunk(notes, subject, count)
+        
+        # Large notes: generate per chunk concurrently, then merge and dedupe
+        metrics.incr("notes.chunked_requests")
+        metrics.incr("notes.chunks", len(chunks))
+        jobs = list(zip(chunks, allocate_counts(count, chunks)))
+        results = await map_chunks(
+            lambda job: _flashcards_for_chunk(job[0], subject, job[1]),
+            jobs,
+            NOTES_CHUNK_CONCURRENCY
+        )
+        
+        succeeded = []
+        for result in results:
+            if isinstance(result, Exception):
+                print("Error generating flashcards for chunk:", str(result))
+            else:
+                succeeded.append(result)
         
-        parsed = extract_json_from_text(text)
-        return parsed.get("flashcards", [])
+        flashcards = merge_flashcards(succeeded, count)
+        if not flashcards:
+            raise ValueError("No chunk produced flashcards")
+        return flashcards
     except Exception as e:
         print("Error generating flashcards:", str(e))
         # Return fallback flashcards if Gemini call fails
-        return [
-            {
-                "question": f"What are the foundational principles and key dimensions of {subject}?",
-                "answer": f"{subject} represents a multifaceted domain encompassing several interconnected theoretical frameworks and practical applications. At its fundamental level, it integrates core principles that have evolved through significant scholarly discourse and empirical investigation. The conceptual foundation typically includes hierarchical structures of knowledge that range from basic definitional elements to sophisticated analytical frameworks. Understanding these principles requires examining both historical development and contemporary interpretations across multiple disciplinary perspectives. The integration of these varied approaches provides a more nuanced comprehension than any single theoretical model could offer in isolation."
-            },
-            {
-                "question": f"How has the understanding of {subject} evolved historically, and what are its contemporary applications?",
-                "answer": f"The historical trajectory of {subject} reflects a progressive refinement of ideas through several key intellectual periods. Early formulations often emerged from foundational work by pioneering scholars who established initial theoretical frameworks. Throughout subsequent decades, these conceptualizations underwent significant transformations as new methodological approaches and analytical techniques emerged. Contemporary applications span diverse domains including educational contexts, research methodologies, professional practices, and technological innovations. In each sphere, theoretical principles are translated into practical implementations that address specific challenges while maintaining conceptual integrity. This evolution demonstrates both continuity in core principles and adaptation to changing contextual requirements."
-            },
-            {
-                "question": f"What methodological approaches are employed in the study of {subject}, and what are their relative strengths?",
-                "answer": f"The methodological landscape for studying {subject} encompasses diverse approaches, each offering distinct advantages for understanding different facets of the domain. Quantitative methodologies provide statistical rigor and empirical validation through measurement and analysis of observable phenomena. Qualitative approaches offer depth through interpretive frameworks that explore contextual nuances and subjective dimensions. Mixed methods integrate these complementary perspectives to develop more comprehensive understanding. Theoretical analysis examines conceptual foundations and logical structures underpinning the subject, while applied research focuses on practical implementation and real-world outcomes. The selection of methodological approach depends on specific research questions, available resources, and the nature of the phenomena being investigated."
-            }
-        ]
+        return _fallback_flashcards(subject)
+
+# Generate flashcards for one batch of concepts, keyed by concept index.
+# A failed call yields an empty result so only its concepts fall back.
+async def _generate_concept_batch(
+    batch: List[Tuple[int, Dict[str, Any]]],
+    count: int
+) -> Dict[int, List[Dict[str, str]]]:
+    try:
+        text = await _generate(
+            "concept_flashcards",
+            CONCEPT_FLASHCARDS_SCHEMA,
+            count=count,
+            sections=_concept_sections(batch)
+        )
+        
+        parsed = extract_json_from_text(text, CONCEPT_FLASHCARDS_SCHEMA)
+        indexes = {index for index, _ in batch}
+        return {
+            entry["index"]: entry["flashcards"]
+            for entry in parsed.get("concepts", [])
+            if entry["index"] in indexes and entry["flashcards"]
+        }
+    except Exception as e:
+        print("Error generating concept flashcard batch:", str(e))
+        return {}
+
+# Generate AI flashcards for many concept map nodes in as few calls as possible
+async def generate_flashcards_for_concepts(
+    concepts: List[Dict[str, Any]],
+    count: int = 7
+) -> List[Dict[str, Any]]:
+    batches = _pack_concepts(concepts, count)
+    metrics.incr("concept_flashcards.concepts", len(concepts))
+    metrics.incr("concept_flashcards.calls", len(batches))
+    
+    generated: Dict[int, List[Dict[str, str]]] = {}
+    for result in await asyncio.gather(*(_generate_concept_batch(batch, count) for batch in batches)):
+        generated.update(result)
+    
+    results = []
+    for index, concept in enumerate(concepts):
+        flashcards = generated.get(index)
+        if not flashcards:
+            metrics.incr("concept_flashcards.fallbacks")
+        results.append({
+            "concept": concept["label"],
+            "flashcards": flashcards or _fallback_flashcards(concept["label"]),
+            "fallback": not flashcards
+        })
+    return results
+
+# Single Gemini call enhancing (a chunk of) notes
+async def _enhance_chunk(notes: str, subject: str) -> Dict[str, Any]:
+    text = await _generate("enhance_notes", ENHANCED_NOTES_SCHEMA, notes=notes, subject=subject)
+    
+    return extract_json_from_text(text, ENHANCED_NOTES_SCHEMA)
 
 # Generate AI enhanced notes
 async def enhance_notes(
@@ -175,32 +536,27 @@ async def enhance_notes(
     subject: str
 ) -> Dict[str, Any]:
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        prompt = f"""
-        Enhance the following student notes on {subject}:
-        
-        {notes}
-        
-        Please provide:
-        1. An enhanced, structured version of the notes that:
-           - Improves organization with clear headings and subheadings
-           - Expands abbreviated concepts with complete explanations
-           - Adds missing context or connections between topics
-           - Fills in any apparent gaps or incomplete information
-           - Corrects any factual inaccuracies or misconceptions
-        
-        2. A summary of 3-5 key concepts covered in these notes
-        
-        3. A list of 3-5 additional resources (books, articles, websites) for further study
-        
-        Format your response as a JSON object with enhancedNotes, keyConcepts, and additionalResources fields.
-        """
-        
-        response = model.generate_content(prompt)
-        text = response.text
-        
-        return extract_json_from_text(text)
+        chunks = split_notes(notes, NOTES_CHUNK_TOKENS)
+        if len(chunks) == 1:
+            return await _enhance_chunk(notes, subject)
+        
+        # Large notes: enhance sections concurrently and stitch them back in
+        # order; a failed section keeps its original text
+        metrics.incr("notes.chunked_requests")
+        metrics.incr("notes.chunks", len(chunks))
+        results = await map_chunks(lambda chunk: _enhance_chunk(chunk, subject), chunks, NOTES_CHUNK_CONCURRENCY)
+        
+        if all(isinstance(result, Exception) for result in results):
+            raise results[0]
+        
+        sections = []
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, Exception):
+                print("Error enhancing notes chunk:", str(result))
+                sections.append({"enhancedNotes": chunk})
+            else:
+                sections.append(result)
+        return merge_enhanced_notes(sections)
     except Exception as e:
         print("Error enhancing notes:", str(e))
         # Return fallback enhanced notes
@@ -236,161 +592,109 @@ async def generate_concept_map(
     notes: Optional[str] = None
 ) -> Dict[str, Any]:
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        note_context = f"""
-        Based on the following notes provided by the user:
-        
-        {notes}
-        
-        """ if notes else ""
-        
-        prompt = f"""
-        {note_context}Create a concept map for the topic "{topic}". 
-        
-        A concept map should include:
-        1. Main concept (the topic itself at the top level)
-        2. Key sub-concepts (5-8 important components or aspects) branching from the main concept
-        3. Further sub-concepts (2-3 for each key concept) where appropriate
-        4. Clear hierarchical relationships between concepts
-        5. Brief but informative descriptions for each concept
-        
-        Format your response as a valid JSON object with:
-        1. "nodes": Array of objects, each with:
-           - "id": Unique string identifier (numbers only)
-           - "label": Short name of the concept (1-4 words)
-           - "description": Brief but comprehensive explanation of the concept (2-3 sentences)
-           - "bulletPoints": Array of 3-4 key points about this concept
+        text = await _generate("concept_map", CONCEPT_MAP_SCHEMA, **_concept_map_values(topic, notes))
         
-        2. "edges": Array of objects, each with:
-           - "source": The id of the source node
-           - "target": The id of the target node
-        
-        For example, for topic "Photosynthesis":
-        
-        {{
-          "nodes": [
-            {{
-              "id": "1",
-              "label": "Photosynthesis",
-              "description": "The sophisticated biochemical process by which green plants, algae, and certain bacteria harness solar energy to convert carbon dioxide and water into organic compounds (primarily glucose) and release oxygen as a byproduct. This fundamental process is the primary means by which energy from sunlight enters the biosphere and serves as the foundation for most food chains on Earth.",
-              "bulletPoints": [
-                "Converts light energy into chemical energy stored in glucose molecules through a complex series of electron transfers and enzymatic reactions",
-                "Takes place in specialized organelles called chloroplasts which contain thylakoid membranes where light-dependent reactions occur and stroma where carbon fixation happens",
-                "Essential for most life on Earth as it produces oxygen, removes carbon dioxide, and provides the base of nearly all food webs through primary production",
-                "Occurs in two main stages: the light-dependent reactions (photosystems I and II) and the light-independent reactions (Calvin cycle)",
-                "The complete biochemical equation can be represented as: 6CO₂ + 6H₂O + light energy → C₆H₁₂O₆ + 6O₂"
-              ]
-            }},
-            {{
-              "id": "2",
-              "label": "Light-Dependent Reactions",
-              "description": "The initial stage of photosynthesis where electromagnetic radiation from the sun is captured by photosynthetic pigments (primarily chlorophyll) and converted into chemical energy in the form of ATP and NADPH. These reactions occur exclusively in the thylakoid membrane system of chloroplasts and are responsible for the production of oxygen as a byproduct through the photolysis of water molecules.",
-              "bulletPoints": [
-                "Requires direct light energy, specifically wavelengths within the visible spectrum that are absorbed by specialized pigment molecules arranged in light-harvesting complexes",
-                "Produces energy carriers ATP (adenosine triphosphate) through photophosphorylation and reduces NADP+ to NADPH, both of which are subsequently used in the Calvin cycle",
-                "Releases molecular oxygen (O₂) as a byproduct through the splitting of water molecules in a process called photolysis, which has dramatically altered Earth's atmosphere over evolutionary time",
-                "Involves two specialized protein complexes called photosystems I and II which contain different types of chlorophyll molecules and function in series through the Z-scheme of electron transport",
-                "Utilizes both cyclic and non-cyclic electron flow pathways to meet varying cellular energy requirements and maintain appropriate ratios of ATP to NADPH for downstream metabolic processes"
-              ]
-            }}
-          ],
-          "edges": [
-            {{
-              "source": "1",
-              "target": "2"
-            }}
-          ]
-        }}
-        
-        Do not include any positional information like x or y coordinates. Ensure each node has a unique ID and that edges correctly define the hierarchical relationships between concepts.
-        """
-        
-        response = model.generate_content(prompt)
-        text = response.text
-        
-        parsed = extract_json_from_text(text)
-        
-        # Add random spacing for visualization
-        # This helps position nodes in a more readable way
-        import random
-        import math
+        parsed = extract_json_from_text(text, CONCEPT_MAP_SCHEMA)
         
         nodes = parsed.get("nodes", [])
-        
-        # Add position data for visualization
-        for i, node in enumerate(nodes):
-            if i == 0:  # Main concept in the center
-                node["x"] = 250
-                node["y"] = 250
-            else:
-                # Position in a circular pattern around the main node
-                angle = 2 * math.pi * i / (len(nodes) - 1) if len(nodes) > 1 else 0
-                distance = 200
-                node["x"] = 250 + distance * math.cos(angle)
-                node["y"] = 250 + distance * math.sin(angle)
+        edges = parsed.get("edges", [])
+        layout_concept_map(nodes, edges)
         
         return {
             "nodes": nodes,
-            "edges": parsed.get("edges", [])
+            "edges": edges
         }
     except Exception as e:
         print("Error generating concept map:", str(e))
         # Return fallback concept map
-        main_id = "1"
-        nodes = [
-            {
-                "id": main_id,
-                "label": topic,
-                "description": f"{topic} encompasses multiple interconnected concepts and principles that form a cohesive framework for understanding this domain.",
-                "bulletPoints": [
-                    f"Core principles of {topic} serve as the foundation for all specialized applications",
-                    f"Understanding {topic} requires examining both theoretical models and practical implementations",
-                    f"The field of {topic} continues to evolve through ongoing research and new discoveries"
-                ],
-                "x": 250,
-                "y": 250
-            }
-        ]
-        
-        edges = []
-        
-        # Generate some sub-concepts
-        sub_concepts = [
-            f"Fundamentals of {topic}",
-            f"Applications of {topic}",
-            f"Historical Development",
-            f"Current Research"
-        ]
-        
-        for i, concept in enumerate(sub_concepts):
-            node_id = str(i + 2)
-            
-            # Position in a circular pattern around the main node
-            angle = 2 * math.pi * i / len(sub_concepts)
-            distance = 200
-            x = 250 + distance * math.cos(angle)
-            y = 250 + distance * math.sin(angle)
-            
-            nodes.append({
-                "id": node_id,
-                "label": concept,
-                "description": f"This aspect of {topic} focuses on specific elements that contribute to the broader understanding of the subject.",
-                "bulletPoints": [
-                    f"Key component of understanding {topic}",
-                    f"Builds upon fundamental principles while extending into specialized areas",
-                    f"Provides context for practical applications and theoretical development"
-                ],
-                "x": x,
-                "y": y
-            })
-            
-            edges.append({
-                "source": main_id,
-                "target": node_id
-            })
-        
-        return {
-            "nodes": nodes,
-            "edges": edges
-        }
\ No newline at end of file
+        return _fallback_concept_map(topic)
+
+# Generate sub-concepts for one node of a concept map. Returns an empty
+# list on failure so the node can be expanded again later
+async def expand_concept(
+    topic: str,
+    path: List[str],
+    node: Dict[str, Any],
+    existing: List[str],
+    count: int = 3
+) -> List[Dict[str, Any]]:
+    try:
+        text = await _generate(
+            "concept_expand",
+            CONCEPT_EXPAND_SCHEMA,
+            topic=topic,
+            label=node["label"],
+            path=" > ".join(path),
+            description=node.get("description") or "",
+            existing=", ".join(existing) or "none",
+            count=count
+        )
+        
+        parsed = extract_json_from_text(text, CONCEPT_EXPAND_SCHEMA)
+        return parsed.get("nodes", [])
+    except Exception as e:
+        print("Error expanding concept:", str(e))
+        return []
+
+# Stream AI flashcards from notes, yielding ("flashcard", card) as soon as
+# each card is complete in the model output
+async def stream_flashcards_from_notes(
+    notes: str,
+    subject: str,
+    count: int = 5
+) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
+    started = time.perf_counter()
+    emitted = 0
+    try:
+        parser = JSONArrayStream()
+        async for text in _generate_stream("flashcards", FLASHCARDS_SCHEMA, notes=notes, subject=subject, count=count):
+            for key, card in parser.feed(text):
+                if key not in ("flashcards", None):
+                    continue
+                if emitted == 0:
+                    metrics.observe("flashcards.time_to_first_card_ms", (time.perf_counter() - started) * 1000)
+                emitted += 1
+                yield "flashcard", card
+    except Exception as e:
+        print("Error streaming flashcards:", str(e))
+        # Fall back only if nothing was streamed yet
+        if emitted == 0:
+            for card in _fallback_flashcards(subject):
+                yield "flashcard", card
+    finally:
+        metrics.observe("flashcards.stream_total_ms", (time.perf_counter() - started) * 1000)
+
+# Stream an AI concept map, yielding ("node", node) and ("edge", edge) as they
+# complete and a final ("map", concept_map) with positions for every node
+async def stream_concept_map(
+    topic: str,
+    notes: Optional[str] = None
+) -> AsyncIterator[Tuple[str, Any]]:
+    started = time.perf_counter()
+    nodes: List[Dict[str, Any]] = []
+    edges: List[Dict[str, Any]] = []
+    try:
+        parser = JSONArrayStream()
+        async for text in _generate_stream("concept_map", CONCEPT_MAP_SCHEMA, **_concept_map_values(topic, notes)):
+            for key, item in parser.feed(text):
+                if key == "nodes":
+                    if not nodes:
+                        metrics.observe("concept_map.time_to_first_node_ms", (time.perf_counter() - started) * 1000)
+                    nodes.append(item)
+                    yield "node", item
+                elif key == "edges":
+                    edges.append(item)
+                    yield "edge", item
+        
+        layout_concept_map(nodes, edges)
+        yield "map", {"nodes": nodes, "edges": edges}
+    except Exception as e:
+        print("Error streaming concept map:", str(e))
+        # Keep whatever was streamed, otherwise return fallback concept map
+        if nodes:
+            layout_concept_map(nodes, edges)
+            yield "map", {"nodes": nodes, "edges": edges}
+        else:
+            yield "map", _fallback_concept_map(topic)
+    finally:
+        metrics.observe("concept_map.stream_total_ms", (time.perf_counter() - started) * 1000)
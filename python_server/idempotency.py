@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from python_server.metrics import metrics
+from python_server.ttl_store import TTLStore
+
+# Idempotency-Key support for POST routes.
+#
+# Clients that retry a POST after a timeout send the same Idempotency-Key
+# header on every attempt. The first request with a key runs normally and
+# its response is kept for IDEMPOTENCY_TTL_SECONDS; a retry with that key
+# gets the stored response back instead of generating (or creating) again.
+# A retry that arrives while the first request is still running waits for
+# it and shares its response. Reusing a key for a different request body
+# is a client error.
+#
+# Keys are scoped to the user, method and path. Server errors, 429s and
+# streamed responses are not kept: the key is released once the request
+# finishes, so the next retry runs again. A retry that was waiting on a
+# streamed response runs again too, since there is no body to share.
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+# How long a retry waits for the original request before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "60"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Status, headers and body of a finished response
+StoredResponse = Tuple[int, List[Tuple[str, str]], bytes]
+
+def fingerprint(method: str, path: str, body: bytes) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{method} {path}\n".encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+def storable(status: int) -> bool:
+    return status < 500 and status != 429
+
+class IdempotentCall:
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.response: Optional[StoredResponse] = None
+
+    # Wait for the original request; None if it did not finish in time
+    # (`done` is still clear) or finished without a response to share
+    def wait(self, timeout: float) -> Optional[StoredResponse]:
+        if not self.done.wait(timeout):
+            return None
+        return self.response
+
+class IdempotencyStore:
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.calls: TTLStore[IdempotentCall] = TTLStore(ttl_seconds, max_entries)
+        self.lock = threading.Lock()
+        metrics.register_gauge("idempotency.keys", lambda: len(self.calls))
+
+    # The call for a key and whether this request owns it (must run and
+    # then finish it) or should wait on it
+    def begin(self, key: str, fingerprint: str) -> Tuple[IdempotentCall, bool]:
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                metrics.incr("idempotency.replayed" if call.done.is_set() else "idempotency.attached")
+                return call, False
+            call = IdempotentCall(fingerprint)
+            self.calls.set(key, call)
+        metrics.incr("idempotency.started")
+        return call, True
+
+    # Record the owner's response and wake every waiter. A response that is
+    # not worth keeping is handed to the waiters but the key is released
+    def finish(self, key: str, call: IdempotentCall, response: Optional[StoredResponse]) -> None:
+        call.response = response
+        if response is None or not storable(response[0]):
+            with self.lock:
+                if self.calls.get(key) is call:
+                    self.calls.pop(key)
+        call.done.set()
+
+# Shared store used by the app
+idempotency_store = IdempotencyStore()
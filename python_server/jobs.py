@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from python_server.deadline import request_deadline
+from python_server.metrics import metrics
+from python_server.ttl_store import TTLStore
+
+# In-process job queue for long-running AI generation.
+#
+# A fixed pool of worker threads, each with its own event loop, pulls jobs
+# off a priority queue. Requests can either wait for their job (the
+# synchronous API routes) or get a job id back straight away and poll
+# GET /api/jobs/<id>. Finished jobs stay readable for JOB_RESULT_TTL_SECONDS.
+#
+# A job runs in a copy of the submitting request's context, so the
+# per-user LLM limits still apply; its deadline is fixed at submission, so
+# time spent queued counts against it.
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "120"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "600"))
+JOB_RESULT_MAX_ENTRIES = int(os.getenv("JOB_RESULT_MAX_ENTRIES", "1000"))
+
+# Lower runs first: a caller blocked on the response beats a polled job
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+class QueueFull(RuntimeError):
+    pass
+
+class Job:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, kind: str, fn: Callable[[], Awaitable[Any]], priority: int, timeout: Optional[float]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.fn = fn
+        self.priority = priority
+        self.status = self.QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.context = contextvars.copy_context()
+        self.done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.done.wait(timeout)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "id": self.id,
+            "type": self.kind,
+            "status": self.status,
+            "createdAt": _iso(self.created_at),
+            "startedAt": _iso(self.started_at),
+            "finishedAt": _iso(self.finished_at)
+        }
+        if self.status == self.SUCCEEDED:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}Z"
+
+class JobQueue:
+    def __init__(self, workers: int, max_queued: int):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        # Cancelled jobs stay in the heap until a worker pops them, so the
+        # number still waiting to run is counted separately
+        self.heap: List[Tuple[int, int, Job]] = []
+        self.queued = 0
+        self.sequence = itertools.count()
+        self.active: Dict[str, Job] = {}
+        self.results: TTLStore[Job] = TTLStore(JOB_RESULT_TTL_SECONDS, JOB_RESULT_MAX_ENTRIES)
+        self.running = 0
+        self.condition = threading.Condition()
+        self.threads: List[threading.Thread] = []
+
+    # Worker threads start with the first job, not at import time
+    def _ensure_started(self) -> None:
+        if self.threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, kind: str, fn: Callable[[], Awaitable[Any]], priority: int = PRIORITY_BACKGROUND,
+               timeout: Optional[float] = JOB_TIMEOUT_SECONDS) -> Job:
+        job = Job(kind, fn, priority, timeout)
+        with self.condition:
+            if self.queued >= self.max_queued:
+                metrics.incr("jobs.rejected")
+                raise QueueFull("Job queue is full")
+            self._ensure_started()
+            self.active[job.id] = job
+            # The sequence number keeps equal priorities first in, first out
+            heapq.heappush(self.heap, (priority, next(self.sequence), job))
+            self.queued += 1
+            self.condition.notify()
+        metrics.incr("jobs.submitted")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.condition:
+            job = self.active.get(job_id)
+        return job or self.results.get(job_id)
+
+    # Cancel a job that has not started yet; running jobs finish normally
+    def cancel(self, job: Job) -> bool:
+        with self.condition:
+            if job.status != Job.QUEUED:
+                return False
+            job.status = Job.CANCELLED
+            self.queued -= 1
+        self._finish(job)
+        metrics.incr("jobs.cancelled")
+        return True
+
+    def queue_depth(self) -> int:
+        with self.condition:
+            return self.queued
+
+    def _next_job(self) -> Job:
+        with self.condition:
+            while True:
+                while not self.heap:
+                    self.condition.wait()
+                _, _, job = heapq.heappop(self.heap)
+                if job.status == Job.QUEUED:
+                    job.status = Job.RUNNING
+                    self.queued -= 1
+                    self.running += 1
+                    return job
+
+    def _worker(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            job = self._next_job()
+            job.started_at = time.time()
+            metrics.observe("jobs.queue_wait_ms", (job.started_at - job.created_at) * 1000)
+            try:
+                job.result = job.context.run(self._run, loop, job)
+                job.status = Job.SUCCEEDED
+                metrics.incr("jobs.succeeded")
+            except Exception as e:
+                print(f"Job {job.id} ({job.kind}) failed:", str(e))
+                job.error = str(e)
+                job.status = Job.FAILED
+                metrics.incr("jobs.failed")
+            with self.condition:
+                self.running -= 1
+            metrics.observe("jobs.run_ms", (time.time() - job.started_at) * 1000)
+            self._finish(job)
+
+    def _run(self, loop: asyncio.AbstractEventLoop, job: Job) -> Any:
+        request_deadline.set(job.deadline)
+        return loop.run_until_complete(job.fn())
+
+    def _finish(self, job: Job) -> None:
+        job.finished_at = time.time()
+        job.fn = None
+        job.context = None
+        self.results.set(job.id, job)
+        with self.condition:
+            self.active.pop(job.id, None)
+        job.done.set()
+
+# Shared instance used by the app
+jobs = JobQueue(JOB_WORKERS, JOB_QUEUE_SIZE)
+
+metrics.register_gauge("jobs.queue_depth", jobs.queue_depth)
+metrics.register_gauge("jobs.running", lambda: jobs.running)
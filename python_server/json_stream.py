@@ -0,0 +1,115 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+# Incremental scanner for streamed model output.
+#
+# Text is fed in arbitrary chunks as it arrives from the model. Whenever an
+# object inside a top-level array is closed, it is decoded and returned
+# together with the key of the array that holds it, e.g. ("flashcards", {...})
+# for {"flashcards": [{...}, ...]} or (None, {...}) when the root is an array.
+# Every character is looked at exactly once, so the cost is linear in the
+# length of the response no matter how many chunks it arrives in.
+class JSONArrayStream:
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.started = False
+        self.finished = False
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_key: Optional[str] = None
+        self.array_keys: List[Optional[str]] = []
+        self.item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[Optional[str], Any]]:
+        self.text += chunk
+        items: List[Tuple[Optional[str], Any]] = []
+        text = self.text
+
+        while self.pos < len(text) and not self.finished:
+            char = text[self.pos]
+
+            if not self.started:
+                # Skip any preamble (prose, ```json fences) before the root value
+                if char in "{[":
+                    self.started = True
+                    self._open(char)
+                self.pos += 1
+                continue
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if len(self.stack) == 1 and self.stack[0] == "{":
+                        try:
+                            self.last_key = json.loads(text[self.string_start:self.pos + 1])
+                        except ValueError:
+                            self.last_key = None
+            elif char == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif char in "{[":
+                self._open(char)
+            elif char in "}]":
+                item = self._close()
+                if item is not None:
+                    items.append(item)
+
+            self.pos += 1
+
+        self._compact()
+        return items
+
+    # Drop already-scanned text that no pending item or string refers to
+    def _compact(self) -> None:
+        keep = self.pos
+        if self.item_start is not None:
+            keep = min(keep, self.item_start)
+        if self.in_string:
+            keep = min(keep, self.string_start)
+        if keep <= 0:
+            return
+
+        self.text = self.text[keep:]
+        self.pos -= keep
+        self.string_start -= keep
+        if self.item_start is not None:
+            self.item_start -= keep
+
+    def _open(self, char: str) -> None:
+        if char == "[":
+            self.array_keys.append(self.last_key if len(self.stack) == 1 else None)
+        elif self._at_item_depth():
+            self.item_start = self.pos
+        self.stack.append(char)
+
+    def _close(self) -> Optional[Tuple[Optional[str], Any]]:
+        if not self.stack:
+            return None
+
+        opened = self.stack.pop()
+        if opened == "[":
+            self.array_keys.pop()
+
+        if not self.stack:
+            self.finished = True
+            return None
+
+        if opened == "{" and self.item_start is not None and self._at_item_depth():
+            start, self.item_start = self.item_start, None
+            try:
+                return self.array_keys[-1], json.loads(self.text[start:self.pos + 1])
+            except ValueError:
+                return None
+        return None
+
+    # Items are objects directly inside the root array or inside an array
+    # that is a direct member of the root object
+    def _at_item_depth(self) -> bool:
+        return self.stack in (["["], ["{", "["])
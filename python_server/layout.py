@@ -0,0 +1,202 @@
+import math
+import os
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from python_server.metrics import timed
+
+# Concept-map layout.
+#
+# Positions are derived from the map's edges rather than the node order:
+#   radial - tidy tree on concentric rings, each subtree getting an angular
+#            wedge proportional to its number of leaves (default)
+#   tree   - the same tidy tree drawn top-down in layers
+#   force  - force-directed refinement seeded from the radial layout
+# The first node is the root, as the prompts ask for the main concept
+# first. Layouts are deterministic for a given seed and cached per map
+# shape (node ids, edges, algorithm, seed), so a map that is generated,
+# streamed and re-sent is only laid out once.
+
+LAYOUT_ALGORITHM = os.getenv("CONCEPT_MAP_LAYOUT", "radial")
+LAYOUT_SEED = int(os.getenv("CONCEPT_MAP_LAYOUT_SEED", "7"))
+LAYOUT_CACHE_SIZE = int(os.getenv("CONCEPT_MAP_LAYOUT_CACHE_SIZE", "256"))
+
+CENTER_X = 250.0
+CENTER_Y = 250.0
+LEVEL_SPACING = 200.0
+SIBLING_SPACING = 180.0
+FORCE_ITERATIONS = 30
+# Smallest arc between neighbouring leaves on the outer ring
+MIN_LEAF_ARC = 90.0
+
+ALGORITHMS = ("radial", "tree", "force")
+
+Edge = Tuple[str, str]
+
+# Assign x/y to every node in place
+def layout_concept_map(
+    nodes: List[Dict[str, Any]],
+    edges: Sequence[Dict[str, Any]],
+    algorithm: str = None,
+    seed: int = LAYOUT_SEED
+) -> None:
+    if not nodes:
+        return
+    algorithm = algorithm if algorithm in ALGORITHMS else LAYOUT_ALGORITHM
+    ids = tuple(str(node.get("id")) for node in nodes)
+    edge_key = tuple((str(edge.get("source")), str(edge.get("target"))) for edge in edges)
+    with timed("concept_map.layout_ms"):
+        positions = _cached_layout(ids, edge_key, algorithm, seed)
+    for node, (x, y) in zip(nodes, positions):
+        node["x"] = x
+        node["y"] = y
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def _cached_layout(ids: Tuple[str, ...], edges: Tuple[Edge, ...], algorithm: str, seed: int) -> Tuple[Tuple[float, float], ...]:
+    parent, depth, order = _spanning_tree(ids, edges)
+    start, span = _leaf_spans(parent, depth, order)
+
+    if algorithm == "tree":
+        xy = _tree(start, span, depth)
+    else:
+        xy = _radial(start, span, depth)
+        if algorithm == "force":
+            xy = _force(xy, ids, edges, seed)
+
+    xy = np.round(xy, 1)
+    return tuple((float(x), float(y)) for x, y in xy)
+
+# BFS spanning tree from the first node. Edges are followed in either
+# direction; components not connected to the root hang off the root.
+# Returns parent index (-1 for the root), depth and BFS order
+def _spanning_tree(ids: Tuple[str, ...], edges: Tuple[Edge, ...]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    n = len(ids)
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    adjacency: List[List[int]] = [[] for _ in range(n)]
+    for source, target in edges:
+        a, b = index.get(source), index.get(target)
+        if a is None or b is None or a == b:
+            continue
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+
+    parent = np.full(n, -1, dtype=np.int64)
+    depth = np.zeros(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    order: List[int] = []
+
+    for component_root in range(n):
+        if visited[component_root]:
+            continue
+        visited[component_root] = True
+        if component_root != 0:
+            parent[component_root] = 0
+            depth[component_root] = 1
+        queue = deque([component_root])
+        while queue:
+            current = queue.popleft()
+            order.append(current)
+            for neighbour in adjacency[current]:
+                if not visited[neighbour]:
+                    visited[neighbour] = True
+                    parent[neighbour] = current
+                    depth[neighbour] = depth[current] + 1
+                    queue.append(neighbour)
+
+    # Order by depth so each level's siblings are contiguous and follow
+    # their parents' order
+    order_array = np.array(order, dtype=np.int64)
+    order_array = order_array[np.argsort(depth[order_array], kind="stable")]
+    return parent, depth, order_array
+
+# Tidy-tree allocation: every node gets [start, start + span) in leaf
+# units, where span is the number of leaves below it. Computed one depth
+# level at a time with array operations
+def _leaf_spans(parent: np.ndarray, depth: np.ndarray, order: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(parent)
+    has_children = np.zeros(n, dtype=bool)
+    has_children[parent[parent >= 0]] = True
+    span = (~has_children).astype(np.float64)
+
+    levels = [order[depth[order] == d] for d in range(int(depth.max()) + 1)]
+
+    # Leaf counts bubble up from the deepest level
+    for level in reversed(levels[1:]):
+        np.add.at(span, parent[level], span[level])
+
+    start = np.zeros(n, dtype=np.float64)
+    for level in levels[1:]:
+        widths = span[level]
+        offsets = np.cumsum(widths) - widths
+        parents = parent[level]
+        # Offsets restart at the first child of every parent
+        group_start = np.r_[True, parents[1:] != parents[:-1]]
+        first_offset = np.maximum.accumulate(np.where(group_start, np.arange(len(level)), 0))
+        start[level] = start[parents] + offsets - offsets[first_offset]
+    return start, span
+
+def _radial(start: np.ndarray, span: np.ndarray, depth: np.ndarray) -> np.ndarray:
+    total = max(span[0], 1.0)
+    angle = 2 * math.pi * (start + span / 2) / total
+    # Rings spread out for wide maps so outer leaves do not overlap
+    max_depth = max(int(depth.max()), 1)
+    spacing = max(LEVEL_SPACING, total * MIN_LEAF_ARC / (2 * math.pi * max_depth))
+    radius = depth * spacing
+    return np.column_stack((CENTER_X + radius * np.cos(angle), CENTER_Y + radius * np.sin(angle)))
+
+def _tree(start: np.ndarray, span: np.ndarray, depth: np.ndarray) -> np.ndarray:
+    middle = (start + span / 2) - span[0] / 2
+    return np.column_stack((CENTER_X + middle * SIBLING_SPACING, CENTER_Y + depth * LEVEL_SPACING))
+
+# Fruchterman-Reingold: all-pairs repulsion and edge attraction as array
+# operations, with a linearly cooling step limit
+def _force(initial: np.ndarray, ids: Tuple[str, ...], edges: Tuple[Edge, ...], seed: int) -> np.ndarray:
+    n = len(ids)
+    if n < 2:
+        return initial
+
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    pairs = np.array(
+        [(index[s], index[t]) for s, t in edges if s in index and t in index and s != t],
+        dtype=np.int64
+    ).reshape(-1, 2)
+    source, target = pairs[:, 0], pairs[:, 1]
+
+    # float32 halves the memory traffic of the n x n passes
+    rng = np.random.default_rng(seed)
+    x = (initial[:, 0] + rng.uniform(-1, 1, n)).astype(np.float32)
+    y = (initial[:, 1] + rng.uniform(-1, 1, n)).astype(np.float32)
+    k2 = np.float32((LEVEL_SPACING * 0.75) ** 2)
+    k = np.sqrt(k2)
+    temperature = LEVEL_SPACING / 2
+
+    for iteration in range(FORCE_ITERATIONS):
+        dx = x[:, None] - x[None, :]
+        dy = y[:, None] - y[None, :]
+        repulsion = dx * dx
+        repulsion += dy * dy
+        np.fill_diagonal(repulsion, np.inf)
+        np.divide(k2, repulsion, out=repulsion)
+        move_x = (repulsion * dx).sum(axis=1)
+        move_y = (repulsion * dy).sum(axis=1)
+
+        if len(pairs):
+            pull_x = x[source] - x[target]
+            pull_y = y[source] - y[target]
+            pull = np.sqrt(pull_x * pull_x + pull_y * pull_y) / k
+            np.add.at(move_x, source, -pull_x * pull)
+            np.add.at(move_y, source, -pull_y * pull)
+            np.add.at(move_x, target, pull_x * pull)
+            np.add.at(move_y, target, pull_y * pull)
+
+        step = temperature * (1 - iteration / FORCE_ITERATIONS)
+        length = np.sqrt(move_x * move_x + move_y * move_y)
+        scale = np.minimum(length, step) / np.maximum(length, 1e-9)
+        x += move_x * scale
+        y += move_y * scale
+
+    # Keep the root where the other layouts put it
+    return np.column_stack((x - x[0] + CENTER_X, y - y[0] + CENTER_Y)).astype(np.float64)
@@ -0,0 +1,232 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from python_server.storage import MemStorage, storage
+
+# Learner profiles kept up to date from storage mutation hooks.
+#
+# Each user's profile tracks what they have been studying (notes and study
+# progress by subject), which exams are coming up (open tasks that look
+# like exams) and where they are weak (flashcard sets with low-proficiency
+# cards). Activity counts less the older it is. Mutations update only the
+# affected user, and reads return a precomputed snapshot.
+
+PROFILE_HALF_LIFE_DAYS = float(os.getenv("PROFILE_HALF_LIFE_DAYS", "14"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "3"))
+
+# Flashcards at or below this proficiency (0-4 scale) count as weak
+WEAK_PROFICIENCY = 2
+
+EXAM_KEYWORDS = ("exam", "midterm", "final", "quiz", "test")
+
+# Parse the mix of timestamps storage holds (ISO strings, dates, epoch
+# milliseconds) into epoch seconds; unknown values count as now
+def _timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, (int, float)):
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+# When an activity happened, for weighting. Dates are client-supplied, so
+# future ones count as now: activity cannot outweigh the present, and the
+# decay weight cannot overflow
+def _activity_time(value: Any) -> float:
+    return min(_timestamp(value), time.time())
+
+# Exponentially decayed counters using forward decay: a contribution made
+# at time t is stored scaled up by 2^((t - reference) / half_life). Newer
+# activity therefore outweighs older activity without ever rescaling the
+# stored scores, and a contribution can be removed exactly
+class DecayedCounter:
+    def __init__(self, half_life_seconds: float, reference: float):
+        self.half_life_seconds = half_life_seconds
+        self.reference = reference
+        self.scores: Dict[str, float] = {}
+        # Contributions per key: a key goes when its last one is removed,
+        # whatever rounding leaves of its score
+        self.counts: Dict[str, int] = {}
+
+    def _scaled(self, weight: float, timestamp: float) -> float:
+        return weight * 2 ** ((timestamp - self.reference) / self.half_life_seconds)
+
+    def add(self, key: str, weight: float, timestamp: float) -> None:
+        self.scores[key] = self.scores.get(key, 0.0) + self._scaled(weight, timestamp)
+        self.counts[key] = self.counts.get(key, 0) + 1
+
+    def remove(self, key: str, weight: float, timestamp: float) -> None:
+        count = self.counts.get(key, 0) - 1
+        if count <= 0:
+            self.scores.pop(key, None)
+            self.counts.pop(key, None)
+            return
+        self.counts[key] = count
+        self.scores[key] = max(0.0, self.scores.get(key, 0.0) - self._scaled(weight, timestamp))
+
+    def top(self, n: int) -> List[str]:
+        return [key for key, _ in sorted(self.scores.items(), key=lambda item: -item[1])[:n]]
+
+class Profile:
+    def __init__(self, half_life_seconds: float, reference: float):
+        self.subjects = DecayedCounter(half_life_seconds, reference)
+        self.weak_areas = DecayedCounter(half_life_seconds, reference)
+        # Open exam-like tasks by id: (due timestamp, title)
+        self.exams: Dict[int, Tuple[float, str]] = {}
+        self.recent_topics: List[str] = []
+        self.struggling_areas: List[str] = []
+        self.upcoming: List[Tuple[float, str]] = []
+
+    def rebuild(self) -> None:
+        self.recent_topics = self.subjects.top(PROFILE_TOP_N)
+        self.struggling_areas = self.weak_areas.top(PROFILE_TOP_N)
+        self.upcoming = sorted(self.exams.values())
+
+# (user id, counter name, key, weight, timestamp)
+Contribution = Tuple[int, str, str, float, float]
+
+class LearnerProfiles:
+    def __init__(self, half_life_days: float = PROFILE_HALF_LIFE_DAYS):
+        self.half_life_seconds = half_life_days * 24 * 60 * 60
+        self.reference = time.time()
+        self.profiles: Dict[int, Profile] = {}
+        self.contributions: Dict[Tuple[str, int], Contribution] = {}
+        # Flashcard sets by id: (user id, label), plus the cards in each set
+        self.sets: Dict[int, Tuple[int, str]] = {}
+        self.set_cards: Dict[int, Dict[int, Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+
+    # Build profiles from what storage already holds, then follow its
+    # mutations
+    def attach(self, source: MemStorage) -> None:
+        for user in list(source.users.values()):
+            for task in source.get_tasks(user["id"]):
+                self.on_mutation("task", None, task)
+            for note in source.get_notes(user["id"]):
+                self.on_mutation("note", None, note)
+            for progress in source.get_study_progress(user["id"]):
+                self.on_mutation("study_progress", None, progress)
+            for flashcard_set in source.get_flashcard_sets(user["id"]):
+                self.on_mutation("flashcard_set", None, flashcard_set)
+                for card in source.get_flashcards(flashcard_set["id"]):
+                    self.on_mutation("flashcard", None, card)
+        source.subscribe(self.on_mutation)
+
+    def _profile(self, user_id: int) -> Profile:
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = Profile(self.half_life_seconds, self.reference)
+        return profile
+
+    def on_mutation(self, entity: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        with self.lock:
+            touched: Set[int] = set()
+            if entity == "note":
+                self._replace(("note", (after or before)["id"]), self._note_contribution(after), touched)
+            elif entity == "study_progress":
+                self._replace(("study_progress", (after or before)["id"]), self._progress_contribution(after), touched)
+            elif entity == "task":
+                self._update_exam(before, after, touched)
+            elif entity == "flashcard_set":
+                self._update_set(before, after, touched)
+            elif entity == "flashcard":
+                self._update_card(before, after, touched)
+            for user_id in touched:
+                self._profile(user_id).rebuild()
+
+    # Swap the contribution recorded for an item for its new one
+    def _replace(self, item: Tuple[str, int], contribution: Optional[Contribution], touched: Set[int]) -> None:
+        previous = self.contributions.pop(item, None)
+        if previous is not None:
+            user_id, counter, key, weight, timestamp = previous
+            getattr(self._profile(user_id), counter).remove(key, weight, timestamp)
+            touched.add(user_id)
+        if contribution is not None:
+            user_id, counter, key, weight, timestamp = contribution
+            getattr(self._profile(user_id), counter).add(key, weight, timestamp)
+            self.contributions[item] = contribution
+            touched.add(user_id)
+
+    def _note_contribution(self, note: Optional[Dict[str, Any]]) -> Optional[Contribution]:
+        if not note or not note.get("subject"):
+            return None
+        return note["userId"], "subjects", note["subject"], 1.0, _activity_time(note.get("updatedAt"))
+
+    def _progress_contribution(self, progress: Optional[Dict[str, Any]]) -> Optional[Contribution]:
+        if not progress or not progress.get("subject"):
+            return None
+        # Weighted by hours studied
+        hours = max(progress.get("studyDuration") or 0, 0) / 60
+        return progress["userId"], "subjects", progress["subject"], hours, _activity_time(progress.get("date"))
+
+    def _update_exam(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]], touched: Set[int]) -> None:
+        task = after or before
+        profile = self._profile(task["userId"])
+        profile.exams.pop(task["id"], None)
+        if after and not after.get("completed") and after.get("dueDate") and _is_exam(after):
+            profile.exams[after["id"]] = (_timestamp(after["dueDate"]), after["title"])
+        touched.add(task["userId"])
+
+    def _update_set(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]], touched: Set[int]) -> None:
+        set_id = (after or before)["id"]
+        if after is None:
+            self.sets.pop(set_id, None)
+            self.set_cards.pop(set_id, None)
+            return
+        self.sets[set_id] = (after["userId"], after.get("title") or after.get("subject") or "Flashcards")
+        # A renamed set moves its cards' weight to the new label
+        for card in self.set_cards.get(set_id, {}).values():
+            self._replace(("flashcard", card["id"]), self._card_contribution(card), touched)
+
+    def _update_card(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]], touched: Set[int]) -> None:
+        card = after or before
+        if before is not None:
+            self.set_cards.get(before["setId"], {}).pop(before["id"], None)
+        if after is not None:
+            self.set_cards.setdefault(after["setId"], {})[after["id"]] = after
+        self._replace(("flashcard", card["id"]), self._card_contribution(after), touched)
+
+    def _card_contribution(self, card: Optional[Dict[str, Any]]) -> Optional[Contribution]:
+        if not card or card.get("proficiency") is None or card["proficiency"] > WEAK_PROFICIENCY:
+            return None
+        owner = self.sets.get(card["setId"])
+        if owner is None:
+            return None
+        user_id, label = owner
+        # Weaker cards weigh more
+        weight = float(WEAK_PROFICIENCY + 1 - card["proficiency"])
+        return user_id, "weak_areas", label, weight, _activity_time(card.get("lastReviewed"))
+
+    # Current profile for a user; reads a precomputed snapshot
+    def read(self, user_id: int) -> Dict[str, List[str]]:
+        with self.lock:
+            profile = self.profiles.get(user_id)
+            if profile is None:
+                return {"recent_topics": [], "upcoming_exams": [], "struggling_areas": []}
+            # Drop exams that have passed from the head of the sorted list
+            now = time.time()
+            passed = 0
+            while passed < len(profile.upcoming) and profile.upcoming[passed][0] < now:
+                passed += 1
+            if passed:
+                profile.upcoming = profile.upcoming[passed:]
+            return {
+                "recent_topics": profile.recent_topics,
+                "upcoming_exams": [title for _, title in profile.upcoming[:PROFILE_TOP_N]],
+                "struggling_areas": profile.struggling_areas
+            }
+
+def _is_exam(task: Dict[str, Any]) -> bool:
+    text = f"{task.get('category') or ''} {task.get('title') or ''}".lower()
+    return any(keyword in text for keyword in EXAM_KEYWORDS)
+
+# Shared instance following the shared storage
+learner_profiles = LearnerProfiles()
+learner_profiles.attach(storage)
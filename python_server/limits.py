@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Deque, Tuple
+
+# Concurrency and rate primitives shared across request threads.
+#
+# Every Flask request drives its coroutines on its own event loop, so
+# asyncio.Semaphore cannot be shared between requests. These primitives
+# keep their state behind a threading.Lock and wake waiters on whichever
+# loop they are parked on.
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.waiters)
+
+    async def acquire(self) -> None:
+        with self.lock:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                return
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self.waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self.lock:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                    raise
+            # The slot was already handed to us; pass it on
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self.lock:
+            if self.waiters:
+                # Hand the slot straight to the next waiter
+                loop, future = self.waiters.popleft()
+                loop.call_soon_threadsafe(self._grant, future)
+                return
+            self.active -= 1
+
+    def _grant(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(True)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+        return False
+
+# Classic token bucket: `rate` tokens per second up to `capacity`
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take a token if one is available right now
+    def try_acquire(self, tokens: float = 1) -> bool:
+        with self.lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    # Reserve a token and return how long the caller must wait for it
+    def reserve(self, tokens: float = 1) -> float:
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
@@ -0,0 +1,272 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+from python_server.limits import ConcurrencyLimiter, TokenBucket
+from python_server.metrics import metrics
+
+# Governor for outbound Gemini calls.
+#
+# Every call passes through, in order: the circuit breaker (fails fast while
+# upstream is unhealthy), a per-user and a global concurrency limit, and a
+# token-bucket rate limit. Transient upstream errors are retried with
+# full-jitter exponential backoff. Callers keep their existing try/except
+# fallbacks; CircuitOpenError simply reaches them without any waiting.
+
+T = TypeVar("T")
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.getenv("LLM_MAX_CONCURRENCY_PER_USER", "4"))
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "5"))
+LLM_RATE_BURST = float(os.getenv("LLM_RATE_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5"))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Hedging: a call still running after its prompt's recent p95 latency gets a
+# second identical request, at most LLM_HEDGE_RATIO extra calls per call made
+LLM_HEDGE_RATIO = float(os.getenv("LLM_HEDGE_RATIO", "0.05"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_PROMPTS = set(os.getenv("LLM_HEDGE_PROMPTS", "concept_map,flashcards").split(","))
+
+# Errors worth retrying: rate limiting, overload and upstream timeouts.
+# google.api_core is slow to import and only matters once the SDK has
+# raised something, so it is loaded on first use
+@lru_cache(maxsize=None)
+def transient_errors() -> Tuple[type, ...]:
+    from google.api_core import exceptions as google_exceptions
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.InternalServerError,
+        google_exceptions.BadGateway,
+        google_exceptions.GatewayTimeout,
+        google_exceptions.DeadlineExceeded,
+        ConnectionError
+    )
+
+@lru_cache(maxsize=None)
+def _client_error() -> type:
+    from google.api_core import exceptions as google_exceptions
+    return google_exceptions.ClientError
+
+# User the current request is acting for; set per request by the app
+llm_user: contextvars.ContextVar[str] = contextvars.ContextVar("llm_user", default="anonymous")
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+# Rejected requests (bad arguments, auth) say nothing about upstream health;
+# rate limiting, server errors and network failures do
+def _counts_against_upstream(error: Exception) -> bool:
+    if isinstance(error, transient_errors()):
+        return True
+    return not isinstance(error, _client_error())
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, cooldown_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    # Raise CircuitOpenError unless a call may go upstream right now
+    def before_call(self) -> None:
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self.trial_in_flight:
+                # Let exactly one trial call probe the upstream
+                self.trial_in_flight = True
+                return
+        metrics.incr("llm.breaker_rejections")
+        raise CircuitOpenError("Gemini circuit breaker is open")
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    # A cancelled call says nothing about upstream health; free the trial
+    def abandon(self) -> None:
+        with self.lock:
+            self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    metrics.incr("llm.breaker_opened")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+# Earns a fraction of a hedge for every call, so extra upstream load stays
+# bounded by the ratio no matter how slow upstream gets
+class HedgeBudget:
+    def __init__(self, ratio: float, capacity: float = 5):
+        self.ratio = ratio
+        self.capacity = capacity
+        self.tokens = 0.0
+        self.lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+class LLMGovernor:
+    def __init__(self):
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN_SECONDS)
+        self.global_limiter = ConcurrencyLimiter(LLM_MAX_CONCURRENCY)
+        self.user_limiters: Dict[str, ConcurrencyLimiter] = {}
+        self.bucket = TokenBucket(LLM_RATE_PER_SEC, LLM_RATE_BURST) if LLM_RATE_PER_SEC > 0 else None
+        self.hedge_budget = HedgeBudget(LLM_HEDGE_RATIO)
+        self.lock = threading.Lock()
+
+    def _user_limiter(self) -> ConcurrencyLimiter:
+        user = llm_user.get()
+        with self.lock:
+            limiter = self.user_limiters.get(user)
+            if limiter is None:
+                limiter = self.user_limiters[user] = ConcurrencyLimiter(LLM_MAX_CONCURRENCY_PER_USER)
+            return limiter
+
+    # Hold a per-user and a global slot, paced by the rate limiter
+    @asynccontextmanager
+    async def slot(self):
+        user_limiter = self._user_limiter()
+        started = time.perf_counter()
+        async with user_limiter:
+            async with self.global_limiter:
+                if self.bucket is not None:
+                    wait = self.bucket.reserve()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                metrics.observe("llm.queue_wait_ms", (time.perf_counter() - started) * 1000)
+                yield
+
+    # Run fn() under the breaker, limits and retry policy
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                async with self.slot():
+                    result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.abandon()
+                raise
+            except Exception as e:
+                if _counts_against_upstream(e):
+                    self.breaker.record_failure()
+                if not isinstance(e, transient_errors()) or attempt >= LLM_MAX_RETRIES:
+                    raise
+                attempt += 1
+                metrics.incr("llm.retries")
+                # Back off outside the slots so other calls can proceed
+                await asyncio.sleep(random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt)))
+                continue
+            self.breaker.record_success()
+            return result
+
+    # Adaptive hedge delay for a prompt: its recent p95 latency in seconds,
+    # or None while hedging is off or there is too little history
+    def hedge_delay(self, prompt_name: str, latency_metric: str) -> Optional[float]:
+        if LLM_HEDGE_RATIO <= 0 or prompt_name not in LLM_HEDGE_PROMPTS:
+            return None
+        if metrics.count(latency_metric) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return metrics.percentile(latency_metric, 0.95) / 1000
+
+    # Like call(), but if the first attempt is still running after
+    # hedge_after seconds a second one is started; the first success wins
+    # and the other is cancelled
+    async def hedged_call(self, fn: Callable[[], Awaitable[T]], hedge_after: Optional[float]) -> T:
+        self.hedge_budget.earn()
+        if hedge_after is None:
+            return await self.call(fn)
+
+        primary = asyncio.ensure_future(self.call(fn))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if done or self.breaker.state != CircuitBreaker.CLOSED or not self.hedge_budget.try_spend():
+                return await primary
+
+            metrics.incr("llm.hedges")
+            secondary = asyncio.ensure_future(self.call(fn))
+            pending = {primary, secondary}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is secondary:
+                            metrics.incr("llm.hedge_wins")
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    # Streaming calls hold their slot for the whole stream and are not
+    # retried, since chunks may already have been delivered
+    @asynccontextmanager
+    async def stream(self):
+        self.breaker.before_call()
+        try:
+            async with self.slot():
+                yield
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except GeneratorExit:
+            # The consumer stopped reading; upstream was delivering fine
+            self.breaker.record_success()
+            raise
+        except Exception as e:
+            if _counts_against_upstream(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+
+    def in_flight(self) -> int:
+        return self.global_limiter.active
+
+# Shared instance used by gemini_service
+governor = LLMGovernor()
+
+metrics.register_gauge("llm.breaker_state", lambda: governor.breaker.state)
+metrics.register_gauge("llm.queue_depth", lambda: governor.global_limiter.queue_depth)
+metrics.register_gauge("llm.in_flight", governor.in_flight)
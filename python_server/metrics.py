@@ -0,0 +1,104 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict
+
+# Number of recent samples each histogram keeps for percentile estimates
+HISTOGRAM_WINDOW = 1024
+
+# Rolling window of observations with cheap percentile lookups
+class Histogram:
+    def __init__(self, window: int = HISTOGRAM_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50": round(self.percentile(0.50), 2),
+            "p95": round(self.percentile(0.95), 2),
+            "p99": round(self.percentile(0.99), 2)
+        }
+
+# Process-wide registry of counters, gauges and histograms
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, Callable[[], Any]] = {}
+        self.histograms: Dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name: str) -> int:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            return histogram.count if histogram else 0
+
+    def percentile(self, name: str, q: float) -> float:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            return histogram.percentile(q) if histogram else 0.0
+
+    # Gauges are read lazily through a callback when a snapshot is taken
+    def register_gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        with self.lock:
+            self.gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {name: h.summary() for name, h in self.histograms.items()}
+
+        gauge_values = {}
+        for name, fn in gauges.items():
+            try:
+                gauge_values[name] = fn()
+            except Exception as e:
+                gauge_values[name] = f"error: {e}"
+
+        return {
+            "counters": counters,
+            "gauges": gauge_values,
+            "histograms": histograms
+        }
+
+# Context manager that records elapsed milliseconds into a histogram
+class timed:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        metrics.observe(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+# Shared instance used across the server
+metrics = Metrics()
@@ -0,0 +1,333 @@
+import bisect
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from python_server.storage import MemStorage, storage
+
+# Study planner: packs open tasks into the free time around study sessions.
+#
+# Free time is the daily study window (PLANNER_DAY_START_HOUR to
+# PLANNER_DAY_END_HOUR in the user's time, given as a fixed offset from UTC)
+# over the next PLANNER_HORIZON_DAYS, minus the user's study sessions.
+# Stored times without an offset are read as UTC, and plans are returned
+# with UTC timestamps. Open tasks are taken earliest deadline first
+# (priority, then id, breaking ties; tasks without a due date go last) and
+# each is given the earliest free time left, split into blocks of at most
+# PLANNER_MAX_BLOCK_MINUTES with a short break between consecutive blocks.
+# Fragments shorter than PLANNER_MIN_BLOCK_MINUTES are skipped. With
+# preemption allowed, EDF is the order that keeps every task on time
+# whenever any order can; tasks it still cannot fit before their due date
+# are marked late.
+#
+# A task's effort is its `estimatedMinutes`, or a default by priority, less
+# the time already booked in sessions linked to it through `taskId` (which
+# is how applied plans are recorded).
+#
+# Because each task only takes time after the tasks before it, the plan is
+# a single sweep with a cursor that only moves forward. The planner keeps
+# the cursor position before every task, so when one task or session
+# changes it re-plans from the first task the change can affect and keeps
+# the blocks of every task before it. Mutations arrive through storage
+# hooks and only mark where re-planning starts; the work happens on read.
+
+PLANNER_HORIZON_DAYS = int(os.getenv("PLANNER_HORIZON_DAYS", "14"))
+PLANNER_DAY_START_HOUR = int(os.getenv("PLANNER_DAY_START_HOUR", "8"))
+PLANNER_DAY_END_HOUR = int(os.getenv("PLANNER_DAY_END_HOUR", "22"))
+PLANNER_MIN_BLOCK_MINUTES = int(os.getenv("PLANNER_MIN_BLOCK_MINUTES", "30"))
+PLANNER_MAX_BLOCK_MINUTES = int(os.getenv("PLANNER_MAX_BLOCK_MINUTES", "90"))
+PLANNER_BREAK_MINUTES = int(os.getenv("PLANNER_BREAK_MINUTES", "10"))
+# Offset of users' local time from UTC when the client does not send one
+PLANNER_UTC_OFFSET_MINUTES = int(os.getenv("PLANNER_UTC_OFFSET_MINUTES", "0"))
+
+# Effort assumed for tasks without estimatedMinutes, by priority
+DEFAULT_EFFORT_MINUTES = {1: 120, 2: 90, 3: 60}
+# Sessions without an end time are taken to last this long
+DEFAULT_SESSION_MINUTES = 60
+# Plans start at the next multiple of this many seconds
+SLOT_SECONDS = 15 * 60
+
+# Parse the mix of timestamps storage holds (ISO strings, datetimes, epoch
+# milliseconds) into epoch seconds; None when absent or unreadable. Naive
+# values are UTC, so plans do not depend on the server's timezone
+def _timestamp(value: Any) -> Optional[float]:
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value / 1000 if value > 1e11 else float(value)
+    return None
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+# Deadline, priority, id: the order tasks are planned in
+TaskKey = Tuple[float, int, int]
+
+class PlannedTask:
+    def __init__(self, task: Dict[str, Any]):
+        self.id = task["id"]
+        self.title = task.get("title") or "Task"
+        self.subject = task.get("category")
+        self.priority = task.get("priority") or 2
+        self.deadline = _timestamp(task.get("dueDate"))
+        estimate = task.get("estimatedMinutes")
+        if isinstance(estimate, (int, float)) and not isinstance(estimate, bool) and estimate > 0:
+            minutes = float(estimate)
+        else:
+            minutes = float(DEFAULT_EFFORT_MINUTES.get(self.priority, 90))
+        self.effort = minutes * 60
+        self.key: TaskKey = (self.deadline if self.deadline is not None else math.inf, self.priority, self.id)
+
+class Placement:
+    def __init__(self, blocks: List[Tuple[float, float]], unscheduled: float):
+        self.blocks = blocks
+        self.unscheduled = unscheduled
+
+class UserPlan:
+    def __init__(self):
+        self.tasks: Dict[int, PlannedTask] = {}
+        self.order: List[TaskKey] = []
+        # Session id: (start, end, linked task id)
+        self.sessions: Dict[int, Tuple[float, float, Optional[int]]] = {}
+        # Seconds booked in sessions linked to each task
+        self.booked: Dict[int, float] = {}
+
+        self.origin: Optional[float] = None
+        self.utc_offset: Optional[int] = None
+        self.free: List[Tuple[float, float]] = []
+        self.free_ends: List[float] = []
+        self.free_stale = True
+        # cursors[i] is the cursor before the i-th task in order, and
+        # placements[i] that task's blocks; both are valid for the first
+        # len(placements) tasks
+        self.cursors: List[float] = []
+        self.placements: List[Placement] = []
+
+    def invalidate_from(self, position: int) -> None:
+        if position < len(self.placements):
+            del self.placements[position:]
+            del self.cursors[position + 1:]
+
+    # First task whose blocks may reach past `moment`; every task before it
+    # finished by then
+    def position_after(self, moment: float) -> int:
+        if not self.placements:
+            return 0
+        return max(0, bisect.bisect_right(self.cursors, moment, 1, len(self.placements) + 1) - 1)
+
+    def position_of(self, key: TaskKey) -> int:
+        return bisect.bisect_left(self.order, key)
+
+class StudyPlanner:
+    def __init__(self):
+        self.plans: Dict[int, UserPlan] = {}
+        self.lock = threading.Lock()
+
+    # Load tasks and sessions storage already holds, then follow its
+    # mutations
+    def attach(self, source: MemStorage) -> None:
+        for user in list(source.users.values()):
+            for session in source.get_study_sessions(user["id"]):
+                self.on_mutation("study_session", None, session)
+            for task in source.get_tasks(user["id"]):
+                self.on_mutation("task", None, task)
+        source.subscribe(self.on_mutation)
+
+    def _plan(self, user_id: int) -> UserPlan:
+        plan = self.plans.get(user_id)
+        if plan is None:
+            plan = self.plans[user_id] = UserPlan()
+        return plan
+
+    def on_mutation(self, entity: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        if entity not in ("task", "study_session"):
+            return
+        with self.lock:
+            if entity == "task":
+                self._update_task(before, after)
+            else:
+                self._update_session(before, after)
+
+    def _update_task(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        record = after or before
+        plan = self._plan(record["userId"])
+        affected = len(plan.order)
+        previous = plan.tasks.pop(record["id"], None)
+        if previous is not None:
+            position = plan.position_of(previous.key)
+            del plan.order[position]
+            affected = position
+        if after is not None and not after.get("completed"):
+            task = PlannedTask(after)
+            plan.tasks[task.id] = task
+            position = plan.position_of(task.key)
+            plan.order.insert(position, task.key)
+            affected = min(affected, position)
+        plan.invalidate_from(affected)
+
+    def _update_session(self, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        record = after or before
+        plan = self._plan(record["userId"])
+        affected = len(plan.order)
+        previous = plan.sessions.pop(record["id"], None)
+        if previous is not None:
+            affected = min(affected, self._unbook(plan, previous))
+        if after is not None:
+            start = _timestamp(after.get("startTime"))
+            if start is not None:
+                end = _timestamp(after.get("endTime")) or start + DEFAULT_SESSION_MINUTES * 60
+                linked = after.get("taskId") if isinstance(after.get("taskId"), int) else None
+                session = (start, max(start, end), linked)
+                plan.sessions[after["id"]] = session
+                affected = min(affected, self._book(plan, session))
+        plan.free_stale = True
+        plan.invalidate_from(affected)
+
+    # Record a session; returns the first task position it can affect
+    def _book(self, plan: UserPlan, session: Tuple[float, float, Optional[int]]) -> int:
+        start, end, linked = session
+        affected = plan.position_after(start)
+        if linked is not None:
+            plan.booked[linked] = plan.booked.get(linked, 0.0) + (end - start)
+            task = plan.tasks.get(linked)
+            if task is not None:
+                affected = min(affected, plan.position_of(task.key))
+        return affected
+
+    def _unbook(self, plan: UserPlan, session: Tuple[float, float, Optional[int]]) -> int:
+        start, end, linked = session
+        affected = plan.position_after(start)
+        if linked is not None:
+            plan.booked[linked] = plan.booked.get(linked, 0.0) - (end - start)
+            if plan.booked[linked] <= 1e-6:
+                del plan.booked[linked]
+            task = plan.tasks.get(linked)
+            if task is not None:
+                affected = min(affected, plan.position_of(task.key))
+        return affected
+
+    # Daily study windows from the origin to the horizon, minus sessions
+    def _free_time(self, plan: UserPlan, origin: float, utc_offset: int) -> List[Tuple[float, float]]:
+        busy = sorted((start, end) for start, end, _ in plan.sessions.values())
+        horizon = origin + PLANNER_HORIZON_DAYS * 24 * 60 * 60
+        free: List[Tuple[float, float]] = []
+        index = 0
+        offset = utc_offset * 60
+        # Local midnight of the origin's day, as epoch seconds
+        local = datetime.fromtimestamp(origin + offset, timezone.utc)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0).timestamp() - offset
+        while True:
+            window_start = max(origin, midnight + PLANNER_DAY_START_HOUR * 3600)
+            window_end = min(horizon, midnight + PLANNER_DAY_END_HOUR * 3600)
+            if window_start >= horizon:
+                break
+            # Sessions are sorted by start: skip the ones that ended before
+            # this window, then cut the window around the rest that overlap
+            while index < len(busy) and busy[index][1] <= window_start:
+                index += 1
+            cursor = window_start
+            scan = index
+            while scan < len(busy) and busy[scan][0] < window_end:
+                start, end = busy[scan]
+                if start > cursor:
+                    free.append((cursor, start))
+                cursor = max(cursor, end)
+                scan += 1
+            if cursor < window_end:
+                free.append((cursor, window_end))
+            midnight += 24 * 60 * 60
+        return free
+
+    # Bring a user's plan up to date for a plan starting at `origin`, with
+    # study windows `utc_offset` minutes ahead of UTC
+    def _replan(self, plan: UserPlan, origin: float, utc_offset: int) -> None:
+        if plan.origin != origin or plan.utc_offset != utc_offset:
+            plan.origin = origin
+            plan.utc_offset = utc_offset
+            plan.free_stale = True
+            plan.invalidate_from(0)
+        if plan.free_stale:
+            plan.free = self._free_time(plan, origin, utc_offset)
+            plan.free_ends = [end for _, end in plan.free]
+            plan.free_stale = False
+        if not plan.cursors:
+            plan.cursors.append(origin)
+
+        min_block = PLANNER_MIN_BLOCK_MINUTES * 60
+        max_block = PLANNER_MAX_BLOCK_MINUTES * 60
+        pause = PLANNER_BREAK_MINUTES * 60
+        free = plan.free
+        cursor = plan.cursors[len(plan.placements)]
+        interval = bisect.bisect_right(plan.free_ends, cursor)
+
+        for key in plan.order[len(plan.placements):]:
+            task = plan.tasks[key[2]]
+            remaining = task.effort - plan.booked.get(task.id, 0.0)
+            blocks: List[Tuple[float, float]] = []
+            while remaining > 0 and interval < len(free):
+                start = max(cursor, free[interval][0])
+                available = free[interval][1] - start
+                if available < min(min_block, remaining):
+                    cursor = free[interval][1]
+                    interval += 1
+                    continue
+                length = min(available, remaining, max_block)
+                blocks.append((start, start + length))
+                remaining -= length
+                cursor = start + length
+                if remaining > 0 and length == max_block:
+                    cursor += pause
+                if cursor >= free[interval][1]:
+                    interval += 1
+            plan.placements.append(Placement(blocks, max(0.0, remaining)))
+            plan.cursors.append(cursor)
+
+    # The plan for a user as study session blocks, earliest first, plus the
+    # work that does not fit before the horizon
+    def read(self, user_id: int, now: Optional[float] = None, utc_offset: Optional[int] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        utc_offset = PLANNER_UTC_OFFSET_MINUTES if utc_offset is None else utc_offset
+        origin = math.ceil(now / SLOT_SECONDS) * SLOT_SECONDS
+        with self.lock:
+            plan = self._plan(user_id)
+            self._replan(plan, origin, utc_offset)
+            blocks = []
+            unscheduled = []
+            for key, placement in zip(plan.order, plan.placements):
+                task = plan.tasks[key[2]]
+                for start, end in placement.blocks:
+                    blocks.append({
+                        "taskId": task.id,
+                        "title": task.title,
+                        "startTime": _iso(start),
+                        "endTime": _iso(end),
+                        "subject": task.subject,
+                        "description": f"Planned work on {task.title}",
+                        "late": task.deadline is not None and end > task.deadline
+                    })
+                if placement.unscheduled > 0:
+                    unscheduled.append({
+                        "taskId": task.id,
+                        "title": task.title,
+                        "minutes": math.ceil(placement.unscheduled / 60)
+                    })
+            return {
+                "generatedAt": _iso(now),
+                "horizonEnd": _iso(origin + PLANNER_HORIZON_DAYS * 24 * 60 * 60),
+                "blocks": blocks,
+                "unscheduled": unscheduled
+            }
+
+# Shared planner following the shared storage
+study_planner = StudyPlanner()
+study_planner.attach(storage)
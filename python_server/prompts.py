@@ -0,0 +1,304 @@
+import os
+import string
+import textwrap
+from typing import Any, Dict, List, Optional, Tuple
+
+from python_server.tokens import estimate_tokens
+
+# Versioned registry of the Gemini prompt templates.
+#
+# Templates use str.format syntax ({field}, with {{ }} for literal braces)
+# and are compiled once at import: the text is dedented, split into literal
+# and field segments, and the token cost of the literal parts is estimated
+# up front. Each prompt has a "verbose" variant (worked JSON examples) and a
+# "compact" one that relies on schema-constrained JSON output instead.
+# PROMPT_MODE picks the default variant; native JSON mode makes the worked
+# examples redundant, so compact is the default there.
+
+PROMPT_MODE = os.getenv(
+    "PROMPT_MODE",
+    "compact" if os.getenv("GEMINI_JSON_MODE", "native") == "native" else "verbose"
+)
+
+class PromptTemplate:
+    def __init__(self, name: str, mode: str, version: int, text: str):
+        self.name = name
+        self.mode = mode
+        self.version = version
+        self.text = "\n".join(line.rstrip() for line in textwrap.dedent(text).strip("\n").split("\n"))
+        self.segments: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in string.Formatter().parse(self.text)
+        ]
+        self.fields = [field for _, field in self.segments if field]
+        self.static_tokens = estimate_tokens("".join(literal for literal, _ in self.segments))
+
+    # Identifier used for metrics, e.g. "flashcards.compact.v2"
+    @property
+    def key(self) -> str:
+        return f"{self.name}.{self.mode}.v{self.version}"
+
+    def render(self, **values: Any) -> str:
+        parts: List[str] = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field:
+                parts.append(str(values[field]))
+        return "".join(parts)
+
+    # Token estimate without rendering the full prompt
+    def estimate(self, **values: Any) -> int:
+        return self.static_tokens + sum(estimate_tokens(str(values[field])) for field in self.fields)
+
+PROMPTS: Dict[Tuple[str, str], PromptTemplate] = {}
+
+def register(name: str, mode: str, version: int, text: str) -> PromptTemplate:
+    template = PromptTemplate(name, mode, version, text)
+    current = PROMPTS.get((name, mode))
+    if current is None or current.version < version:
+        PROMPTS[(name, mode)] = template
+    return template
+
+def get_prompt(name: str, mode: Optional[str] = None) -> PromptTemplate:
+    mode = mode or PROMPT_MODE
+    template = PROMPTS.get((name, mode)) or PROMPTS.get((name, "verbose"))
+    if template is None:
+        raise KeyError(f"Unknown prompt template: {name}")
+    return template
+
+# Templates that have no worked examples are shared by both modes
+def register_shared(name: str, version: int, text: str) -> None:
+    register(name, "verbose", version, text)
+    register(name, "compact", version, text)
+
+# Flashcards from notes
+register("flashcards", "verbose", 1, """
+Create {count} comprehensive, academic-level flashcards based on the following notes about {subject}:
+
+{notes}
+
+For each flashcard:
+1. Create a specific, thought-provoking question that tests deep understanding of a particular aspect of the subject
+2. Provide a detailed, comprehensive answer (150-200 words) that:
+   - Thoroughly explains the concept with academic precision
+   - Includes relevant examples, applications, or case studies when appropriate
+   - Mentions connections to related concepts
+   - Addresses common misconceptions or nuances
+   - Uses proper terminology and scholarly language
+
+Each flashcard should focus on a different aspect of the topic, covering where appropriate:
+- Foundational principles and definitions
+- Historical context or development
+- Key components, mechanisms, or methodologies
+- Practical applications or real-world relevance
+- Theoretical frameworks
+- Contemporary research or emerging directions
+- Critical analysis or limitations
+
+Format your response as a valid JSON object with a "flashcards" array containing objects with question and answer fields.
+
+Example:
+{{
+  "flashcards": [
+    {{
+      "question": "What is the fundamental principle underlying photosynthesis and how does it serve as a critical biological energy conversion process?",
+      "answer": "Photosynthesis represents one of nature's most elegant energy conversion mechanisms, wherein light energy is transformed into chemical energy through a sophisticated series of biochemical reactions. At its core, this process harnesses photons from sunlight to split water molecules, releasing oxygen as a byproduct, while simultaneously reducing carbon dioxide to form energy-rich carbohydrates. This fundamental principle establishes photosynthesis as the primary entry point for energy into most ecosystems, creating the foundation for nearly all food webs on Earth. The process occurs predominantly in chloroplasts containing specialized pigments like chlorophyll that absorb specific wavelengths of light, initiating electron transport chains that ultimately generate ATP and NADPH. These energy carriers subsequently power the Calvin cycle, where carbon dioxide is incorporated into organic molecules. Beyond its role in energy conversion, photosynthesis has profoundly influenced Earth's atmosphere through oxygen production, making it not only essential for plant metabolism but also indirectly responsible for supporting aerobic life forms across the planet."
+    }}
+  ]
+}}
+""")
+
+register("flashcards", "compact", 1, """
+Create {count} academic-level flashcards based on the following notes about {subject}:
+
+{notes}
+
+Each flashcard has a specific, thought-provoking question testing deep understanding of one aspect of the subject, and a 150-200 word answer with academic precision, relevant examples or applications, connections to related concepts, and common misconceptions or nuances.
+Cover different aspects: principles and definitions, history, mechanisms or methods, applications, theory, current research, limitations.
+
+Return JSON: {{"flashcards": [{{"question": string, "answer": string}}]}}
+""")
+
+# Optional notes context prepended to the concept map prompt
+register("concept_map_notes", "verbose", 1, """
+Based on the following notes provided by the user:
+
+{notes}
+""")
+
+register("concept_map_notes", "compact", 1, """
+Notes provided by the user:
+
+{notes}
+""")
+
+# Concept map for a topic
+register("concept_map", "verbose", 2, """
+{note_context}Create a concept map for the topic "{topic}".
+
+A concept map should include:
+1. Main concept (the topic itself at the top level)
+2. Key sub-concepts (5-8 important components or aspects) branching from the main concept
+3. Only these two levels; deeper sub-concepts are generated separately when the user expands a concept
+4. Brief but informative descriptions for each concept
+
+Format your response as a valid JSON object with:
+1. "nodes": Array of objects, each with:
+   - "id": Unique string identifier (numbers only)
+   - "label": Short name of the concept (1-4 words)
+   - "description": Brief but comprehensive explanation of the concept (2-3 sentences)
+   - "bulletPoints": Array of 3-4 key points about this concept
+
+2. "edges": Array of objects, each with:
+   - "source": The id of the source node
+   - "target": The id of the target node
+
+For example, for topic "Photosynthesis":
+
+{{
+  "nodes": [
+    {{
+      "id": "1",
+      "label": "Photosynthesis",
+      "description": "The sophisticated biochemical process by which green plants, algae, and certain bacteria harness solar energy to convert carbon dioxide and water into organic compounds (primarily glucose) and release oxygen as a byproduct. This fundamental process is the primary means by which energy from sunlight enters the biosphere and serves as the foundation for most food chains on Earth.",
+      "bulletPoints": [
+        "Converts light energy into chemical energy stored in glucose molecules through a complex series of electron transfers and enzymatic reactions",
+        "Takes place in specialized organelles called chloroplasts which contain thylakoid membranes where light-dependent reactions occur and stroma where carbon fixation happens",
+        "Essential for most life on Earth as it produces oxygen, removes carbon dioxide, and provides the base of nearly all food webs through primary production",
+        "Occurs in two main stages: the light-dependent reactions (photosystems I and II) and the light-independent reactions (Calvin cycle)",
+        "The complete biochemical equation can be represented as: 6CO₂ + 6H₂O + light energy → C₆H₁₂O₆ + 6O₂"
+      ]
+    }},
+    {{
+      "id": "2",
+      "label": "Light-Dependent Reactions",
+      "description": "The initial stage of photosynthesis where electromagnetic radiation from the sun is captured by photosynthetic pigments (primarily chlorophyll) and converted into chemical energy in the form of ATP and NADPH. These reactions occur exclusively in the thylakoid membrane system of chloroplasts and are responsible for the production of oxygen as a byproduct through the photolysis of water molecules.",
+      "bulletPoints": [
+        "Requires direct light energy, specifically wavelengths within the visible spectrum that are absorbed by specialized pigment molecules arranged in light-harvesting complexes",
+        "Produces energy carriers ATP (adenosine triphosphate) through photophosphorylation and reduces NADP+ to NADPH, both of which are subsequently used in the Calvin cycle",
+        "Releases molecular oxygen (O₂) as a byproduct through the splitting of water molecules in a process called photolysis, which has dramatically altered Earth's atmosphere over evolutionary time",
+        "Involves two specialized protein complexes called photosystems I and II which contain different types of chlorophyll molecules and function in series through the Z-scheme of electron transport",
+        "Utilizes both cyclic and non-cyclic electron flow pathways to meet varying cellular energy requirements and maintain appropriate ratios of ATP to NADPH for downstream metabolic processes"
+      ]
+    }}
+  ],
+  "edges": [
+    {{
+      "source": "1",
+      "target": "2"
+    }}
+  ]
+}}
+
+Do not include any positional information like x or y coordinates. Ensure each node has a unique ID and that edges correctly define the hierarchical relationships between concepts.
+""")
+
+register("concept_map", "compact", 2, """
+{note_context}Create a concept map for the topic "{topic}": the main concept and 5-8 key sub-concepts branching from it. Only these two levels; deeper levels are generated on demand.
+
+Return JSON: {{"nodes": [{{"id": numeric string, "label": 1-4 words, "description": 2-3 sentences, "bulletPoints": 3-4 key points}}], "edges": [{{"source": id, "target": id}}]}}
+Node "1" is the main concept. Edges define the hierarchy. No x or y coordinates.
+""")
+
+# Children for one node of an existing concept map
+register("concept_expand", "verbose", 1, """
+In a concept map about "{topic}", expand the concept "{label}".
+
+Path from the main concept: {path}
+{description}
+Sub-concepts it already has (do not repeat these): {existing}
+
+Create {count} sub-concepts of "{label}" that deepen understanding of it. For each provide:
+- "id": Unique string identifier (numbers only)
+- "label": Short name of the concept (1-4 words)
+- "description": Brief but comprehensive explanation of the concept (2-3 sentences)
+- "bulletPoints": Array of 3-4 key points about this concept
+
+Format your response as a valid JSON object with a "nodes" array of these objects. Do not include "{label}" itself, edges, or any positional information.
+""")
+
+register("concept_expand", "compact", 1, """
+In a concept map about "{topic}", create {count} sub-concepts of "{label}" that deepen understanding of it.
+
+Path from the main concept: {path}
+{description}
+Already present, do not repeat: {existing}
+
+Return JSON: {{"nodes": [{{"id": numeric string, "label": 1-4 words, "description": 2-3 sentences, "bulletPoints": 3-4 key points}}]}}
+Do not include "{label}" itself.
+""")
+
+# Study recommendations
+register("recommendations", "verbose", 2, """
+Based on the following information, provide 3 personalized study recommendations:
+
+Recent topics studied: {recent_topics}
+Upcoming exams: {upcoming_exams}
+Areas the student is struggling with: {struggling_areas}
+
+For each recommendation, provide:
+1. A short title (max 5 words)
+2. A brief description explaining the recommendation (max 15 words)
+3. A type ("AI Suggested", "Pomodoro", "Resource", "Quiz", or "Review")
+4. An icon name from Material Icons (use one of: psychology, schedule, auto_stories, quiz, summarize)
+
+Format your response as a valid JSON object with a "recommendations" array containing objects with fields: title, description, type, and icon.
+
+Example:
+{{
+  "recommendations": [
+    {{
+      "title": "Practice Calculus Problems",
+      "description": "Focus on derivatives and integrals",
+      "type": "AI Suggested",
+      "icon": "psychology"
+    }}
+  ]
+}}
+""")
+
+register("recommendations", "compact", 2, """
+Provide 3 personalized study recommendations.
+
+Recent topics studied: {recent_topics}
+Upcoming exams: {upcoming_exams}
+Areas the student is struggling with: {struggling_areas}
+
+Return JSON: {{"recommendations": [{{"title": max 5 words, "description": max 15 words, "type": "AI Suggested" | "Pomodoro" | "Resource" | "Quiz" | "Review", "icon": "psychology" | "schedule" | "auto_stories" | "quiz" | "summarize"}}]}}
+""")
+
+# Enhanced notes
+register_shared("enhance_notes", 1, """
+Enhance the following student notes on {subject}:
+
+{notes}
+
+Please provide:
+1. An enhanced, structured version of the notes that:
+   - Improves organization with clear headings and subheadings
+   - Expands abbreviated concepts with complete explanations
+   - Adds missing context or connections between topics
+   - Fills in any apparent gaps or incomplete information
+   - Corrects any factual inaccuracies or misconceptions
+
+2. A summary of 3-5 key concepts covered in these notes
+
+3. A list of 3-5 additional resources (books, articles, websites) for further study
+
+Format your response as a JSON object with enhancedNotes, keyConcepts, and additionalResources fields.
+""")
+
+# Flashcards for a batch of concept map nodes
+register_shared("concept_flashcards", 1, """
+Create {count} comprehensive, academic-level flashcards for EACH of the concepts below.
+
+For each flashcard, write a specific, thought-provoking question that tests deep understanding,
+and a detailed answer (150-200 words) with academic precision, examples or applications,
+connections to related concepts, and common misconceptions where relevant. Each flashcard
+for a concept should cover a different aspect of that concept.
+
+{sections}
+
+Format your response as a valid JSON object with a "concepts" array. Each entry has the
+"index" of the concept (the number after "Concept") and a "flashcards" array of objects
+with question and answer fields.
+""")
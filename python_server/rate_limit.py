@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from python_server.llm_governor import llm_user
+from python_server.metrics import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Inbound rate limits and daily LLM token quotas.
+#
+# Each (user, request class) pair has a token bucket: `per_minute` requests
+# a minute on average with bursts of up to `burst`. Requests over the limit
+# get 429 with Retry-After; every limited response carries the RateLimit-*
+# headers so clients can pace themselves. Separately, the LLM tokens each
+# user spends (as recorded by gemini_service) are counted per UTC day, and
+# AI requests are refused once the day's quota is used up.
+#
+# Bucket and quota state lives in a backend. The default keeps it in this
+# process, which is enough for a single worker; with several workers set
+# RATE_LIMIT_BACKEND_URL to a Redis URL so they share one set of counters.
+# A backend error never blocks a request: the limiter fails open.
+
+RATE_LIMITS_ENABLED = os.getenv("RATE_LIMITS_ENABLED", "true").lower() not in ("0", "false", "no")
+RATE_LIMIT_BACKEND_URL = os.getenv("RATE_LIMIT_BACKEND_URL", "")
+# Tokens (input + output) each user may spend on Gemini per UTC day; 0 disables
+LLM_DAILY_TOKEN_QUOTA = int(os.getenv("LLM_DAILY_TOKEN_QUOTA", "500000"))
+
+# Idle buckets are dropped from the in-process backend past this many keys
+MEMORY_BACKEND_MAX_KEYS = 100000
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the bucket is full again, and until the request would
+    # have been allowed (0 when it was)
+    reset: float
+    retry_after: float
+
+class RateLimit:
+    def __init__(self, per_minute: float, burst: int):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.burst = max(1, burst)
+
+# Storage for bucket levels and counters. `take` refills the bucket under
+# `key` and takes `cost` tokens from it if it holds enough; it returns
+# whether it did and the level left. `add` increases a counter that
+# expires `ttl` seconds after it was created.
+class RateLimitBackend:
+    def take(self, key: str, rate: float, capacity: float, cost: float) -> Tuple[bool, float]:
+        raise NotImplementedError
+
+    def add(self, key: str, amount: int, ttl: int) -> int:
+        raise NotImplementedError
+
+    def get(self, key: str) -> int:
+        raise NotImplementedError
+
+class MemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys: int = MEMORY_BACKEND_MAX_KEYS):
+        self.max_keys = max_keys
+        self.buckets: Dict[str, Tuple[float, float, float, float]] = {}
+        self.counters: Dict[str, Tuple[int, float]] = {}
+        self.lock = threading.Lock()
+
+    def take(self, key: str, rate: float, capacity: float, cost: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = (tokens, now, rate, capacity)
+            if len(self.buckets) > self.max_keys:
+                self._prune(now)
+        return allowed, tokens
+
+    # A bucket that has refilled completely is the same as no bucket
+    def _prune(self, now: float) -> None:
+        self.buckets = {
+            key: bucket for key, bucket in self.buckets.items()
+            if bucket[0] + (now - bucket[1]) * bucket[2] < bucket[3]
+        }
+
+    def add(self, key: str, amount: int, ttl: int) -> int:
+        now = time.time()
+        with self.lock:
+            total, expires = self.counters.get(key, (0, now + ttl))
+            if expires <= now:
+                total, expires = 0, now + ttl
+            total += amount
+            self.counters[key] = (total, expires)
+            if len(self.counters) > self.max_keys:
+                self.counters = {k: v for k, v in self.counters.items() if v[1] > now}
+        return total
+
+    def get(self, key: str) -> int:
+        entry = self.counters.get(key)
+        if entry is None or entry[1] <= time.time():
+            return 0
+        return entry[0]
+
+# Bucket refill and take in one round trip, atomic across workers
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = capacity
+if bucket[1] then
+  tokens = math.min(capacity, tonumber(bucket[1]) + (now - tonumber(bucket[2])) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class RedisBackend(RateLimitBackend):
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str, rate: float, capacity: float, cost: float) -> Tuple[bool, float]:
+        allowed, tokens = self.script(keys=[f"ratelimit:{key}"], args=[rate, capacity, cost])
+        return bool(allowed), float(tokens)
+
+    def add(self, key: str, amount: int, ttl: int) -> int:
+        name = f"ratelimit:{key}"
+        pipeline = self.client.pipeline()
+        pipeline.incrby(name, amount)
+        pipeline.expire(name, ttl, nx=True)
+        total, _ = pipeline.execute()
+        return int(total)
+
+    def get(self, key: str) -> int:
+        return int(self.client.get(f"ratelimit:{key}") or 0)
+
+def _backend() -> RateLimitBackend:
+    if RATE_LIMIT_BACKEND_URL:
+        if redis is None:
+            print("RATE_LIMIT_BACKEND_URL is set but the redis package is not installed; keeping rate limits in process")
+        else:
+            return RedisBackend(RATE_LIMIT_BACKEND_URL)
+    return MemoryBackend()
+
+def _limit(name: str, per_minute: float, burst: int) -> RateLimit:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return RateLimit(
+        float(os.getenv(f"{prefix}_PER_MINUTE", str(per_minute))),
+        int(os.getenv(f"{prefix}_BURST", str(burst)))
+    )
+
+def _seconds_to_midnight(now: datetime) -> int:
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(1, int((tomorrow - now).total_seconds()))
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend, limits: Dict[str, RateLimit], daily_tokens: int):
+        self.backend = backend
+        self.limits = limits
+        self.daily_tokens = daily_tokens
+
+    # A cost above the burst could never be allowed, however long the
+    # caller waits
+    def exceeds_burst(self, request_class: str, cost: int) -> bool:
+        limit = self.limits.get(request_class)
+        return limit is not None and cost > limit.burst
+
+    def check(self, user: str, request_class: str, cost: int = 1) -> Optional[Decision]:
+        limit = self.limits.get(request_class)
+        if limit is None:
+            return None
+        try:
+            allowed, tokens = self.backend.take(f"{user}:{request_class}", limit.rate, limit.burst, cost)
+        except Exception as e:
+            print(f"Rate limit backend error, allowing request: {e}")
+            metrics.incr("ratelimit.backend_errors")
+            return None
+        if not allowed:
+            metrics.incr(f"ratelimit.{request_class}.limited")
+        return Decision(
+            allowed=allowed,
+            limit=limit.burst,
+            remaining=int(tokens),
+            reset=(limit.burst - tokens) / limit.rate,
+            retry_after=0.0 if allowed else (cost - tokens) / limit.rate
+        )
+
+    def _quota_key(self, user: str, now: datetime) -> str:
+        return f"quota:{user}:{now.date().isoformat()}"
+
+    # LLM tokens the user has left today, and seconds until the quota resets.
+    # None when quotas are off
+    def quota(self, user: str) -> Optional[Tuple[int, int]]:
+        if self.daily_tokens <= 0:
+            return None
+        now = datetime.now(timezone.utc)
+        try:
+            used = self.backend.get(self._quota_key(user, now))
+        except Exception as e:
+            print(f"Rate limit backend error, skipping quota check: {e}")
+            metrics.incr("ratelimit.backend_errors")
+            return None
+        return max(0, self.daily_tokens - used), _seconds_to_midnight(now)
+
+    # Count tokens spent on an LLM call against the current user's quota
+    def charge(self, tokens: int, user: Optional[str] = None) -> None:
+        if self.daily_tokens <= 0 or tokens <= 0:
+            return
+        now = datetime.now(timezone.utc)
+        try:
+            self.backend.add(self._quota_key(user or llm_user.get(), now), tokens, 2 * 24 * 3600)
+        except Exception as e:
+            print(f"Rate limit backend error, LLM usage not counted: {e}")
+            metrics.incr("ratelimit.backend_errors")
+
+# Shared limiter used by the app, one limit per request class (see
+# bulkhead.py for the classes)
+rate_limiter = RateLimiter(
+    _backend(),
+    {
+        "crud": _limit("crud", per_minute=600, burst=120),
+        "ai": _limit("ai", per_minute=20, burst=10),
+        "bulk": _limit("bulk", per_minute=2, burst=3)
+    },
+    LLM_DAILY_TOKEN_QUOTA
+)
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from python_server.gemini_service import FALLBACK_RECOMMENDATIONS, generate_study_recommendations
+from python_server.jobs import Job, QueueFull, jobs, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from python_server.metrics import metrics
+
+# Materialized study recommendations per user.
+#
+# Generated recommendations are stored together with a fingerprint of the
+# inputs they were generated from. Reads are served from the store
+# straight away; when the inputs have changed since, the stored version is
+# still served (stale-while-revalidate) and a single background job
+# regenerates it. Reads never wait for Gemini: until the first generation
+# for a user lands, the fallback recommendations are served as pending.
+
+# Fallback content stored after a failed generation is retried after this
+RECOMMENDATIONS_RETRY_SECONDS = float(os.getenv("RECOMMENDATIONS_RETRY_SECONDS", "60"))
+
+FRESH = "fresh"
+STALE = "stale"
+PENDING = "pending"
+
+Inputs = Tuple[List[str], List[str], List[str]]
+
+class Materialized:
+    def __init__(self, recommendations: List[Dict[str, Any]], fingerprint: str):
+        self.recommendations = recommendations
+        self.fingerprint = fingerprint
+        self.generated_at = time.time()
+        self.fallback = recommendations == FALLBACK_RECOMMENDATIONS
+
+    def expired(self) -> bool:
+        return self.fallback and time.time() - self.generated_at >= RECOMMENDATIONS_RETRY_SECONDS
+
+def fingerprint(inputs: Inputs) -> str:
+    return hashlib.sha1(json.dumps(inputs).encode("utf-8")).hexdigest()
+
+class RecommendationStore:
+    def __init__(self):
+        self.entries: Dict[int, Materialized] = {}
+        self.refreshing: Dict[int, Tuple[str, Job]] = {}
+        self.lock = threading.Lock()
+
+    # Return the recommendations to serve, when they were generated and
+    # whether they match the current inputs. With `regenerate` off (the
+    # user's LLM quota is used up) whatever is stored is served as is
+    def read(self, user_id: int, inputs: Inputs, regenerate: bool = True) -> Tuple[List[Dict[str, Any]], Optional[float], str]:
+        key = fingerprint(inputs)
+        with self.lock:
+            entry = self.entries.get(user_id)
+
+        if entry is not None and entry.fingerprint == key and not entry.expired():
+            metrics.incr("recommendations.fresh_hits")
+            return entry.recommendations, entry.generated_at, FRESH
+
+        if not regenerate:
+            metrics.incr("recommendations.refresh_skipped")
+        if entry is not None:
+            metrics.incr("recommendations.stale_hits")
+            if regenerate:
+                self.refresh(user_id, inputs, PRIORITY_BACKGROUND)
+            return entry.recommendations, entry.generated_at, STALE
+
+        # Nothing stored yet: start the first generation ahead of background
+        # refreshes and serve the fallback until it is stored
+        metrics.incr("recommendations.misses")
+        if regenerate:
+            self.refresh(user_id, inputs, PRIORITY_INTERACTIVE)
+        return FALLBACK_RECOMMENDATIONS, None, PENDING
+
+    # Start regenerating a user's recommendations unless a job for the same
+    # inputs is already queued or running. A job whose inputs were replaced
+    # by a newer refresh while it ran does not store its result
+    def refresh(self, user_id: int, inputs: Inputs, priority: int = PRIORITY_BACKGROUND) -> Optional[Job]:
+        key = fingerprint(inputs)
+        with self.lock:
+            current = self.refreshing.get(user_id)
+            if current is not None and current[0] == key and not current[1].finished:
+                return current[1]
+
+            async def regenerate():
+                recommendations = await generate_study_recommendations(*inputs)
+                with self.lock:
+                    if self.refreshing.get(user_id, (None, None))[0] == key:
+                        self.entries[user_id] = Materialized(recommendations, key)
+                        del self.refreshing[user_id]
+                    else:
+                        metrics.incr("recommendations.superseded")
+                return recommendations
+
+            try:
+                job = jobs.submit("recommendations", regenerate, priority=priority)
+            except QueueFull:
+                metrics.incr("recommendations.refresh_rejected")
+                return None
+            self.refreshing[user_id] = (key, job)
+        metrics.incr("recommendations.refreshes")
+        return job
+
+# Shared instance used by the app
+recommendation_store = RecommendationStore()
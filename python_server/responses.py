@@ -0,0 +1,186 @@
+import gzip
+import json
+import os
+import zlib
+from typing import Any, Iterator, List, Optional
+
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+
+from python_server.metrics import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response pipeline for /api/*.
+#
+# JSON is encoded with orjson when it is installed and the stdlib otherwise;
+# the JSON is equivalent either way (sorted keys, Flask's date handling). Bodies
+# above API_COMPRESS_MIN_BYTES are compressed with the best encoding the
+# client accepts. Top-level lists longer than API_STREAM_MIN_ITEMS are not
+# built as one string at all: items are encoded and compressed a batch at a
+# time and streamed, so a large flashcard list never exists in memory as a
+# whole uncompressed body.
+#
+# A streamed body is produced after the after_request hooks have run, so
+# those hooks only see a response without a body: it is not compressed
+# again, has no Content-Length and cannot be kept for replay. A request
+# whose response must be kept (one owning an Idempotency-Key) sets
+# `g.buffer_response`, and its list is encoded as one buffered body instead.
+
+API_COMPRESS_MIN_BYTES = int(os.getenv("API_COMPRESS_MIN_BYTES", "1024"))
+# gzip -4 is a third of the CPU of -6 for a few percent more bytes
+API_COMPRESS_LEVEL = int(os.getenv("API_COMPRESS_LEVEL", "4"))
+API_STREAM_MIN_ITEMS = int(os.getenv("API_STREAM_MIN_ITEMS", "500"))
+STREAM_BATCH_ITEMS = 64
+
+# Brotli at a low quality is about as fast as gzip -4 and smaller
+BROTLI_QUALITY = 4
+
+# Encodings a client accepts (q > 0), in header order
+def accepted_encodings(header: str) -> List[str]:
+    accepted = []
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            accepted.append(name.strip().lower())
+    if "*" in accepted:
+        accepted.extend(("br", "gzip"))
+    return accepted
+
+# Dynamic responses use brotli only when the module is installed
+def choose_encoding(header: str) -> Optional[str]:
+    accepted = accepted_encodings(header)
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=API_COMPRESS_LEVEL, mtime=0)
+
+# Incremental compressor for streamed bodies; no encoding passes data through
+class StreamCompressor:
+    def __init__(self, encoding: Optional[str]):
+        self.encoding = encoding
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == "gzip":
+            # wbits 31 writes a gzip header and trailer
+            self.compressor = zlib.compressobj(API_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        else:
+            self.compressor = None
+
+    def process(self, data: bytes) -> bytes:
+        if self.compressor is None:
+            return data
+        if self.encoding == "br":
+            return self.compressor.process(data)
+        return self.compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.compressor is None:
+            return b""
+        if self.encoding == "br":
+            return self.compressor.finish()
+        return self.compressor.flush()
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Dates are passed through to Flask's default hook, as are types orjson
+    # does not know, so output matches the stdlib path
+    def _orjson_options(self) -> int:
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_options())
+            except TypeError:
+                # e.g. integers beyond 64 bits; the stdlib copes
+                pass
+        return json.dumps(
+            obj,
+            default=self.default,
+            ensure_ascii=self.ensure_ascii,
+            sort_keys=self.sort_keys,
+            separators=(",", ":")
+        ).encode("utf-8")
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs or orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if kwargs or orjson is None:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, list) and len(obj) >= API_STREAM_MIN_ITEMS and not g.get("buffer_response"):
+            encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+            response = self._app.response_class(
+                self._stream_list(obj, encoding),
+                mimetype=self.mimetype
+            )
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+            metrics.incr("responses.streamed")
+            return response
+        return self._app.response_class(self.dumps_bytes(obj) + b"\n", mimetype=self.mimetype)
+
+    def _stream_list(self, items: list, encoding: Optional[str]) -> Iterator[bytes]:
+        compressor = StreamCompressor(encoding)
+        separator = b"["
+        for start in range(0, len(items), STREAM_BATCH_ITEMS):
+            batch = b",".join(self.dumps_bytes(item) for item in items[start:start + STREAM_BATCH_ITEMS])
+            chunk = compressor.process(separator + batch)
+            separator = b","
+            if chunk:
+                yield chunk
+        yield compressor.process(b"[]\n" if separator == b"[" else b"]\n") + compressor.finish()
+
+# after_request hook: compress buffered /api responses that are worth it
+def compress_response(response: Response) -> Response:
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    body = response.get_data()
+    if len(body) < API_COMPRESS_MIN_BYTES:
+        return response
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return response
+    compressed = compress(body, encoding)
+    metrics.observe("responses.compression_ratio", len(compressed) / len(body))
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
@@ -0,0 +1,186 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from python_server.chunking import split_notes
+from python_server.metrics import metrics
+from python_server.storage import MemStorage, storage
+from python_server.tokens import estimate_tokens
+
+# Local BM25 retrieval over each user's notes.
+#
+# Notes are split into small chunks and kept in a per-user inverted index
+# that follows storage's mutation hooks, so edits only re-index the note
+# that changed. Generation routes ask for the chunks most relevant to a
+# topic and send only those, up to a token budget, instead of whole notes.
+# Everything is computed in process; no embedding service is involved.
+
+RETRIEVAL_CHUNK_TOKENS = int(os.getenv("RETRIEVAL_CHUNK_TOKENS", "250"))
+RETRIEVAL_MAX_TOKENS = int(os.getenv("RETRIEVAL_MAX_TOKENS", "3000"))
+# Pasted notes shorter than this are sent whole
+RETRIEVAL_MIN_TOKENS = int(os.getenv("RETRIEVAL_MIN_TOKENS", "4000"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+what which who how why when where do does did not no can into than then there these those their
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in _WORD.findall(text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+class Chunk:
+    def __init__(self, note_id: int, position: int, title: str, text: str, terms: Counter):
+        self.note_id = note_id
+        self.position = position
+        self.title = title
+        self.text = text
+        self.terms = terms
+        self.length = sum(terms.values())
+
+# Inverted index over one collection of chunks
+class BM25Index:
+    def __init__(self):
+        self.chunks: Dict[int, Chunk] = {}
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.total_length = 0
+        self.next_id = 1
+
+    def add(self, chunk: Chunk) -> int:
+        chunk_id = self.next_id
+        self.next_id += 1
+        self.chunks[chunk_id] = chunk
+        self.total_length += chunk.length
+        for term, count in chunk.terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        return chunk_id
+
+    def remove(self, chunk_id: int) -> None:
+        chunk = self.chunks.pop(chunk_id, None)
+        if chunk is None:
+            return
+        self.total_length -= chunk.length
+        for term in chunk.terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(chunk_id, None)
+                if not posting:
+                    del self.postings[term]
+
+    def search(self, query: str) -> List[Tuple[float, int]]:
+        terms = set(tokenize(query))
+        if not terms or not self.chunks:
+            return []
+        n = len(self.chunks)
+        average_length = self.total_length / n or 1
+        scores: Dict[int, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                length = self.chunks[chunk_id].length
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (BM25_K1 + 1) / (
+                    tf + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+                )
+        return sorted(((score, chunk_id) for chunk_id, score in scores.items()), reverse=True)
+
+    # Best chunks for a query within a token budget, in document order
+    def select(self, query: str, max_tokens: int) -> List[Chunk]:
+        selected: List[Chunk] = []
+        used = 0
+        for _, chunk_id in self.search(query):
+            chunk = self.chunks[chunk_id]
+            cost = estimate_tokens(chunk.text)
+            if used + cost > max_tokens:
+                continue
+            selected.append(chunk)
+            used += cost
+        return sorted(selected, key=lambda chunk: (chunk.note_id, chunk.position))
+
+def _chunks_for(note_id: int, title: str, subject: str, text: str) -> List[Chunk]:
+    # Title and subject are indexed with every chunk so they count as context
+    header = f"{title} {subject}"
+    return [
+        Chunk(note_id, position, title, piece, Counter(tokenize(f"{header} {piece}")))
+        for position, piece in enumerate(split_notes(text, RETRIEVAL_CHUNK_TOKENS))
+        if piece.strip()
+    ]
+
+def _render(chunks: List[Chunk]) -> str:
+    parts: List[str] = []
+    current_note = None
+    for chunk in chunks:
+        if chunk.note_id != current_note and chunk.title:
+            parts.append(f"# {chunk.title}")
+        current_note = chunk.note_id
+        parts.append(chunk.text)
+    return "\n\n".join(parts)
+
+class NoteIndex:
+    def __init__(self):
+        self.indexes: Dict[int, BM25Index] = {}
+        # Note id -> (user id, chunk ids)
+        self.notes: Dict[int, Tuple[int, List[int]]] = {}
+        self.lock = threading.Lock()
+
+    # Index the notes storage already holds, then follow its mutations
+    def attach(self, source: MemStorage) -> None:
+        for note in list(source.notes.values()):
+            self.on_mutation("note", None, note)
+        source.subscribe(self.on_mutation)
+
+    def on_mutation(self, entity: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        if entity != "note":
+            return
+        note_id = (after or before)["id"]
+        chunks = _chunks_for(note_id, after.get("title") or "", after.get("subject") or "", after.get("content") or "") if after else []
+        with self.lock:
+            previous = self.notes.pop(note_id, None)
+            if previous is not None:
+                index = self.indexes.get(previous[0])
+                for chunk_id in previous[1]:
+                    index.remove(chunk_id)
+            if after is not None:
+                index = self.indexes.setdefault(after["userId"], BM25Index())
+                self.notes[note_id] = (after["userId"], [index.add(chunk) for chunk in chunks])
+
+    # Relevant excerpts from a user's stored notes, or None if nothing matches
+    def context(self, user_id: int, query: str, max_tokens: int = RETRIEVAL_MAX_TOKENS) -> Optional[str]:
+        with self.lock:
+            index = self.indexes.get(user_id)
+            selected = index.select(query, max_tokens) if index is not None else []
+        metrics.incr("retrieval.library_queries")
+        if not selected:
+            return None
+        context = _render(selected)
+        metrics.observe("retrieval.context_tokens", estimate_tokens(context))
+        return context
+
+# Trim pasted notes to the parts relevant to a query; short notes are
+# returned unchanged
+def select_relevant(notes: str, query: str, max_tokens: int = RETRIEVAL_MAX_TOKENS) -> str:
+    source_tokens = estimate_tokens(notes)
+    if source_tokens <= RETRIEVAL_MIN_TOKENS:
+        return notes
+    index = BM25Index()
+    for chunk in _chunks_for(0, "", "", notes):
+        index.add(chunk)
+    selected = index.select(query, max_tokens)
+    if not selected:
+        return notes
+    context = _render(selected)
+    metrics.incr("retrieval.trimmed_requests")
+    metrics.observe("retrieval.saved_tokens", source_tokens - estimate_tokens(context))
+    return context
+
+# Shared instance following the shared storage
+note_index = NoteIndex()
+note_index.attach(storage)
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from python_server.responses import accepted_encodings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# In-memory table of the built client.
+#
+# client/dist is scanned once at startup. Every file is read into memory
+# with its content type, a content-hash ETag and, for compressible types,
+# precompressed gzip (and brotli, when the module is installed) variants
+# that are kept only if they are actually smaller. Requests are answered
+# from the table without touching the filesystem:
+#   - the best variant the client's Accept-Encoding allows is sent
+#   - a matching If-None-Match gets a 304
+#   - fingerprinted build output (assets/name-<hash>.js) is cached as
+#     immutable; everything else, index.html included, is revalidated
+# Paths not in the table are client-side routes and get index.html.
+
+STATIC_ROOT = os.getenv("STATIC_ROOT", os.path.join(os.path.dirname(os.path.dirname(__file__)), "client", "dist"))
+STATIC_MIN_COMPRESS_BYTES = int(os.getenv("STATIC_MIN_COMPRESS_BYTES", "1024"))
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+    "font/ttf",
+    "font/otf"
+)
+
+# Vite names bundles name-<8 character hash>.ext under assets/
+_FINGERPRINT = re.compile(r"(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+
+class Asset:
+    def __init__(self, path: str, body: bytes):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self.cache_control = IMMUTABLE_CACHE if _FINGERPRINT.search(path) else REVALIDATE_CACHE
+        # Encoding -> body, best first
+        self.variants: Dict[str, bytes] = {}
+        if len(body) >= STATIC_MIN_COMPRESS_BYTES and self.content_type.startswith(COMPRESSIBLE_TYPES):
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.variants["br"] = compressed
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.variants["gzip"] = compressed
+        self.variants["identity"] = body
+
+    # Body and Content-Encoding (None for identity) for an Accept-Encoding
+    def negotiate(self, accept_encoding: str) -> Tuple[bytes, Optional[str]]:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding, body in self.variants.items():
+            if encoding == "identity" or encoding in accepted:
+                return body, (None if encoding == "identity" else encoding)
+        return self.variants["identity"], None
+
+    # Each encoding is its own representation, so it gets its own ETag
+    def etag_for(self, encoding: Optional[str]) -> str:
+        return f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag.strip('"').split("-")[0] == self.etag:
+                return True
+        return False
+
+class StaticAssets:
+    def __init__(self, root: str = STATIC_ROOT):
+        self.root = root
+        self.assets: Dict[str, Asset] = {}
+        self.load()
+
+    # Read the build into memory; a missing build leaves the table empty
+    def load(self) -> None:
+        assets: Dict[str, Asset] = {}
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                full_path = os.path.join(directory, name)
+                path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                try:
+                    with open(full_path, "rb") as file:
+                        assets[path] = Asset(path, file.read())
+                except OSError as e:
+                    print(f"Error loading static asset {path}: {e}")
+        self.assets = assets
+        compressed = sum(1 for asset in assets.values() if len(asset.variants) > 1)
+        print(f"Loaded {len(assets)} static assets ({compressed} precompressed) from {self.root}")
+
+    # Asset for a request path; unknown paths are client routes, except
+    # under assets/ where a miss would hand HTML to a script tag
+    def lookup(self, path: str) -> Optional[Asset]:
+        path = path.strip("/")
+        asset = self.assets.get(path)
+        if asset is None and not path.startswith("assets/"):
+            asset = self.assets.get("index.html")
+        return asset
+
+# Shared table of the client build
+static_assets = StaticAssets()
@@ -1,6 +1,9 @@
+import os
 from datetime import datetime
 from copy import deepcopy
-from typing import Dict, List, Optional, Any, TypedDict, Union
+from typing import Callable, Dict, Iterator, List, NotRequired, Optional, Any, Tuple, TypedDict, Union
+
+from python_server.decks import DeckLibrary, ProgressOverlay, is_shared_id
 
 # Type definitions
 class User(TypedDict):
@@ -29,6 +32,8 @@ class Task(TypedDict):
     priority: int  # 1 = high, 2 = medium, 3 = low
     completed: bool
     category: Optional[str]
+    # Planner effort estimate
+    estimatedMinutes: NotRequired[Optional[int]]
 
 class InsertTask(TypedDict):
     userId: int
@@ -38,6 +43,8 @@ class InsertTask(TypedDict):
     priority: int
     completed: bool
     category: Optional[str]
+    # Planner effort estimate
+    estimatedMinutes: NotRequired[Optional[int]]
 
 class StudySession(TypedDict):
     id: int
@@ -48,6 +55,8 @@ class StudySession(TypedDict):
     subject: Optional[str]
     description: Optional[str]
     location: Optional[str]
+    # Set on sessions booked from a study plan
+    taskId: NotRequired[Optional[int]]
 
 class InsertStudySession(TypedDict):
     userId: int
@@ -57,6 +66,8 @@ class InsertStudySession(TypedDict):
     subject: Optional[str]
     description: Optional[str]
     location: Optional[str]
+    # Set on sessions booked from a study plan
+    taskId: NotRequired[Optional[int]]
 
 class Note(TypedDict):
     id: int
@@ -121,8 +132,15 @@ class InsertStudyProgress(TypedDict):
     subject: Optional[str]
     notes: Optional[str]
 
+# Mutation hooks receive (entity, before, after); before is None for a
+# create and after is None for a delete
+MutationListener = Callable[[str, Optional[Dict[str, Any]], Optional[Dict[str, Any]]], None]
+
 # Interface for storage operations
 class IStorage:
+    # Mutation hooks
+    def subscribe(self, listener: MutationListener) -> None: pass
+    
     # User operations
     def get_user(self, id: int) -> Optional[User]: pass
     def get_user_by_username(self, username: str) -> Optional[User]: pass
@@ -157,15 +175,33 @@ class IStorage:
     def delete_flashcard_set(self, id: int) -> bool: pass
     
     # Flashcard operations
-    def get_flashcards(self, set_id: int) -> List[Flashcard]: pass
-    def get_flashcard_by_id(self, id: int) -> Optional[Flashcard]: pass
+    def get_flashcards(self, set_id: int, user_id: Optional[int] = None) -> List[Flashcard]: pass
+    def get_flashcard_by_id(self, id: int, user_id: Optional[int] = None) -> Optional[Flashcard]: pass
     def create_flashcard(self, flashcard: InsertFlashcard) -> Flashcard: pass
-    def update_flashcard(self, id: int, flashcard: Dict[str, Any]) -> Optional[Flashcard]: pass
+    def update_flashcard(self, id: int, flashcard: Dict[str, Any], user_id: Optional[int] = None) -> Optional[Flashcard]: pass
     def delete_flashcard(self, id: int) -> bool: pass
     
+    # Shared deck operations
+    def get_shared_flashcard_sets(self) -> List[FlashcardSet]: pass
+    
     # Study progress operations
     def get_study_progress(self, user_id: int) -> List[StudyProgress]: pass
     def create_study_progress(self, progress: InsertStudyProgress) -> StudyProgress: pass
+    
+    # Bulk operations
+    def iter_user_records(self, user_id: int) -> Iterator[Tuple[str, Dict[str, Any]]]: pass
+    def create_many(self, entity: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]: pass
+
+# Entity name -> (table attribute, id counter attribute), in the order a
+# user's data is exported: sets come before the cards that reference them
+ENTITY_TABLES = {
+    "task": ("tasks", "task_id_counter"),
+    "study_session": ("study_sessions", "session_id_counter"),
+    "note": ("notes", "note_id_counter"),
+    "flashcard_set": ("flashcard_sets", "set_id_counter"),
+    "flashcard": ("flashcards", "flashcard_id_counter"),
+    "study_progress": ("study_progress", "progress_id_counter")
+}
 
 class MemStorage(IStorage):
     def __init__(self):
@@ -186,6 +222,12 @@ class MemStorage(IStorage):
         self.flashcard_id_counter = 1
         self.progress_id_counter = 1
         
+        self.listeners: List[MutationListener] = []
+        
+        # Read-only shared decks, memory-mapped, and users' progress on them
+        self.shared_decks = DeckLibrary()
+        self.deck_progress = ProgressOverlay()
+        
         # Add a default user
         self.create_user({
             "username": "alexjohnson",
@@ -196,6 +238,17 @@ class MemStorage(IStorage):
             "avatarUrl": ""
         })
 
+    # Register a hook called after every create, update and delete
+    def subscribe(self, listener: MutationListener) -> None:
+        self.listeners.append(listener)
+
+    def _emit(self, entity: str, before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> None:
+        for listener in self.listeners:
+            try:
+                listener(entity, before, after)
+            except Exception as e:
+                print(f"Error in storage listener for {entity}:", str(e))
+
     # User operations
     def get_user(self, id: int) -> Optional[User]:
         return self.users.get(id)
@@ -225,6 +278,7 @@ class MemStorage(IStorage):
         self.task_id_counter += 1
         new_task: Task = {**task, "id": id}
         self.tasks[id] = new_task
+        self._emit("task", None, new_task)
         return new_task
 
     def update_task(self, id: int, task_update: Dict[str, Any]) -> Optional[Task]:
@@ -234,11 +288,13 @@ class MemStorage(IStorage):
         
         updated_task = {**task, **task_update}
         self.tasks[id] = updated_task
+        self._emit("task", task, updated_task)
         return updated_task
 
     def delete_task(self, id: int) -> bool:
         if id in self.tasks:
-            del self.tasks[id]
+            removed = self.tasks.pop(id)
+            self._emit("task", removed, None)
             return True
         return False
 
@@ -254,6 +310,7 @@ class MemStorage(IStorage):
         self.session_id_counter += 1
         new_session: StudySession = {**session, "id": id}
         self.study_sessions[id] = new_session
+        self._emit("study_session", None, new_session)
         return new_session
 
     def update_study_session(self, id: int, session_update: Dict[str, Any]) -> Optional[StudySession]:
@@ -263,11 +320,13 @@ class MemStorage(IStorage):
         
         updated_session = {**session, **session_update}
         self.study_sessions[id] = updated_session
+        self._emit("study_session", session, updated_session)
         return updated_session
 
     def delete_study_session(self, id: int) -> bool:
         if id in self.study_sessions:
-            del self.study_sessions[id]
+            removed = self.study_sessions.pop(id)
+            self._emit("study_session", removed, None)
             return True
         return False
 
@@ -289,6 +348,7 @@ class MemStorage(IStorage):
             "updatedAt": now
         }
         self.notes[id] = new_note
+        self._emit("note", None, new_note)
         return new_note
 
     def update_note(self, id: int, note_update: Dict[str, Any]) -> Optional[Note]:
@@ -302,11 +362,13 @@ class MemStorage(IStorage):
             "updatedAt": datetime.now().isoformat()
         }
         self.notes[id] = updated_note
+        self._emit("note", note, updated_note)
         return updated_note
 
     def delete_note(self, id: int) -> bool:
         if id in self.notes:
-            del self.notes[id]
+            removed = self.notes.pop(id)
+            self._emit("note", removed, None)
             return True
         return False
 
@@ -315,6 +377,8 @@ class MemStorage(IStorage):
         return [set for set in self.flashcard_sets.values() if set["userId"] == user_id]
 
     def get_flashcard_set_by_id(self, id: int) -> Optional[FlashcardSet]:
+        if is_shared_id(id):
+            return self.shared_decks.get_set(id)
         return self.flashcard_sets.get(id)
 
     def create_flashcard_set(self, set: InsertFlashcardSet) -> FlashcardSet:
@@ -327,6 +391,7 @@ class MemStorage(IStorage):
             "createdAt": now
         }
         self.flashcard_sets[id] = new_set
+        self._emit("flashcard_set", None, new_set)
         return new_set
 
     def update_flashcard_set(self, id: int, set_update: Dict[str, Any]) -> Optional[FlashcardSet]:
@@ -336,24 +401,33 @@ class MemStorage(IStorage):
         
         updated_set = {**set_data, **set_update}
         self.flashcard_sets[id] = updated_set
+        self._emit("flashcard_set", set_data, updated_set)
         return updated_set
 
     def delete_flashcard_set(self, id: int) -> bool:
         # Also delete all flashcards belonging to this set
         flashcards_to_delete = [card_id for card_id, card in self.flashcards.items() if card["setId"] == id]
         for card_id in flashcards_to_delete:
-            del self.flashcards[card_id]
+            removed_card = self.flashcards.pop(card_id)
+            self._emit("flashcard", removed_card, None)
         
         if id in self.flashcard_sets:
-            del self.flashcard_sets[id]
+            removed = self.flashcard_sets.pop(id)
+            self._emit("flashcard_set", removed, None)
             return True
         return False
 
     # Flashcard operations
-    def get_flashcards(self, set_id: int) -> List[Flashcard]:
+    # Shared cards come back with user_id's progress applied
+    def get_flashcards(self, set_id: int, user_id: Optional[int] = None) -> List[Flashcard]:
+        if is_shared_id(set_id):
+            return [self.deck_progress.apply(user_id, card) for card in self.shared_decks.get_cards(set_id)]
         return [card for card in self.flashcards.values() if card["setId"] == set_id]
 
-    def get_flashcard_by_id(self, id: int) -> Optional[Flashcard]:
+    def get_flashcard_by_id(self, id: int, user_id: Optional[int] = None) -> Optional[Flashcard]:
+        if is_shared_id(id):
+            card = self.shared_decks.get_card(id)
+            return self.deck_progress.apply(user_id, card) if card else None
         return self.flashcards.get(id)
 
     def create_flashcard(self, flashcard: InsertFlashcard) -> Flashcard:
@@ -361,23 +435,47 @@ class MemStorage(IStorage):
         self.flashcard_id_counter += 1
         new_card: Flashcard = {**flashcard, "id": id}
         self.flashcards[id] = new_card
+        self._emit("flashcard", None, new_card)
         return new_card
 
-    def update_flashcard(self, id: int, card_update: Dict[str, Any]) -> Optional[Flashcard]:
+    def update_flashcard(self, id: int, card_update: Dict[str, Any], user_id: Optional[int] = None) -> Optional[Flashcard]:
+        if is_shared_id(id):
+            return self._update_shared_flashcard(id, card_update, user_id)
         card = self.flashcards.get(id)
         if not card:
             return None
         
         updated_card = {**card, **card_update}
         self.flashcards[id] = updated_card
+        self._emit("flashcard", card, updated_card)
         return updated_card
 
     def delete_flashcard(self, id: int) -> bool:
         if id in self.flashcards:
-            del self.flashcards[id]
+            removed = self.flashcards.pop(id)
+            self._emit("flashcard", removed, None)
             return True
         return False
 
+    # Only review fields of a shared card change, and only for one user.
+    # Listeners hear about it as a "deck_progress" mutation, since the
+    # card itself is untouched
+    def _update_shared_flashcard(self, id: int, card_update: Dict[str, Any], user_id: Optional[int]) -> Optional[Flashcard]:
+        card = self.shared_decks.get_card(id)
+        if card is None or user_id is None:
+            return None
+        previous, entry = self.deck_progress.update(user_id, id, card_update)
+        self._emit(
+            "deck_progress",
+            {**previous, "userId": user_id, "cardId": id} if previous is not None else None,
+            {**entry, "userId": user_id, "cardId": id}
+        )
+        return {**card, **entry}
+
+    # Shared deck operations
+    def get_shared_flashcard_sets(self) -> List[FlashcardSet]:
+        return self.shared_decks.get_sets()
+
     # Study progress operations
     def get_study_progress(self, user_id: int) -> List[StudyProgress]:
         return [progress for progress in self.study_progress.values() if progress["userId"] == user_id]
@@ -387,8 +485,47 @@ class MemStorage(IStorage):
         self.progress_id_counter += 1
         new_progress: StudyProgress = {**progress, "id": id}
         self.study_progress[id] = new_progress
+        self._emit("study_progress", None, new_progress)
         return new_progress
 
+    # Bulk operations
+    # Every record a user owns as (entity, record), one table at a time.
+    # Each table is snapshotted as a list of references, so writes during a
+    # long export cannot break the iteration and no record is copied
+    def iter_user_records(self, user_id: int) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        set_ids = set()
+        for entity, (table, _) in ENTITY_TABLES.items():
+            for record in list(getattr(self, table).values()):
+                if entity == "flashcard":
+                    if record["setId"] in set_ids:
+                        yield entity, record
+                elif record["userId"] == user_id:
+                    if entity == "flashcard_set":
+                        set_ids.add(record["id"])
+                    yield entity, record
+
+    # Insert records of one entity under fresh ids. Timestamps the records
+    # carry are kept, so imported data keeps its history
+    def create_many(self, entity: str, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        table_name, counter = ENTITY_TABLES[entity]
+        table = getattr(self, table_name)
+        now = datetime.now().isoformat()
+        created = []
+        for record in records:
+            id = getattr(self, counter)
+            setattr(self, counter, id + 1)
+            new_record = {**record, "id": id}
+            if entity == "note":
+                new_record.setdefault("createdAt", now)
+                new_record.setdefault("updatedAt", now)
+            elif entity == "flashcard_set":
+                new_record.setdefault("createdAt", now)
+            table[id] = new_record
+            created.append(new_record)
+        for new_record in created:
+            self._emit(entity, None, new_record)
+        return created
+
 # Create and export a shared instance of the storage
 storage = MemStorage()
 
@@ -524,5 +661,7 @@ def initialize_storage():
             "notes": f"Study session on day {i+1}"
         })
 
-# Initialize the storage with sample data
-initialize_storage()
\ No newline at end of file
+# Sample data is opt-in (SEED_DEMO_DATA=1), keeping it off the cold start
+# of deployments that do not want it
+if os.getenv("SEED_DEMO_DATA", "").lower() in ("1", "true", "yes"):
+    initialize_storage()
\ No newline at end of file
@@ -0,0 +1,225 @@
+import json
+import re
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from python_server.metrics import metrics
+
+# Structured-output recovery for model responses.
+#
+# Model text is scanned once, left to right, for balanced JSON values while
+# tracking strings and escapes, so braces inside prose or inside string
+# values never confuse the span boundaries. Each candidate span is parsed
+# as-is, then with common LLM mistakes repaired (code fences, trailing
+# commas, truncated output), and finally checked against an optional
+# OpenAPI-style schema - the same dicts Gemini accepts as response_schema.
+
+class StructuredOutputError(ValueError):
+    pass
+
+class SchemaError(ValueError):
+    pass
+
+# Markdown code fences such as ```json ... ```
+CODE_FENCE = re.compile(r"```[A-Za-z]*")
+
+# Characters that can change the scanner's state
+STRUCTURAL = re.compile(r'[\\"{}\[\],]')
+
+# Characters that may follow an opening bracket in real JSON
+OBJECT_FOLLOWERS = set('"}')
+ARRAY_FOLLOWERS = set('"{[]-0123456789tfn')
+WHITESPACE = set(" \t\r\n")
+
+# How many truncation cut points to remember per candidate
+MAX_CUT_POINTS = 3
+
+CLOSERS = {"{": "}", "[": "]"}
+
+def strip_code_fences(text: str) -> str:
+    return CODE_FENCE.sub(" ", text)
+
+# Remove commas that directly precede a closing bracket, outside strings
+def remove_trailing_commas(text: str) -> str:
+    out: List[str] = []
+    in_string = False
+    escape = False
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            j = i + 1
+            while j < length and text[j] in WHITESPACE:
+                j += 1
+            if j < length and text[j] in "}]":
+                out.append(text[i + 1:j])
+                i = j
+                continue
+        out.append(char)
+        i += 1
+    return "".join(out)
+
+# Peek past whitespace to decide whether a bracket can start a JSON value
+def _plausible_start(text: str, pos: int) -> bool:
+    followers = OBJECT_FOLLOWERS if text[pos] == "{" else ARRAY_FOLLOWERS
+    i = pos + 1
+    while i < len(text) and text[i] in WHITESPACE:
+        i += 1
+    return i >= len(text) or text[i] in followers
+
+# Single pass over the text yielding candidate JSON strings in order. Complete
+# balanced spans are yielded as found; a span cut off by the end of the text
+# is yielded closed at its last few safe cut points (latest first). Only
+# structural characters are visited; the regex skips everything else.
+def scan_json_candidates(text: str) -> Iterator[str]:
+    stack: List[str] = []
+    start = 0
+    in_string = False
+    escaped_pos = -1
+    cuts: Deque[Tuple[int, str]] = deque(maxlen=MAX_CUT_POINTS)
+
+    for match in STRUCTURAL.finditer(text):
+        pos = match.start()
+        char = text[pos]
+
+        if not stack:
+            if char in "{[" and _plausible_start(text, pos):
+                stack.append(char)
+                start = pos
+                in_string = False
+                cuts.clear()
+            continue
+
+        if in_string:
+            if pos == escaped_pos:
+                continue
+            if char == "\\":
+                escaped_pos = pos + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+        elif char in "}]":
+            if CLOSERS[stack[-1]] != char:
+                # Mismatched bracket: this span is not JSON, resume scanning
+                stack.clear()
+                continue
+            stack.pop()
+            if not stack:
+                yield text[start:pos + 1]
+            else:
+                cuts.append((pos + 1, _closing(stack)))
+        elif char == ",":
+            cuts.append((pos, _closing(stack)))
+
+    if stack:
+        for cut, closing in reversed(cuts):
+            yield text[start:cut] + closing
+
+def _closing(stack: List[str]) -> str:
+    return "".join(CLOSERS[opened] for opened in reversed(stack))
+
+# Check a decoded value against a schema, dropping array items that do not
+# match rather than rejecting the whole response. Dropped items are counted
+# in structured_output.dropped_items and logged once per call
+def validate(value: Any, schema: Dict[str, Any], path: str = "$") -> Any:
+    dropped: List[str] = []
+    value = _validate(value, schema, path, dropped)
+    if dropped:
+        metrics.incr("structured_output.dropped_items", len(dropped))
+        print(f"Dropped {len(dropped)} invalid item(s), first: {dropped[0]}")
+    return value
+
+def _validate(value: Any, schema: Dict[str, Any], path: str, dropped: List[str]) -> Any:
+    expected = schema.get("type")
+
+    if expected == "object":
+        if not isinstance(value, dict):
+            raise SchemaError(f"{path}: expected object")
+        for key in schema.get("required", []):
+            if key not in value:
+                raise SchemaError(f"{path}: missing required field '{key}'")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                value[key] = _validate(value[key], sub_schema, f"{path}.{key}", dropped)
+        return value
+
+    if expected == "array":
+        if not isinstance(value, list):
+            raise SchemaError(f"{path}: expected array")
+        item_schema = schema.get("items")
+        if not item_schema:
+            return value
+        items = []
+        for i, item in enumerate(value):
+            try:
+                items.append(_validate(item, item_schema, f"{path}[{i}]", dropped))
+            except SchemaError as e:
+                dropped.append(str(e))
+        return items
+
+    if expected == "string":
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        if not isinstance(value, str):
+            raise SchemaError(f"{path}: expected string")
+        return value
+
+    if expected in ("number", "integer"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SchemaError(f"{path}: expected {expected}")
+        return value
+
+    if expected == "boolean":
+        if not isinstance(value, bool):
+            raise SchemaError(f"{path}: expected boolean")
+        return value
+
+    return value
+
+def _decode(candidate: str, schema: Optional[Dict[str, Any]]) -> Any:
+    value = json.loads(candidate)
+    return validate(value, schema) if schema else value
+
+# Recover the first JSON value in the text that parses (after repair) and
+# matches the schema
+def extract_json(text: str, schema: Optional[Dict[str, Any]] = None) -> Any:
+    # Fast path: native JSON output needs no scanning at all
+    try:
+        return _decode(text, schema)
+    except (ValueError, SchemaError):
+        pass
+
+    # A fenced block holding nothing but JSON is the next most common shape
+    text = strip_code_fences(text)
+    try:
+        return _decode(text, schema)
+    except (ValueError, SchemaError):
+        pass
+
+    last_error: Optional[Exception] = None
+    for candidate in scan_json_candidates(text):
+        for attempt in (candidate, remove_trailing_commas(candidate)):
+            try:
+                return _decode(attempt, schema)
+            except SchemaError as e:
+                last_error = e
+                break
+            except ValueError as e:
+                last_error = e
+
+    if last_error is not None:
+        raise StructuredOutputError(f"No valid JSON found in response: {last_error}")
+    raise StructuredOutputError("No valid JSON found in response")
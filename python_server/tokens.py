@@ -0,0 +1,25 @@
+import math
+
+from python_server.metrics import metrics
+
+# Rough token estimate for Gemini prompts and responses. English prose
+# averages about four characters per token, which is close enough for
+# budgeting batches and chunks without calling the tokenizer endpoint.
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+# A 150-200 word flashcard answer plus its question, in tokens
+TOKENS_PER_FLASHCARD = 300
+
+# Record one LLM call's token usage and latency under the prompt key
+def record_usage(key: str, input_tokens: int, output_tokens: int, latency_ms: float) -> None:
+    metrics.incr("llm.calls")
+    metrics.incr("llm.input_tokens", input_tokens)
+    metrics.incr("llm.output_tokens", output_tokens)
+    metrics.observe(f"llm.{key}.input_tokens", input_tokens)
+    metrics.observe(f"llm.{key}.output_tokens", output_tokens)
+    metrics.observe(f"llm.{key}.latency_ms", latency_ms)
@@ -0,0 +1,297 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from python_server.metrics import metrics
+
+# Span-based request tracing.
+#
+# Every API request opens a trace with a root span; storage calls and
+# Gemini calls made while serving it become child spans. The current span
+# lives in a contextvar, so spans opened in jobs and batch sub-requests
+# (which run in a copy of the request's context) join the request's trace.
+#
+# Spans are recorded for every request, which costs a few microseconds;
+# whether a trace is written is decided when it ends. A trace is kept if it
+# was head-sampled (TRACE_SAMPLE_RATE, or the sampled flag of an incoming
+# W3C traceparent header), took at least TRACE_SLOW_MS, or ended in a
+# server error. Kept traces go to a queue and a background thread appends
+# them to TRACE_FILE, one OTLP/JSON ExportTraceServiceRequest per line; when
+# the queue is full traces are dropped rather than slowing requests down.
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() not in ("0", "false", "no")
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(os.path.dirname(os.path.dirname(__file__)), "traces.jsonl"))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+# Spans past this many in one trace are counted but not recorded
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))
+TRACE_EXPORT_QUEUE = int(os.getenv("TRACE_EXPORT_QUEUE", "1000"))
+
+SERVICE_NAME = "intellectra"
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+class Trace:
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List["Span"] = []
+        self.dropped_spans = 0
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def add(self, span: "Span") -> bool:
+        with self.lock:
+            if self.finished:
+                return False
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped_spans += 1
+                return False
+            self.spans.append(span)
+            return True
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def fail(self, message: str) -> None:
+        self.status = STATUS_ERROR
+        self.message = message
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+# Stand-in returned when there is no trace to record into
+class _NoopSpan:
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def fail(self, message: str) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+def _active_parent() -> Optional[Span]:
+    parent = _current_span.get()
+    if parent is None or parent.trace.finished:
+        return None
+    return parent
+
+# Start a child of the current span without making it current; for work
+# that outlives a single context, such as an async generator. Call end()
+def start_span(name: str, kind: int = KIND_INTERNAL, **attributes: Any):
+    parent = _active_parent()
+    if parent is None:
+        return NOOP_SPAN
+    span = Span(parent.trace, name, parent.span_id, kind, attributes)
+    return span if parent.trace.add(span) else NOOP_SPAN
+
+# Context manager recording a child span of the current span and making it
+# current while the block runs
+class span:
+    def __init__(self, name: str, kind: int = KIND_INTERNAL, **attributes: Any):
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.span = NOOP_SPAN
+        self.token = None
+
+    def __enter__(self):
+        self.span = start_span(self.name, self.kind, **self.attributes)
+        if isinstance(self.span, Span):
+            self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.span.fail(f"{exc_type.__name__}: {exc}")
+        self.span.end()
+        if self.token is not None:
+            _current_span.reset(self.token)
+        return False
+
+# Trace id and sampled flag from a W3C traceparent header, if valid
+def parse_traceparent(header: Optional[str]):
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        int(parts[1], 16)
+        flags = int(parts[3], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+# Open a trace for a request and make its root span current
+def start_trace(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Optional[Span]:
+    if not TRACING_ENABLED:
+        return None
+    incoming = parse_traceparent(traceparent)
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id = random.getrandbits(128).to_bytes(16, "big").hex()
+        parent_id = None
+        sampled = random.random() < TRACE_SAMPLE_RATE
+    trace = Trace(trace_id, sampled)
+    root = Span(trace, name, parent_id, KIND_SERVER, attributes)
+    trace.add(root)
+    _current_span.set(root)
+    return root
+
+# End the root span and hand the trace to the exporter if it is kept
+def finish_trace(root: Span) -> None:
+    root.end()
+    trace = root.trace
+    with trace.lock:
+        trace.finished = True
+    slow = root.duration_ms >= TRACE_SLOW_MS
+    if trace.sampled or slow or root.status == STATUS_ERROR:
+        if slow and not trace.sampled:
+            metrics.incr("tracing.retained_slow")
+        exporter.submit(trace)
+
+def _attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    encoded = {
+        "traceId": span.trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": [_attribute(key, value) for key, value in span.attributes.items()],
+        "status": {"code": span.status, "message": span.message} if span.status == STATUS_ERROR else {"code": span.status}
+    }
+    if span.parent_id:
+        encoded["parentSpanId"] = span.parent_id
+    return encoded
+
+# One trace as an OTLP/JSON ExportTraceServiceRequest
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    spans = [_otlp_span(span) for span in trace.spans]
+    if trace.dropped_spans and spans:
+        spans[0]["droppedSpansCount"] = trace.dropped_spans
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "python_server.tracing"}, "spans": spans}]
+        }]
+    }
+
+class TraceExporter:
+    def __init__(self, path: str = TRACE_FILE, max_queue: int = TRACE_EXPORT_QUEUE):
+        self.path = path
+        self.queue: "queue.Queue[Trace]" = queue.Queue(maxsize=max(1, max_queue))
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        metrics.register_gauge("tracing.queue_depth", self.queue.qsize)
+
+    def submit(self, trace: Trace) -> None:
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            metrics.incr("tracing.dropped")
+
+    # The writer thread starts with the first kept trace
+    def _ensure_thread(self) -> None:
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                lines = "".join(json.dumps(to_otlp(trace), separators=(",", ":")) + "\n" for trace in batch)
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(lines)
+                metrics.incr("tracing.exported", len(batch))
+            except Exception as e:
+                print(f"Error exporting traces: {e}")
+                metrics.incr("tracing.dropped", len(batch))
+            for _ in batch:
+                self.queue.task_done()
+
+    # Block until every queued trace is written (used by benchmarks and
+    # scripts before they read the file)
+    def flush(self, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+# Wrap the public methods of an object (the storage singleton) so each call
+# made during a traced request is recorded as a span named
+# "<prefix>.<method>". Generator methods are left alone: their work happens
+# after the call returns
+def instrument(target: Any, prefix: str, skip: tuple = ()) -> None:
+    for name, member in inspect.getmembers(type(target), inspect.isfunction):
+        if name.startswith("_") or name in skip or inspect.isgeneratorfunction(member):
+            continue
+        setattr(target, name, _traced(getattr(target, name), f"{prefix}.{name}"))
+
+def _traced(method: Callable, span_name: str) -> Callable:
+    @functools.wraps(method)
+    def traced(*args, **kwargs):
+        if _active_parent() is None:
+            return method(*args, **kwargs)
+        with span(span_name):
+            return method(*args, **kwargs)
+    return traced
+
+# Shared exporter used by the app
+exporter = TraceExporter()
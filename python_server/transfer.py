@@ -0,0 +1,161 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from python_server.metrics import metrics
+from python_server.storage import ENTITY_TABLES, MemStorage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Export and import of a user's full dataset as NDJSON.
+#
+# An export is one JSON object per line: a header line, then
+#   {"type": "task", "data": {...}}
+# for every task, study session, note, flashcard set, flashcard and study
+# progress entry the user owns. Lines are produced from a generator over
+# storage and flushed in small chunks, so memory stays flat however much
+# the user has.
+#
+# An import reads the same format line by line and inserts records in
+# batches through storage under fresh ids. Flashcards are re-pointed at the
+# ids their sets received; cards whose set is not in the file are skipped.
+
+EXPORT_FORMAT_VERSION = 1
+EXPORT_CHUNK_LINES = int(os.getenv("EXPORT_CHUNK_LINES", "500"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+IMPORT_MAX_ERRORS = 20
+
+# Fields storage assigns on insert
+OWNED_FIELDS = ("id", "userId")
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, default=str, separators=(",", ":")).encode("utf-8")
+
+def _loads(line: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+# NDJSON export of everything a user owns, in chunks of whole lines
+def export_lines(source: MemStorage, user_id: int) -> Iterator[bytes]:
+    header = {
+        "type": "meta",
+        "version": EXPORT_FORMAT_VERSION,
+        "exportedAt": datetime.now(timezone.utc).isoformat()
+    }
+    lines: List[bytes] = [_dumps(header)]
+    exported = 0
+    for entity, record in source.iter_user_records(user_id):
+        lines.append(b'{"type":"' + entity.encode() + b'","data":' + _dumps(record) + b"}")
+        exported += 1
+        if len(lines) >= EXPORT_CHUNK_LINES:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+    metrics.incr("export.records", exported)
+
+class Importer:
+    def __init__(self, target: MemStorage, user_id: int, batch_size: int = IMPORT_BATCH_SIZE):
+        self.target = target
+        self.user_id = user_id
+        self.batch_size = max(1, batch_size)
+        # Old set and task ids -> new ids
+        self.set_ids: Dict[Any, int] = {}
+        self.task_ids: Dict[Any, int] = {}
+        self.entity: Optional[str] = None
+        self.batch: List[Dict[str, Any]] = []
+        # Old ids of the records in the batch, for entities others refer to
+        self.old_ids: List[Any] = []
+        self.imported = {entity: 0 for entity in ENTITY_TABLES}
+        self.skipped = 0
+        self.errors: List[str] = []
+
+    def _skip(self, line_number: int, reason: str) -> None:
+        self.skipped += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(f"line {line_number}: {reason}")
+
+    def add(self, line_number: int, line: bytes) -> None:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            item = _loads(line)
+        except ValueError:
+            self._skip(line_number, "invalid JSON")
+            return
+        if not isinstance(item, dict):
+            self._skip(line_number, "not an object")
+            return
+        entity = item.get("type")
+        if entity == "meta":
+            version = item.get("version", EXPORT_FORMAT_VERSION)
+            if not isinstance(version, int) or version > EXPORT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version {version!r}")
+            return
+        data = item.get("data")
+        if entity not in ENTITY_TABLES or not isinstance(data, dict):
+            self._skip(line_number, f"unknown record type {entity!r}")
+            return
+
+        # Batches hold one entity, so sets and tasks are always stored
+        # before the cards and sessions that follow them
+        if entity != self.entity:
+            self.flush()
+            self.entity = entity
+
+        record = {key: value for key, value in data.items() if key not in OWNED_FIELDS}
+        if entity == "flashcard":
+            set_id = self.set_ids.get(data.get("setId"))
+            if set_id is None:
+                self._skip(line_number, f"flashcard set {data.get('setId')!r} not in the import")
+                return
+            record["setId"] = set_id
+        else:
+            record["userId"] = self.user_id
+        # A session keeps its link to a planned task only if the task was
+        # imported too
+        if entity == "study_session" and "taskId" in record:
+            task_id = self.task_ids.get(record["taskId"])
+            if task_id is None:
+                record.pop("taskId")
+            else:
+                record["taskId"] = task_id
+        if entity in ("flashcard_set", "task"):
+            self.old_ids.append(data.get("id"))
+
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.batch:
+            return
+        created = self.target.create_many(self.entity, self.batch)
+        if self.entity in ("flashcard_set", "task"):
+            ids = self.set_ids if self.entity == "flashcard_set" else self.task_ids
+            for old_id, new_record in zip(self.old_ids, created):
+                ids[old_id] = new_record["id"]
+            self.old_ids = []
+        self.imported[self.entity] += len(created)
+        self.batch = []
+
+    def summary(self) -> Dict[str, Any]:
+        return {"imported": self.imported, "skipped": self.skipped, "errors": self.errors}
+
+# Import NDJSON lines for a user; the lines may arrive incrementally from
+# the request body
+def import_lines(target: MemStorage, user_id: int, lines: Iterable[bytes]) -> Dict[str, Any]:
+    importer = Importer(target, user_id)
+    for line_number, line in enumerate(lines, start=1):
+        importer.add(line_number, line)
+    importer.flush()
+    metrics.incr("import.records", sum(importer.imported.values()))
+    return importer.summary()
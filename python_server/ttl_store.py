@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Optional, Tuple, TypeVar
+
+# Bounded key-value store whose entries expire after a fixed time to live.
+#
+# Entries are kept in insertion order, so expired ones are always at the
+# front and purging stops at the first live entry. When the store is full
+# the oldest entry is evicted.
+
+V = TypeVar("V")
+
+class TTLStore(Generic[V]):
+    def __init__(self, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.entries: "OrderedDict[str, Tuple[float, V]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _purge(self, now: float) -> None:
+        while self.entries:
+            key, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[key]
+
+    def set(self, key: str, value: V) -> None:
+        now = time.monotonic()
+        with self.lock:
+            self._purge(now)
+            self.entries.pop(key, None)
+            while len(self.entries) >= self.max_entries:
+                self.entries.popitem(last=False)
+            self.entries[key] = (now + self.ttl_seconds, value)
+
+    def get(self, key: str) -> Optional[V]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self.entries[key]
+                return None
+            return entry[1]
+
+    def pop(self, key: str) -> Optional[V]:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return entry[1] if entry and entry[0] > time.monotonic() else None
+
+    def __len__(self) -> int:
+        with self.lock:
+            self._purge(time.monotonic())
+            return len(self.entries)
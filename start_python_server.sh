@@ -5,6 +5,6 @@ echo "Stopping any processes on ports 5000 and 5001..."
 killall node 2>/dev/null || true
 pkill -f "python app.py" 2>/dev/null || true
 
-# Start the Python server
+# Start the Python server (with the demo dataset unless told otherwise)
 echo "Starting Python server..."
-python app.py
\ No newline at end of file
+SEED_DEMO_DATA=${SEED_DEMO_DATA:-1} python app.py
\ No newline at end of file